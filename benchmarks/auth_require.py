@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Measures the per-request authorization cost of @asfquart.auth.require.
+
+Compares evaluating the requirements the way require() used to on every request (re-validating
+them, then collecting errors) against the predicate compiled once at decoration time.
+
+Run with: python benchmarks/auth_require.py
+"""
+
+import timeit
+
+import asfquart
+import asfquart.auth
+from asfquart.auth import Requirements as R
+
+ITERATIONS = 200000
+
+CASES = {
+    "bare @require": ({}, {}),
+    "require(R.member)": ({"all_of": R.member}, {"isMember": True}),
+    "require({R.mfa_enabled, R.member})": ({"all_of": {R.mfa_enabled, R.member}}, {"isMember": True, "mfa": True}),
+    "require(any_of={R.member, R.chair})": ({"any_of": {R.member, R.chair}}, {"isChair": True}),
+    "require(all_of=R.mfa, any_of={R.member, R.root}), failing": (
+        {"all_of": R.mfa_enabled, "any_of": {R.member, R.root}},
+        {"mfa": True},
+    ),
+}
+
+
+def legacy_check(client_session, all_of=None, any_of=None):
+    """The per-request evaluation require() used to perform."""
+    errors_list = []
+    for requirement in asfquart.auth.requirements_to_iter(all_of):
+        passes, desc = requirement(client_session)
+        if not passes:
+            errors_list.append(desc)
+    if errors_list:
+        return "\n".join(errors_list)
+    for requirement in asfquart.auth.requirements_to_iter(any_of):
+        passes, desc = requirement(client_session)
+        if not passes:
+            errors_list.append(desc)
+        else:
+            errors_list.clear()
+            break
+    if errors_list:
+        return "\n".join(errors_list)
+    return None
+
+
+def main():
+    print(f"{'case':<60} {'legacy':>10} {'compiled':>10}")
+    for name, (requirements, session_data) in CASES.items():
+        client_session = asfquart.session.ClientSession({"uid": "foo", **session_data})
+        predicate = asfquart.auth.compile_requirements(**requirements)
+        compiled = predicate if predicate is not None else (lambda _session: None)
+        assert legacy_check(client_session, **requirements) == compiled(client_session)
+        legacy_time = timeit.timeit(lambda: legacy_check(client_session, **requirements), number=ITERATIONS)
+        compiled_time = timeit.timeit(lambda: compiled(client_session), number=ITERATIONS)
+        print(f"{name:<60} {legacy_time / ITERATIONS * 1e9:8.0f}ns {compiled_time / ITERATIONS * 1e9:8.0f}ns")
+
+
+if __name__ == "__main__":
+    main()
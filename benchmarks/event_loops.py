@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Measures the request throughput of the example app (examples/snippets/simple_app.py) served by runx() on each
+available event loop (see asfquart.eventloop): the stock asyncio loop, and uvloop if installed.
+
+Run with: PYTHONPATH=src python benchmarks/event_loops.py
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+import asfquart.eventloop
+
+PORT = 18126
+DURATION = 5  # Seconds to measure for
+CONCURRENCY = 64
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "examples", "snippets")
+RUNNER = f"""
+import sys
+import simple_app
+app = simple_app.my_app()
+app.runx(port={PORT}, debug=False, watch="none", event_loop=sys.argv[1])
+"""
+
+
+async def measure(tmpdir, event_loop):
+    proc = subprocess.Popen(
+        [sys.executable, "runner.py", event_loop], cwd=tmpdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONCURRENCY)) as session:
+            async def get():
+                async with session.get(f"http://127.0.0.1:{PORT}/") as rv:
+                    await rv.read()
+            for _ in range(100):
+                try:
+                    await get()
+                    break
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.1)
+
+            done = 0
+            deadline = time.monotonic() + DURATION
+            async def client():
+                nonlocal done
+                while time.monotonic() < deadline:
+                    await get()
+                    done += 1
+            await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+        print(f"  {event_loop:8s} {done / DURATION:8.0f} requests/s")
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmpdir:  # Also keeps the apptoken.txt of the example app
+        with open(os.path.join(tmpdir, "runner.py"), "w", encoding="utf-8") as f:
+            f.write(RUNNER)
+        paths = (os.path.abspath("src"), os.path.abspath(EXAMPLES), os.environ.get("PYTHONPATH"))
+        os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, paths))
+        print(f"GET / of the example app, {CONCURRENCY} concurrent clients:")
+        await measure(tmpdir, "asyncio")
+        if asfquart.eventloop.UVLOOP_SUPPORTED:
+            await measure(tmpdir, "uvloop")
+        else:
+            print("  uvloop is not installed (pip install asfquart[uvloop])")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Compares decoding a JSON request with utils.formdata() and hand-written validation, as endpoints
+do today, against a compiled @asfquart.utils.expects() schema.
+
+Run with: python benchmarks/expects.py
+"""
+
+import asyncio
+import json
+import time
+import timeit
+
+import werkzeug.datastructures
+
+import asfquart
+import asfquart.auth
+import asfquart.utils
+
+ITERATIONS = 5000
+SCHEMA = {"query": str, "page": (int, 1), "exact": (bool, False), "projects": (list[str], [])}
+BODY = json.dumps({"query": "foo", "page": 3, "exact": True, "projects": ["httpd", "tomcat", "maven"]}).encode()
+
+
+async def handwritten():
+    data = await asfquart.utils.formdata()
+    errors = []
+    query = data.get("query")
+    if not isinstance(query, str):
+        errors.append("query")
+    try:
+        page = int(data.get("page", 1))
+    except (TypeError, ValueError):
+        errors.append("page")
+    exact = data.get("exact", False)
+    if not isinstance(exact, bool):
+        exact = str(exact).lower() in ("true", "yes", "on", "1")
+    projects = data.get("projects", [])
+    if not isinstance(projects, list) or not all(isinstance(project, str) for project in projects):
+        errors.append("projects")
+    assert not errors
+    return query, page, exact, projects
+
+
+@asfquart.utils.expects(SCHEMA)
+async def compiled(query, page, exact, projects):
+    return query, page, exact, projects
+
+
+async def measure(app, endpoint):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        async with app.test_request_context("/", method="POST", data=BODY, headers={"Content-Type": "application/json"}):
+            assert await endpoint() == ("foo", 3, True, ["httpd", "tomcat", "maven"])
+    return (time.perf_counter() - start) / ITERATIONS
+
+
+def checks_only():
+    """Times the validation itself, without reading the request."""
+    data = json.loads(BODY)
+    args = werkzeug.datastructures.MultiDict()
+    validate = asfquart.utils.compile_schema(SCHEMA)
+    compiled_time = timeit.timeit(lambda: validate(args, None, data), number=ITERATIONS * 10) / (ITERATIONS * 10)
+    print(f"  compiled validator only:          {compiled_time * 1e6:8.1f} us/request")
+
+
+async def main():
+    app = asfquart.construct("bench_expects", token_file=None)
+    baseline = await measure(app, handwritten)
+    schema = await measure(app, compiled)
+    print(f"{ITERATIONS} requests (times include request context setup)")
+    print(f"  formdata() + hand-written checks: {baseline * 1e6:8.1f} us/request")
+    print(f"  @expects(schema):                 {schema * 1e6:8.1f} us/request")
+    checks_only()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
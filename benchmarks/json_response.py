@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Measures JSON response encoding throughput of Quart's default provider and asfquart.jsonprovider
+(with orjson if installed, and with its stdlib fallback), for a client session as returned by /auth,
+and a typical listing returned by an endpoint.
+
+Run with: python benchmarks/json_response.py
+"""
+
+import asyncio
+import datetime
+import time
+
+import quart.json.provider
+
+import asfquart
+import asfquart.auth
+import asfquart.jsonprovider
+import asfquart.session
+
+ITERATIONS = 5000
+PROJECTS = [f"project{i}" for i in range(60)]
+CLIENT_SESSION = asfquart.session.ClientSession({
+    "uid": "humbedooh", "email": "humbedooh@apache.org", "fullname": "Daniel Gruno",
+    "isMember": True, "isChair": False, "isRoot": False, "mfa": True,
+    "pmcs": PROJECTS[:20], "projects": PROJECTS,
+})
+LISTING = {
+    "releases": [
+        {
+            "project": project,
+            "version": f"{i}.0.{i % 7}",
+            "released": datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).isoformat(),
+            "downloads": i * 1000,
+            "signed": i % 2 == 0,
+            "committers": [f"user{j}" for j in range(5)],
+        }
+        for i, project in enumerate(PROJECTS)
+    ],
+}
+
+
+async def measure(app, label):
+    async with app.app_context():
+        for name, payload in (("session", CLIENT_SESSION.as_dict()), ("listing", LISTING)):
+            size = len(await app.json.response(payload).get_data())
+            start = time.perf_counter()
+            for _ in range(ITERATIONS):
+                app.json.response(payload)
+            elapsed = (time.perf_counter() - start) / ITERATIONS
+            print(f"  {label:30s} {name:8s} {size:6d} bytes  {elapsed * 1e6:8.1f} us/response")
+
+
+async def main():
+    app = asfquart.construct("bench_json_response", token_file=None)
+    app.json = quart.json.provider.DefaultJSONProvider(app)
+    await measure(app, "Quart default provider")
+    asfquart.jsonprovider.setup(app)
+    if asfquart.jsonprovider.ORJSON_SUPPORTED:
+        await measure(app, "FastJSONProvider (orjson)")
+    asfquart.jsonprovider.ORJSON_SUPPORTED = False
+    await measure(app, "FastJSONProvider (stdlib)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Measures the requests failing while an app reloads (on SIGUSR2), with process restarts (the default) versus
+graceful reloads (GRACEFUL_RELOAD, see asfquart.handoff), and whether a request in flight survives the reload.
+
+Run with: PYTHONPATH=src python benchmarks/reload_downtime.py
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+PORT = 18123
+DURATION = 4  # Seconds to keep sending requests for, after signalling the reload
+APP = f"""
+import asyncio, os, sys
+import asfquart, asfquart.auth
+app = asfquart.construct("bench_reload", oauth=False, token_file=None)
+app.cfg.WATCH = "none"
+app.cfg.GRACEFUL_RELOAD = sys.argv[1] == "graceful"
+
+@app.route("/pid")
+async def pid():
+    return str(os.getpid())
+
+@app.route("/slow")
+async def slow():
+    await asyncio.sleep(2)
+    return str(os.getpid())
+
+app.runx(port={PORT}, debug=False)
+"""
+
+
+async def get(session, path):
+    async with session.get(f"http://127.0.0.1:{PORT}{path}") as rv:
+        return rv.status, await rv.text()
+
+
+async def measure(script, mode):
+    proc = subprocess.Popen([sys.executable, script, mode], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    pids = set()
+    try:
+        # New connections for every request, so none are kept alive across the reload.
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(force_close=True)) as session:
+            for _ in range(100):
+                try:
+                    await get(session, "/pid")
+                    break
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.1)
+            slow = asyncio.create_task(get(session, "/slow"))
+            await asyncio.sleep(0.3)
+            os.kill(proc.pid, signal.SIGUSR2)
+            ok = failed = 0
+            start = time.monotonic()
+            while time.monotonic() - start < DURATION:
+                try:
+                    _status, pid = await get(session, "/pid")
+                    pids.add(int(pid))
+                    ok += 1
+                except aiohttp.ClientError:
+                    failed += 1
+                await asyncio.sleep(0.01)
+            try:
+                slow_status = (await slow)[0]
+            except aiohttp.ClientError as e:
+                slow_status = type(e).__name__
+        print(f"  {mode:9s} {ok:5d} requests served  {failed:5d} failed  request in flight: {slow_status}")
+    finally:
+        for pid in pids | {proc.pid}:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        proc.wait()
+        await asyncio.sleep(1)  # Let the port go
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        script = os.path.join(tmpdir, "app.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(APP)
+        os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, (os.path.abspath("src"), os.environ.get("PYTHONPATH"))))
+        print(f"Requests over {DURATION}s after SIGUSR2:")
+        for mode in ("restart", "graceful"):
+            await measure(script, mode)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Measures the per-request cost of resolving the client session.
+
+A typical protected endpoint resolves the session three times: once in @asfquart.auth.require,
+once in the endpoint itself, and once more in the enforce_login error handler on failure.
+This compares a single request doing that against an unmemoized resolution on each call.
+
+Run with: python benchmarks/session_read.py
+"""
+
+import asyncio
+import time
+
+import asfquart
+import asfquart.auth
+import asfquart.session
+
+ITERATIONS = 5000
+READS_PER_REQUEST = 3
+
+
+def token_handler(token):
+    # Stand-in for a handler that does some real work (parsing a registry, hashing the token, ...)
+    time.sleep(0.0001)
+    return {"uid": "ci-bot", "roleaccount": True} if token == "abcdefg" else None
+
+
+async def main():
+    app = asfquart.construct("bench_session_read", token_file=None)
+    app.token_handler = token_handler
+    headers = {"Authorization": "Bearer abcdefg"}
+
+    async with app.test_request_context("/", headers=headers):
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            for _ in range(READS_PER_REQUEST):
+                await asfquart.session._resolve(86400 * 7, app)  # pylint: disable=protected-access
+        unmemoized = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        async with app.test_request_context("/", headers=headers):
+            for _ in range(READS_PER_REQUEST):
+                await asfquart.session.read()
+    memoized = time.perf_counter() - start
+
+    print(f"{READS_PER_REQUEST} reads/request, {ITERATIONS} requests")
+    print(f"  unmemoized: {unmemoized / ITERATIONS * 1e6:8.1f} us/request")
+    print(f"  memoized:   {memoized / ITERATIONS * 1e6:8.1f} us/request (includes request context setup)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Compares the session cookie size and per-request session cost of the default signed cookie sessions
+against a server-side session store, for a logged-in committer on a number of projects.
+
+Run with: python benchmarks/session_size.py
+"""
+
+import asyncio
+import time
+
+import quart
+import quart.globals
+
+import asfquart
+import asfquart.auth
+import asfquart.sessionstore
+
+ITERATIONS = 2000
+OAUTH_DATA = {
+    "uid": "humbedooh",
+    "email": "humbedooh@apache.org",
+    "fullname": "Daniel Gruno",
+    "isMember": True,
+    "isChair": False,
+    "isRoot": False,
+    "pmcs": [f"project{i}" for i in range(20)],
+    "projects": [f"project{i}" for i in range(60)],
+    "mfa": True,
+}
+
+
+async def measure(app, label):
+    @app.route("/login")
+    async def login():
+        asfquart.session.write(OAUTH_DATA)
+        return "ok"
+
+    @app.route("/whoami")
+    async def whoami():
+        return (await asfquart.session.read()).uid
+
+    client = app.test_client()
+    rv = await client.get("/login", scheme="https")
+    cookie = rv.headers["Set-Cookie"].split(";")[0]
+    start = time.perf_counter()
+    sent_cookies = 0
+    for _ in range(ITERATIONS):
+        rv = await client.get("/whoami", scheme="https")
+        sent_cookies += "Set-Cookie" in rv.headers
+    elapsed = time.perf_counter() - start
+    print(f"{label}:")
+    print(f"  cookie size:      {len(cookie):6d} bytes")
+    print(f"  Set-Cookie sent:  {sent_cookies:6d} of {ITERATIONS} requests")
+    print(f"  request time:     {elapsed / ITERATIONS * 1e6:8.1f} us/request (includes test client overhead)")
+
+
+async def main():
+    quart.session = quart.globals.session
+    await measure(asfquart.construct("bench_cookie_session", token_file=None), "Signed cookie sessions")
+    app = asfquart.construct("bench_store_session", token_file=None)
+    asfquart.sessionstore.setup(app, asfquart.sessionstore.MemoryStore())
+    await measure(app, "Server-side sessions (memory)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
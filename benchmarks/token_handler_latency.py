@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Measures head-of-line blocking caused by synchronous token handlers.
+
+A blocking token handler (standing in for a file read, DB query or HTTP call) is hit by a burst
+of bearer-token requests, while a heartbeat task measures how late the event loop wakes it up.
+When sync handlers run on the event loop, every other request waits for them; when they run in
+the app's thread pool, the loop stays responsive.
+
+Run with: python benchmarks/token_handler_latency.py
+"""
+
+import asyncio
+import time
+
+import asfquart
+import asfquart.auth
+import asfquart.session
+
+BURST = 20
+HANDLER_DELAY = 0.02  # Seconds of blocking work per token lookup
+TICK = 0.001
+
+
+def blocking_token_handler(token):
+    time.sleep(HANDLER_DELAY)
+    return {"uid": "ci-bot", "roleaccount": True}
+
+
+async def on_loop_handler(app, token):
+    # The behaviour before sync handlers were moved off the loop.
+    return app.token_handler(token)
+
+
+async def heartbeat(lateness: list, stop: asyncio.Event):
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lateness.append(time.perf_counter() - before - TICK)
+
+
+async def burst(app):
+    async def one_request(i):
+        async with app.test_request_context("/", headers={"Authorization": f"Bearer token{i}"}):
+            return await asfquart.session.read()
+
+    lateness = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lateness, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(BURST)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    return elapsed, max(lateness, default=0)
+
+
+async def main():
+    app = asfquart.construct("bench_token_handler", token_file=None)
+    app.token_handler = blocking_token_handler
+    app.cfg.SYNC_WORKERS = BURST
+
+    async with app.test_app():
+        original = asfquart.session.call_token_handler
+        asfquart.session.call_token_handler = on_loop_handler
+        try:
+            blocked = await burst(app)
+        finally:
+            asfquart.session.call_token_handler = original
+        threaded = await burst(app)
+
+    print(f"{BURST} concurrent bearer requests, {HANDLER_DELAY * 1000:.0f}ms blocking handler")
+    print(f"  on event loop: {blocked[0] * 1000:7.1f}ms total, worst loop stall {blocked[1] * 1000:7.1f}ms")
+    print(f"  thread pool:   {threaded[0] * 1000:7.1f}ms total, worst loop stall {threaded[1] * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
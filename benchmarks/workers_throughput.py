@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Measures the throughput of an app served by runx() with a single process, versus pre-forked workers
+(see asfquart.prefork), for an endpoint doing a little CPU-bound work (rendering a JSON listing).
+
+Run with: PYTHONPATH=src python benchmarks/workers_throughput.py [WORKERS]
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+PORT = 18125
+DURATION = 5  # Seconds to measure for
+CONCURRENCY = 64
+APP = f"""
+import sys
+import asfquart, asfquart.auth
+app = asfquart.construct("bench_workers", oauth=False, token_file=None)
+app.cfg.WATCH = "none"
+LISTING = {{"releases": [{{"project": f"project{{i}}", "version": f"{{i}}.0", "downloads": i * 1000}} for i in range(100)]}}
+
+@app.route("/")
+async def index():
+    return LISTING
+
+app.runx(port={PORT}, debug=False, workers=int(sys.argv[1]))
+"""
+
+
+async def measure(script, workers):
+    proc = subprocess.Popen([sys.executable, script, str(workers)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONCURRENCY)) as session:
+            async def get():
+                async with session.get(f"http://127.0.0.1:{PORT}/") as rv:
+                    await rv.read()
+            for _ in range(100):
+                try:
+                    await get()
+                    break
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.1)
+            await asyncio.sleep(1)  # Let all workers start
+
+            done = 0
+            deadline = time.monotonic() + DURATION
+            async def client():
+                nonlocal done
+                while time.monotonic() < deadline:
+                    await get()
+                    done += 1
+            await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+        print(f"  {workers:2d} worker(s)  {done / DURATION:8.0f} requests/s")
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+
+
+async def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else min(os.cpu_count() or 1, 4)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        script = os.path.join(tmpdir, "app.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(APP)
+        os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, (os.path.abspath("src"), os.environ.get("PYTHONPATH"))))
+        print(f"{CONCURRENCY} concurrent clients, {os.cpu_count()} CPUs:")
+        for count in (1, workers):
+            await measure(script, count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
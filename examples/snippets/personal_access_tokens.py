@@ -1,43 +1,21 @@
 #!/usr/bin/env python3
 """ Example handler for personal access tokens (PATs) in asfquart """
-import os
-import yaml
-import easydict
-import asyncio
 import asfquart
+import asfquart.auth
+import asfquart.tokens
 
 
 ROLE_ACCOUNT_CONFIG = "roleaccounts.yaml"  # See roleaccounts.yaml in this example dir
 
-def load_accounts():
-    if os.path.isfile(ROLE_ACCOUNT_CONFIG):
-        yml = easydict.EasyDict(yaml.safe_load(open(ROLE_ACCOUNT_CONFIG)))
-    else:
-        print(f"Could not find role account config file {ROLE_ACCOUNT_CONFIG}, no role accounts set up")
-        yml = {}
-    return yml
-
-async def token_handler(token):
-    # Iterate through all role accounts
-    yml = load_accounts()
-    for rolename, roledata in yml.items():
-        # If token matches, return the session dict.
-        # SHOULD have: uid, email, fullname, roleaccount
-        if roledata.token == token:
-            session = {
-                "uid": rolename,
-                "email": "root@apache.org",
-                "fullname": roledata.name,
-                "roleaccount": True,
-                "metadata": {
-                  "scope": roledata.scope,  # Mark the scope of this roleaccount (or PAT) internally
-                }
-            }
-            return session
 
 def my_app():
     app = asfquart.construct("my_simple_app")
-    app.token_handler = token_handler  # Set the PAT handler
+
+    # Load the role accounts once, look tokens up in O(1), and reload whenever the file changes.
+    # Each account gets a session dict with uid, email, fullname, roleaccount=True, and its scope
+    # in the session metadata.
+    registry = asfquart.tokens.TokenRegistry(app.app_dir / ROLE_ACCOUNT_CONFIG)
+    registry.install(app)  # Sets app.token_handler
 
     # Default homepage
     @app.route("/")
@@ -46,7 +24,7 @@ def my_app():
 
     # Add a secret roleaccount-only URI for testing
     @app.route("/secret")
-    @asfquart.auth.require(asfquart.auth.Requirements.roleaccount)
+    @asfquart.auth.require(asfquart.auth.Requirements.roleacct)
     async def secret_roleaccount_page():
         return await asfquart.session.read()
 
@@ -6,6 +6,26 @@ import typing
 import asyncio
 import collections.abc
 
+class ProjectRequirement:
+    """A requirement scoped to specific projects: passes if any of PROJECTS is in the ATTR set of the client
+    session (see Requirements.pmc_of() and friends). Membership is tested against the frozensets of the
+    session, so it is O(1) per project regardless of the number of affiliations of the user."""
+
+    __slots__ = ("__name__", "attr", "projects", "message")
+
+    def __init__(self, name: str, attr: str, projects: typing.Iterable[str], message: str):
+        self.__name__ = name
+        self.attr = attr
+        self.projects = frozenset(projects)
+        self.message = message
+
+    def __call__(self, client_session: session.ClientSession):
+        return not self.projects.isdisjoint(getattr(client_session, self.attr)), self.message
+
+    def __repr__(self):
+        return f"Requirements.{self.__name__}({', '.join(sorted(self.projects))})"
+
+
 class Requirements:
     """Various pre-defined access requirements"""
 
@@ -17,6 +37,8 @@ class Requirements:
     E_NOT_ROOT = "This endpoint is only accessible to foundation staff."
     E_NOT_PMC = "This endpoint is only accessible to members of the foundation committees."
     E_NOT_ROLEACCOUNT = "This endpoint is only accessible to role accounts."
+    E_NOT_PMC_OF = "This endpoint is only accessible to members of the following PMC(s): %s."
+    E_NOT_COMMITTER_OF = "This endpoint is only accessible to committers of the following project(s): %s."
 
 
     @classmethod
@@ -59,6 +81,38 @@ class Requirements:
         # Anything but True will cause a failure.
         return client_session.isRole is True, cls.E_NOT_ROLEACCOUNT
 
+    @classmethod
+    def pmc_of(cls, project: str) -> ProjectRequirement:
+        """Requirement that the user is a PMC member of the given project"""
+        return cls.pmc_of_any({project})
+
+    @classmethod
+    def pmc_of_any(cls, projects: typing.Iterable[str]) -> ProjectRequirement:
+        """Requirement that the user is a PMC member of at least one of the given projects"""
+        projects = _project_set(projects)
+        return ProjectRequirement("pmc_of_any", "committees", projects, cls.E_NOT_PMC_OF % ", ".join(sorted(projects)))
+
+    @classmethod
+    def committer_of(cls, project: str) -> ProjectRequirement:
+        """Requirement that the user is a committer on the given project"""
+        return cls.committer_of_any({project})
+
+    @classmethod
+    def committer_of_any(cls, projects: typing.Iterable[str]) -> ProjectRequirement:
+        """Requirement that the user is a committer on at least one of the given projects"""
+        projects = _project_set(projects)
+        return ProjectRequirement(
+            "committer_of_any", "projects", projects, cls.E_NOT_COMMITTER_OF % ", ".join(sorted(projects))
+        )
+
+def _project_set(projects: typing.Iterable[str]) -> frozenset:
+    """Converts a collection of project names to a frozenset. A single name would be taken for a collection of
+    one-letter project names, granting access to the wrong projects, so it is rejected instead."""
+    if isinstance(projects, str):
+        raise TypeError(f"Expected a collection of project names, not the string {projects!r}, use pmc_of()/committer_of() instead")
+    return frozenset(projects)
+
+
 class AuthenticationFailed(base.ASFQuartException):
     def __init__(self, message: str = "Authentication failed", errorcode: int = 403):
         self.message = message
@@ -76,6 +130,8 @@ def requirements_to_iter(args: typing.Any):
         args = [args]
     # Test that each requirement is an allowed one (belongs to the Requirements class)
     for req in args:
+        if isinstance(req, ProjectRequirement):
+            continue
         if not callable(req) or req != getattr(Requirements, req.__name__, None):
             raise TypeError(
                 f"Authentication requirement {req} is not valid. Must belong to the asfquart.auth.Requirements class."
@@ -83,6 +139,36 @@ def requirements_to_iter(args: typing.Any):
     return args
 
 
+def compile_requirements(all_of: typing.Any = None, any_of: typing.Any = None):
+    """Validates the given requirements, and compiles them into a single predicate. The predicate takes a
+    client session, and returns None if all of ALL_OF and at least one of ANY_OF are satisfied, or the
+    error message(s) otherwise. Returns None if there are no requirements at all."""
+    all_of = tuple(requirements_to_iter(all_of))
+    any_of = tuple(requirements_to_iter(any_of))
+    if not all_of and not any_of:
+        return None
+
+    def describe_failure(client_session) -> str:
+        # Only reached on failure: re-run the tests to collect every error, as a client would expect.
+        errors_list = [desc for passes, desc in (requirement(client_session) for requirement in all_of) if not passes]
+        if not errors_list:
+            errors_list = [requirement(client_session)[1] for requirement in any_of]
+        return "\n".join(errors_list)
+
+    def predicate(client_session) -> typing.Optional[str]:
+        for requirement in all_of:
+            if not requirement(client_session)[0]:
+                return describe_failure(client_session)
+        if any_of:
+            for requirement in any_of:
+                if requirement(client_session)[0]:
+                    return None
+            return describe_failure(client_session)
+        return None
+
+    return predicate
+
+
 def require(
     func: typing.Optional[typing.Callable] = None,
     all_of: typing.Optional[typing.Iterable] = None,
@@ -97,6 +183,8 @@ def require(
     - committer: The client must be a committer
     - member: The client must be a foundation member
     - chair: The client must be a chair of a project
+    - pmc_of("foo"), pmc_of_any({"foo", "bar"}): The client must be on the PMC of (any of) the given project(s)
+    - committer_of("foo"), committer_of_any({"foo", "bar"}): The client must be a committer on (any of) the given project(s)
 
     In addition, any endpoint decorated with @require will implicitly require ANY form of
     authenticated session. This is mandatory and also works as a bare decorator.
@@ -107,64 +195,36 @@ def require(
         @require({Requirements.mfa_enabled, Requirements.chair})  # Require any project chair with MFA-enabled session
         @require(all_of=Requirements.mfa_enabled, any_of={Requirements.member, Requirements.chair})
           # Require either ASF member OR project chair, but also require MFA enabled in any case.
+        @require(any_of={Requirements.pmc_of("httpd"), Requirements.root})  # Require httpd PMC member or infra-root
     """
 
-    async def require_wrapper(original_func: typing.Callable, all_of=None, any_of=None, *args, **kwargs):
-        client_session = await session.read()
-        errors_list = []
-        # First off, test if we have a session at all.
-        if not isinstance(client_session, dict):
-            raise AuthenticationFailed(Requirements.E_NOT_LOGGED_IN)
-
-        # Test all_of
-        all_of_set = requirements_to_iter(all_of)
-        for requirement in all_of_set:
-            passes, desc = requirement(client_session)
-            if not passes:
-                errors_list.append(desc)
-        # If we encountered an error, bail early
-        if errors_list:
-            raise AuthenticationFailed("\n".join(errors_list))
-
-        # So far, so good? Run the any_of if present, break if any single test succeeds.
-        any_of_set = requirements_to_iter(any_of)
-        for requirement in any_of_set:
-            passes, desc = requirement(client_session)
-            if not passes:
-                errors_list.append(desc)
-            else:
-                # If a test passed, we can clear the failures and pass
-                errors_list.clear()
-                break
-        # If no tests passed, errors_list should have at least one entry.
-        if errors_list:
-            raise AuthenticationFailed("\n".join(errors_list))
-        if args or kwargs:
+    def wrap(original_func: typing.Callable, predicate):
+        # Requirements are validated and compiled into PREDICATE once, at decoration time,
+        # so each request only runs the compiled tests.
+        @functools.wraps(original_func)
+        async def require_wrapper(*args, **kwargs):
+            client_session = await session.read()
+            # First off, test if we have a session at all.
+            if not isinstance(client_session, session.ClientSession):
+                raise AuthenticationFailed(Requirements.E_NOT_LOGGED_IN)
+            if predicate is not None:
+                errors = predicate(client_session)
+                if errors:
+                    raise AuthenticationFailed(errors)
             return await original_func(*args, **kwargs)
-        return await original_func()
+        return require_wrapper
 
     # If decorator is passed without arguments, func will be an async function
     # In this case, we will return a simple wrapper.
     if asyncio.iscoroutinefunction(func):
-        return functools.wraps(func)(functools.partial(require_wrapper, func))
+        return wrap(func, compile_requirements(all_of, any_of))
+
+    # If decorated without keywords, func disappears in the outer scope and is replaced with all_of,
+    # so we account for this by swapping around the arguments just in time if needed.
+    predicate = compile_requirements(all_of or func, any_of)
 
     # If passed with args, we construct a "double wrapper" and return it.
     def require_with_args(original_func: typing.Callable):
-        # If decorated without keywords, func disappears in the outer scope and is replaced with all_of,
-        # so we account for this by swapping around the arguments just in time if needed.
-        if not asyncio.iscoroutinefunction(func):
-            return functools.wraps(original_func)(
-                functools.partial(
-                    require_wrapper,
-                    original_func,
-                    all_of=requirements_to_iter(all_of or func),
-                    any_of=requirements_to_iter(any_of),
-                )
-            )
-        return functools.wraps(original_func)(
-            functools.partial(
-                require_wrapper, original_func, all_of=requirements_to_iter(all_of), any_of=requirements_to_iter(any_of)
-            )
-        )
+        return wrap(original_func, predicate)
 
     return require_with_args
@@ -27,16 +27,26 @@ import os
 import stat
 import logging
 import signal
+import collections.abc
+import concurrent.futures
+import contextvars
+import functools
+import fnmatch
+import re
+import time
 
 import asfpy.twatcher
 import quart  # implies .app and .utils
+import quart.json.provider
+import hypercorn.asyncio
+import hypercorn.config
 import hypercorn.utils
 import ezt
 import easydict
 import yaml
 import watchfiles
 
-from . import utils
+from . import config, eventloop, handoff, httpclient, prefork, utils
 
 try:
     ExceptionGroup
@@ -55,6 +65,9 @@ SECRETS_FILE_MODE = stat.S_IRUSR | stat.S_IWUSR  # 0o600, read/write for this us
 SECRETS_FILE_UMASK = 0o777 ^ SECRETS_FILE_MODE  # Prevents existing umask from mangling the mode
 CONFIG_FNAME = 'config.yaml'
 TOKEN_FNAME = 'apptoken.txt'
+DEFAULT_SYNC_WORKERS = 8  # Threads available to run blocking callbacks, see QuartApp.run_sync()
+DEFAULT_WATCH_SCOPE = "app"  # Reload on changes to .py files in the app directory, see QuartApp.watch()
+DEFAULT_WATCH_DEBOUNCE = 1600  # Milliseconds to collect a burst of file changes into a single reload
 
 
 class ASFQuartException(Exception):
@@ -66,9 +79,33 @@ class ASFQuartException(Exception):
         super().__init__(self.message)
 
 
+def _is_readonly_mapping(obj) -> bool:
+    return isinstance(obj, collections.abc.Mapping) and not isinstance(obj, dict)
+
+
+def _as_dict(mapping) -> dict:
+    # Mappings may know best how to present themselves as a dict (eg. ClientSession.as_dict()).
+    as_dict = getattr(mapping, "as_dict", None)
+    return as_dict() if callable(as_dict) else dict(mapping)
+
+
+class JSONProvider(quart.json.provider.DefaultJSONProvider):
+    """Quart's default JSON provider, which also encodes read-only mappings (such as client sessions) found
+    within the data, eg. when an endpoint returns {"session": session}, or calls quart.jsonify(session)."""
+
+    @staticmethod
+    def default(o):
+        if _is_readonly_mapping(o):
+            return _as_dict(o)
+        return quart.json.provider.DefaultJSONProvider.default(o)
+
+
 class QuartApp(quart.Quart):
     """Subclass of quart.Quart to include our specific features."""
 
+    json_provider_class = JSONProvider
+    request_class = utils.Request
+
     def __init__(
             self,
             app_id: str,
@@ -100,11 +137,50 @@ class QuartApp(quart.Quart):
 
         # use an easydict for config values
         self.cfg = easydict.EasyDict()
+        self.cfg_file_keys = frozenset()  # Settings last read from the config file, see reload_config()
+
+        # Called with the new configuration whenever it is reloaded - see asfquart.config.reloadable()
+        self.reload_callbacks = []
+
+        # Data files reloaded in place when they change (path -> function reloading it) - see watch_file()
+        self.watched_files = {}
+
+        # Pooled HTTP client for outbound requests, closed when we stop serving - see asfquart.httpclient
+        self.http = httpclient.HTTPClient(self.cfg)
+        self.while_serving(self.http.lifespan)
 
         # token handler callback for PATs - see docs/sessions.md
         self.token_handler = None  # Default to no PAT handler available.
+        self.token_cache = None  # Cache of token handler results, set up by construct()
         self.basic_auth = True
 
+        # Expiry policy of cookie sessions, set up by construct() - see asfquart.session.SessionPolicy
+        self.session_policy = None
+
+        # Store of OAuth logins in progress, set up by asfquart.generics.setup_oauth()
+        self.oauth_states = None
+
+        # App-wide LDAP connection pool for Basic auth, set up by construct() - see asfquart.ldap
+        self.ldap_pool = None
+
+        # Thread pool for blocking callbacks (such as sync token handlers), created on first use
+        # with SYNC_WORKERS threads, and shut down when the app stops serving.
+        self.sync_executor = None
+        self.while_serving(self._manage_sync_executor)
+
+        # Refuse to serve routes whose URL parameters clash with their @expects fields - see asfquart.utils
+        self.before_serving(self._check_routes)
+
+        # Requests being handled, and how draining them went once runx() stopped accepting connections.
+        self.requests_in_flight = 0
+        self.drain_stats = None  # See asfquart.handoff.DrainStats
+
+        # Number of this worker process (0 to WORKERS-1), when runx() serves with several - see asfquart.prefork
+        self.worker_id = None
+
+        # Event loop implementation for runx(), set up by construct() - see asfquart.eventloop
+        self.event_loop = None
+
         if token_file is not None:
             # Path.__truediv__ internally handles the case of absolute / relative path segments
             # if an anchored segment (i.e. absolute path) is provided, the segment will be returned as is.
@@ -153,6 +229,10 @@ class QuartApp(quart.Quart):
              debug=True, loop=None,
              certfile=None, keyfile=None,
              extra_files=frozenset(), # OK, because immutable
+             watch=None,
+             graceful=None,
+             workers=None,
+             event_loop=None,
              ):
         """Extended version of Quart.run()
 
@@ -161,6 +241,23 @@ class QuartApp(quart.Quart):
 
         EXTRA_FILES is a set of files (### relative to?) that should be
         watched for changes. If a change occurs, the app will be reloaded.
+
+        WATCH is the scope of files watched for changes, see watch().
+
+        GRACEFUL (default: the GRACEFUL_RELOAD config option) makes reloads hand
+        the listening sockets over to a new process, rather than re-executing
+        this one. See asfquart.handoff.
+
+        WORKERS (default: the WORKERS config option, or 1) is the number of
+        processes to serve the app with. With more than one, they are forked
+        from a supervisor process, which watches for changes and handles the
+        signals for all of them (LOOP is then not used). This is refused, with a
+        RuntimeError, for apps keeping state in memory that all workers need,
+        see asfquart.prefork.check_shared_state().
+
+        EVENT_LOOP (default: the one given to construct(), or the EVENT_LOOP
+        config option) picks the implementation of the loop to construct:
+        "asyncio", "uvloop" or "auto". See asfquart.eventloop.
         """
 
         # Default PORT is None, but it must be explicitly specified.
@@ -170,24 +267,31 @@ class QuartApp(quart.Quart):
         # NOTE: much of the code below is direct from quart/app.py:Quart.run()
         # This local "copy" is to deal with the custom watcher/reloader.
 
-        if loop is None:
-            loop = asyncio.new_event_loop()
-            loop.set_debug(debug)
-
-            asyncio.set_event_loop(loop)
-
-        # Create a factory for a trigger that watches for exceptions.
-        trigger = self.factory_trigger(loop, extra_files)
-
-        # Construct a task to run the app.
-        task = self.run_task(
-            host,
-            port,
-            debug,
-            certfile=certfile,
-            keyfile=keyfile,
-            shutdown_trigger=trigger,
-        )
+        if graceful is None:
+            graceful = self.cfg.get("GRACEFUL_RELOAD", False)
+        if workers is None:
+            workers = self.cfg.get("WORKERS", prefork.DEFAULT_WORKERS)
+        if event_loop is None:
+            event_loop = self.event_loop or self.cfg.get("EVENT_LOOP", eventloop.DEFAULT_EVENT_LOOP)
+        event_loop = eventloop.resolve(event_loop)
+        # Fail before binding the port or forking workers, rather than once serving (see _check_routes()).
+        utils.check_expects(self)
+        if workers > 1:
+            prefork.check_shared_state(self)
+
+        # Configure hypercorn as Quart.run_task() does, plus the deadline for
+        # draining requests in flight when we stop serving.
+        hyper_config = hypercorn.config.Config()
+        hyper_config.access_log_format = "%(h)s %(r)s %(s)s %(b)s %(D)s"
+        hyper_config.accesslog = self.logger
+        hyper_config.errorlog = self.logger
+        hyper_config.bind = [f"{host}:{port}"]
+        hyper_config.certfile = certfile
+        hyper_config.keyfile = keyfile
+        hyper_config.graceful_timeout = self.cfg.get("DRAIN_TIMEOUT", handoff.DEFAULT_DRAIN_TIMEOUT)
+        self.debug = debug
+        # Workers share the listening sockets, so these are always set up for handing over.
+        listen_fds = handoff.inherit_sockets(hyper_config) if graceful or workers > 1 else None
 
         # If certfile is None then https.
         protocol = "https" if certfile is not None else "http"
@@ -195,15 +299,35 @@ class QuartApp(quart.Quart):
         ### LOG/print some info about the app starting?
         print(f' * Serving Quart app "{self.app_id}"')
         print(f" * Debug mode: {self.debug}")
-        print(" * Using reloader: CUSTOM")
+        print(f" * Using reloader: {'GRACEFUL' if graceful else 'CUSTOM'}")
+        print(f" * Event loop: {event_loop if loop is None or workers > 1 else 'CUSTOM'}")
+        if workers > 1:
+            print(f" * Workers: {workers}")
         print(f" * Running on {protocol}://{host}:{port}")
         print(" * ... CTRL + C to quit")
 
+        if workers > 1:
+            supervisor = prefork.Supervisor(self, workers, hyper_config, listen_fds, graceful, event_loop)
+            supervisor.run(extra_files, watch)
+            return
+
+        if loop is None:
+            loop = eventloop.new_event_loop(event_loop)
+            loop.set_debug(debug)
+
+            asyncio.set_event_loop(loop)
+
+        # Create a factory for a trigger that watches for exceptions.
+        trigger = self.factory_trigger(loop, extra_files, watch, listen_fds)
+
+        # Construct a task to run the app.
+        task = hypercorn.asyncio.serve(self, hyper_config, shutdown_trigger=trigger)
+
         # Ready! Start running the app.
         self.run_forever(loop, task)
         # Being here, means graceful exit.
 
-    def factory_trigger(self, loop, extra_files=frozenset()):
+    def factory_trigger(self, loop, extra_files=frozenset(), watch=None, listen_fds=None):
         """Factory for an AWAITABLE that handles special exceptions.
 
         The LOOP normally ignores all signals. This method will make the
@@ -211,7 +335,8 @@ class QuartApp(quart.Quart):
         for a clean exit.
 
         This will also observe files for changes, and signal the loop
-        to reload the application.
+        to reload the application. If LISTEN_FDS (the listening sockets)
+        are given, reloads hand them over to a new process instead.
         """
 
         # Note: Quart.run() allows for optional signal handlers. We do not.
@@ -225,19 +350,42 @@ class QuartApp(quart.Quart):
             "Log a nice message when we're signalled to shut down."
             await shutdown_event.wait()
             LOGGER.info('SHUTDOWN: Performing graceful exit...')
+            self.start_draining()
             gathered.cancel()
             raise hypercorn.utils.ShutdownError()
 
+        async def reload():
+            "Reload the app, or hand over to a new process if we can."
+            if listen_fds is None:
+                self.start_draining()
+                gathered.cancel()
+                raise quart.utils.MustReloadError()
+            timeout = self.cfg.get("HANDOFF_TIMEOUT", handoff.DEFAULT_HANDOFF_TIMEOUT)
+            if await handoff.start_successor(listen_fds, timeout):
+                self.start_draining()
+                gathered.cancel()
+                raise hypercorn.utils.ShutdownError()
+            # The new process failed, so carry on serving (and watching).
+
         restart_event = asyncio.Event()
         def _restart_handler(*_) -> None:
             restart_event.set()
         loop.add_signal_handler(signal.SIGUSR2, _restart_handler)
         async def restart_wait():
             "Log a nice message when we're signalled to restart."
-            await restart_event.wait()
-            LOGGER.info('RESTART: Performing process restart...')
-            gathered.cancel()
-            raise quart.utils.MustReloadError()
+            while True:
+                await restart_event.wait()
+                restart_event.clear()
+                LOGGER.info('RESTART: Performing process restart...')
+                await reload()
+
+        async def watch_wait():
+            "Reload when watched files change."
+            while True:
+                try:
+                    await self.watch(extra_files, watch)
+                except quart.utils.MustReloadError:
+                    await reload()
 
         # Normally, for the SHUTDOWN_TRIGGER, it simply completes and
         # returns (eg. waiting on an event) as it gets wrapped into
@@ -246,10 +394,12 @@ class QuartApp(quart.Quart):
         # We are gathering three tasks, each running forever until its
         # condition raises an exception.
         #
-        # .watch() will raise MustReloadError
+        # watch_wait() will raise MustReloadError
         # shutdown_wait() will raise ShutdownError
         # restart_wait() will raise MustReloadError
-        t1 = loop.create_task(self.watch(extra_files),
+        #
+        # When handing over to a new process, reloads raise ShutdownError.
+        t1 = loop.create_task(watch_wait(),
                               name=f'Watch:{self.app_id}')
         t2 = loop.create_task(shutdown_wait(),
                               name=f'Shutdown:{self.app_id}')
@@ -260,33 +410,166 @@ class QuartApp(quart.Quart):
         gathered = utils.CancellableTask(aw, loop=loop,
                                          name=f'Trigger:{self.app_id}')
         async def await_gathered():
+            # Hypercorn calls this once it is serving: tell the process that started us, if any.
+            handoff.notify_ready()
             await gathered.task
 
         return await_gathered  # factory to create an awaitable (coro)
 
-    async def watch(self, extra_files=frozenset()):
-        "Watch all known .py files, plus some extra files (eg. configs)."
+    def watch_file(self, path, on_change):
+        """Has the data file at PATH reloaded in place, by calling ON_CHANGE(), whenever it changes
+        while the app is serving (see watch()), and whenever the app is told to reload (see reload()).
+        The file is watched in every WATCH scope, including "none", and only by the supervisor when
+        serving with several workers, which then has every worker reload it."""
+        self.watched_files[os.path.abspath(path)] = on_change
 
-        py_files = set(getattr(m, "__file__", None) for m in sys.modules.values())
-        py_files.remove(None)  # the built-in modules
+    def watch_targets(self, scope=DEFAULT_WATCH_SCOPE, extra_files=frozenset()):
+        """Returns the paths to watch for changes in SCOPE (see watch()), and the filter for
+        the changes to act on (None for the default filter of watchfiles)."""
 
         if os.path.isfile(self.cfg_path):
-            cfg_files = { self.cfg_path }
+            cfg_files = { str(self.cfg_path) }
         else:
             cfg_files = set()
-
-        watched_files = py_files | cfg_files | extra_files
+        files = cfg_files | { os.path.abspath(f) for f in extra_files }
+        # Watch the directories of data files, so we also catch them being replaced (eg. by an atomic rename).
+        data_files = set(self.watched_files)
+        data_dirs = { os.path.dirname(path) for path in data_files }
+
+        if scope == "none":
+            return data_dirs, lambda change, path: path in data_files
+
+        if scope == "modules":
+            py_files = set(getattr(m, "__file__", None) for m in sys.modules.values())
+            py_files.discard(None)  # the built-in modules
+            if not data_files:
+                return py_files | files, None
+            watched_files = py_files | files | data_files
+            return py_files | files | data_dirs, lambda change, path: path in watched_files
+
+        if scope == "app":
+            patterns = ("*.py",)
+        else:
+            patterns = (scope,) if isinstance(scope, str) else tuple(scope)
+        app_dir = str(self.app_dir)
+        ignored = watchfiles.DefaultFilter()  # __pycache__, .git, .venv, editor swap files, ...
+        in_scope = re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns)).match
+
+        def watch_filter(change, path):
+            if path in files or path in data_files:
+                return True
+            relpath = os.path.relpath(path, app_dir)
+            if relpath.startswith(os.pardir) or not ignored(change, path):
+                return False
+            return in_scope(relpath) is not None
+
+        # Rather than the whole tree, watch the app directory and those of its subdirectories holding
+        # files in scope, so that large trees of other files (data, node_modules, ...) cost no watches.
+        dirs = { app_dir }
+        for dirpath, dirnames, filenames in os.walk(app_dir):
+            dirnames[:] = [d for d in dirnames if d not in ignored.ignore_dirs]
+            reldir = os.path.relpath(dirpath, app_dir)
+            prefix = "" if reldir == os.curdir else reldir + os.sep
+            if any(in_scope(prefix + filename) for filename in filenames):
+                dirs.add(dirpath)
+        return dirs | files | data_dirs, watch_filter
+
+    async def watch(self, extra_files=frozenset(), scope=None, on_reload=None):
+        """Watch for file changes, and reload the app when they happen. SCOPE (default: the
+        WATCH config option, or "app") decides which files are watched, besides the config file,
+        EXTRA_FILES, and the data files registered with watch_file():
+
+        - "app": .py files in the app directory (and its subdirectories)
+        - a list of glob patterns, relative to the app directory (eg. ["*.py", "templates/*.ezt"])
+
+        For these two, only the directories holding matching files when the watch starts are watched,
+        so files in scope added to other (eg. new) directories go unnoticed until the next restart.
+
+        - "modules": the files of all loaded modules, including the stdlib and site-packages
+        - "none": only the data files, for production deployments
+
+        Changes arriving within WATCH_DEBOUNCE milliseconds of each other cause a single reload.
+        If only the config file and data files changed, they are reloaded in place (see reload(), or
+        the ON_RELOAD coroutine function if given, which is passed the changed paths), without
+        restarting the process."""
+
+        if scope is None:
+            scope = self.cfg.get("WATCH", DEFAULT_WATCH_SCOPE)
+        if scope == "none" and not self.watched_files:
+            await asyncio.Event().wait()  # Never reload, but keep the trigger alive.
+            # NOTREACHED
+
+        watched_paths, watch_filter = self.watch_targets(scope, extra_files)
+        kw = {
+            "debounce": self.cfg.get("WATCH_DEBOUNCE", DEFAULT_WATCH_DEBOUNCE),
+            "recursive": False,  # We list each directory to watch, see watch_targets()
+        }
+        if watch_filter is not None:
+            kw["watch_filter"] = watch_filter
 
         # quiet down the watchfiles logger
         logging.getLogger('watchfiles.main').setLevel(logging.INFO)
 
-        async for changes in watchfiles.awatch(*watched_files):
+        in_place = { os.path.abspath(self.cfg_path) } | set(self.watched_files)
+        async for changes in watchfiles.awatch(*watched_paths, **kw):
+            # watchfiles hands us all changes of a burst at once, so log them all, then act once.
             for event in changes:
-                if (event[0] == watchfiles.Change.modified or event[0] == watchfiles.Change.deleted or event[0] == watchfiles.Change.added):
-                    LOGGER.info(f"File changed: {event[1]}")
-                    raise quart.utils.MustReloadError
+                LOGGER.info(f"File changed: {event[1]}")
+            # The config and data files are applied in place. Anything else needs a restart.
+            changed = { os.path.abspath(path) for _change, path in changes }
+            if not changed <= in_place:
+                raise quart.utils.MustReloadError
+            await (on_reload or self.reload)(changed)
         # NOTREACHED
 
+    async def reload(self, paths=None):
+        """Reloads the config file (see reload_config()) and the data files registered with watch_file()
+        in place: those among PATHS, or all of them. Failures are logged, and the current data kept.
+        Reloading all of them (eg. on SIGHUP) also drops the cached token handler results, which is how
+        a revoked token is dropped from every worker."""
+        if paths is None:
+            if self.token_cache is not None:
+                self.token_cache.clear()
+            await self.reload_config()
+        elif os.path.abspath(self.cfg_path) in paths:
+            await self.reload_config()
+        for path, on_change in list(self.watched_files.items()):
+            if paths is None or path in paths:
+                LOGGER.info(f"Reloading {path}")
+                try:
+                    on_change()
+                except Exception:  # pylint: disable=broad-exception-caught
+                    LOGGER.exception(f"Could not reload {path}")
+
+    async def reload_config(self) -> bool:
+        """Re-reads the config file, swaps the new configuration in as self.cfg, then calls the
+        callbacks registered with asfquart.config.reloadable() for this app. If the file cannot be
+        read, or does not hold a mapping, the current configuration is kept. Returns whether the new
+        configuration was applied.
+
+        Settings the app set itself (eg. app.cfg.FOO = 42) are carried over, unless the config file
+        has a value for them, which takes precedence. Settings removed from the file are dropped.
+        Settings that are only read by construct() (such as the session store, LDAP pool and
+        token cache) still require a restart to take effect."""
+
+        try:
+            file_cfg = config.read(self.cfg_path)
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            LOGGER.error(f"Could not reload {self.cfg_path}, keeping the current configuration: {e}")
+            return False
+
+        # Build everything first, then swap: requests never see a partially applied configuration.
+        new_cfg = easydict.EasyDict({key: value for key, value in self.cfg.items() if key not in self.cfg_file_keys})
+        new_cfg.update(file_cfg)
+        self.cfg = new_cfg
+        self.cfg_file_keys = frozenset(file_cfg)
+        await self.http.reconfigure(new_cfg)
+        if self.session_policy is not None:
+            self.session_policy = self.session_policy.from_config(new_cfg)
+        LOGGER.info(f"Reloaded configuration from {self.cfg_path}")
+        await config.notify(new_cfg, self.reload_callbacks)
+        return True
+
     def run_forever(self, loop, task):
         "Run the application until exit, then cleanly shut down."
 
@@ -301,8 +584,14 @@ class QuartApp(quart.Quart):
             reload_ = (e.subgroup(quart.utils.MustReloadError) is not None)
             LOGGER.debug(f'FOUND: ExceptionGroup, reload_={reload_}')
         finally:
+            if self.drain_stats is not None:
+                self.drain_stats.finished = time.monotonic()
             try:
+                # Requests still running past the drain deadline get cancelled here.
                 quart.app._cancel_all_tasks(loop) # pylint: disable=protected-access
+                if self.drain_stats is not None:
+                    stats = self.drain_stats
+                    LOGGER.info(f'DRAINED: {stats.in_flight} requests in flight, drained in {stats.seconds:.2f}s, {stats.dropped} dropped')
                 loop.run_until_complete(loop.shutdown_asyncgens())
             finally:
                 asyncio.set_event_loop(None)
@@ -310,6 +599,23 @@ class QuartApp(quart.Quart):
         if reload_:
             quart.utils.restart()
 
+    def start_draining(self):
+        "Start keeping track of how draining the requests in flight goes, as we stop serving."
+        timeout = self.cfg.get("DRAIN_TIMEOUT", handoff.DEFAULT_DRAIN_TIMEOUT)
+        self.drain_stats = handoff.DrainStats(self.requests_in_flight, timeout)
+
+    async def handle_request(self, request):
+        # Count requests in flight, and those cancelled for running past the drain deadline.
+        self.requests_in_flight += 1
+        try:
+            return await super().handle_request(request)
+        except asyncio.CancelledError:
+            if self.drain_stats is not None and time.monotonic() >= self.drain_stats.deadline:
+                self.drain_stats.dropped += 1
+            raise
+        finally:
+            self.requests_in_flight -= 1
+
     def load_template(self, tpath, base_format=ezt.FORMAT_HTML):
         # Use str() to avoid passing Path instances.
         return self.tw.load_template(str(self.app_dir / tpath), base_format=base_format)
@@ -322,8 +628,44 @@ class QuartApp(quart.Quart):
 
         return utils.use_template(self.load_template(path_or_T, base_format))
 
-    def add_runner(self, func, name=None):
-        "Add a long-running task, with cancellation/cleanup."
+    async def make_response(self, rv):
+        """Extended version of Quart.make_response(), which also renders read-only mappings (such as
+        asfquart.session.ClientSession) as JSON, like dicts."""
+        if isinstance(rv, tuple) and rv and _is_readonly_mapping(rv[0]):
+            rv = (_as_dict(rv[0]), *rv[1:])
+        elif _is_readonly_mapping(rv):
+            rv = _as_dict(rv)
+        return await super().make_response(rv)
+
+    async def run_sync(self, func, /, *args, **kw):
+        """Runs the blocking FUNC(*ARGS, **KW) in the app's thread pool, so that it does not stall
+        the event loop, and returns its result. Context variables (eg. the request) are carried over."""
+        if self.sync_executor is None:
+            self.sync_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.cfg.get("SYNC_WORKERS", DEFAULT_SYNC_WORKERS),
+                thread_name_prefix=f"Sync:{self.app_id}",
+            )
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kw)
+        return await loop.run_in_executor(self.sync_executor, call)
+
+    async def _check_routes(self):
+        utils.check_expects(self)
+
+    async def _manage_sync_executor(self):
+        "Shut down the sync thread pool, if one was started, once we stop serving."
+        yield
+        if self.sync_executor is not None:
+            self.sync_executor.shutdown(wait=False, cancel_futures=True)
+            self.sync_executor = None
+
+    def add_runner(self, func, name=None, singleton=False):
+        """Add a long-running task, with cancellation/cleanup.
+
+        When the app is served by several worker processes (see runx()), every
+        worker runs its own task, unless SINGLETON is set: then only worker 0
+        runs it. Use that for jobs that must not run concurrently, such as
+        periodic clean-ups of shared storage."""
 
         # NOTES:
         #
@@ -351,6 +693,10 @@ class QuartApp(quart.Quart):
 
         @self.while_serving
         async def perform_runner():
+            if singleton and self.worker_id not in (None, 0):
+                yield  # Another worker runs this one.
+                return
+
             ctask = utils.CancellableTask(func(), name=name)
             #print('RUNNER STARTED:', ctask.task)
 
@@ -370,6 +716,7 @@ def construct(
     force_login: bool = True,
     *args,
     basic_auth: bool = True,
+    event_loop: str | None = None,
     **kw
 ):
     """Construct an ASFQuart web application.
@@ -386,6 +733,8 @@ def construct(
         force_login: Optional, enforces redirect to the oauth provider when a user
             accesses a restricted page, defaults to ``true``.
         basic_auth: Optional, enables HTTP Basic authentication via LDAP, defaults to ``true``.
+        event_loop: Optional, the event loop for ``runx()`` to run the app on: ``asyncio``, ``uvloop`` or
+            ``auto`` (uvloop if installed), defaults to the ``EVENT_LOOP`` config option, or ``asyncio``.
     """
 
     # By default, we will set up OAuth and force login redirect on auth failure
@@ -412,18 +761,47 @@ def construct(
 
     # try to load the config information from app.cfg_path
     if os.path.isfile(app.cfg_path):
-        app.cfg.update(yaml.safe_load(open(app.cfg_path, encoding='utf-8')))
+        file_cfg = config.read(app.cfg_path)
+        app.cfg.update(file_cfg)
+        app.cfg_file_keys = frozenset(file_cfg)
+
+    # The event loop for runx() to run the app on - see asfquart.eventloop
+    app.event_loop = event_loop or app.cfg.get("EVENT_LOOP", eventloop.DEFAULT_EVENT_LOOP)
 
     # Provide our standard filename argument converter.
     import asfquart.utils
 
+    # Cache token handler results, as configured.
+    import asfquart.session
+    app.token_cache = asfquart.session.TokenCache.from_config(app.cfg)
+    app.session_policy = asfquart.session.SessionPolicy.from_config(app.cfg)
+
+    # Share one LDAP connection pool across all Basic auth requests.
+    import asfquart.ldap
+    if basic_auth and asfquart.ldap.LDAP_SUPPORTED:
+        asfquart.ldap.setup_pool(app)
+
     # Sane defaults for cookies: SameSite=Strict; Secure; HttpOnly
     app.config["SESSION_COOKIE_SAMESITE"] = "Strict"
     app.config["SESSION_COOKIE_SECURE"] = True
     app.config["SESSION_COOKIE_HTTPONLY"] = True
 
+    # Keep sessions server-side, with only an opaque session id in the cookie, if configured.
+    if app.cfg.get("SESSION_STORE"):
+        import asfquart.sessionstore
+        asfquart.sessionstore.setup(app)
+    # Otherwise, sessions live in the cookie, optionally in a compact format.
+    elif app.cfg.get("SESSION_COOKIE_FORMAT") == "compact":
+        import asfquart.sessioncookie
+        asfquart.sessioncookie.setup(app)
+
     app.url_map.converters["filename"] = asfquart.utils.FilenameConverter
 
+    # Encode JSON responses with orjson (if installed), if configured.
+    if app.cfg.get("FAST_JSON"):
+        import asfquart.jsonprovider
+        asfquart.jsonprovider.setup(app)
+
     # Set up oauth and login redirects if needed
     if setup_oauth:
         import asfquart.generics
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""ASFQuart - Bounded in-memory caches for long-running apps"""
+
+import asyncio
+import collections
+import time
+import typing
+
+DEFAULT_CACHE_SIZE = 1024  # Max number of entries in a cache
+DEFAULT_CACHE_TTL = 3600  # Entries expire after one hour
+
+_DEFAULT_TTL = object()  # Marker for "use the TTL of the cache"
+
+
+class _FetchAbandoned(Exception):
+    """Set on a shared fetch whose caller was cancelled before it completed."""
+
+
+class AsyncCache:
+    """Bounded key/value cache with per-entry expiry, for use within an event loop.
+
+    At most MAX_SIZE entries are kept; beyond that, the least recently used entry is evicted.
+    Entries expire TTL seconds after being set, unless a different TTL is given for the entry.
+    A TTL of None means entries never expire, and a TTL of zero means values are not cached.
+
+    get_or_fetch() coalesces concurrent misses: while a value is being fetched for a key, any
+    other caller asking for the same key waits for that fetch instead of starting its own.
+
+    Hits, misses, evictions and expirations are counted, see stats().
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, ttl: float | None = DEFAULT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: collections.OrderedDict[typing.Hashable, tuple] = collections.OrderedDict()  # key -> (expiry, value)
+        self._inflight: dict[typing.Hashable, asyncio.Future] = {}
+
+    def _lookup(self, key):
+        """Returns the entry for KEY, dropping it if it has expired."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            entry = None
+        return entry
+
+    def __contains__(self, key) -> bool:
+        return self._lookup(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Returns the cached value for KEY, or DEFAULT if it is missing or has expired."""
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value, ttl=_DEFAULT_TTL):
+        """Caches VALUE for KEY. TTL overrides the default expiry of the cache for this entry."""
+        if ttl is _DEFAULT_TTL:
+            ttl = self.ttl
+        if ttl is not None and ttl <= 0:
+            self._entries.pop(key, None)
+            return
+        self._entries[key] = (None if ttl is None else time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Removes KEY from the cache, returning its value (or DEFAULT if it was not cached)."""
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._entries.clear()
+
+    def purge(self) -> int:
+        """Drops all expired entries, returning how many were dropped."""
+        now = time.monotonic()
+        expired = [key for key, (expiry, _value) in self._entries.items() if expiry is not None and expiry <= now]
+        for key in expired:
+            del self._entries[key]
+        self.expirations += len(expired)
+        return len(expired)
+
+    async def get_or_fetch(self, key, fetch: typing.Callable[[], typing.Awaitable], ttl=_DEFAULT_TTL):
+        """Returns the cached value for KEY, or awaits FETCH() to produce (and cache) it.
+        Concurrent callers for the same KEY share a single FETCH(). Exceptions are not cached.
+        If the caller running the shared FETCH() is cancelled, one of the others takes over.
+        TTL may also be a function of the fetched value, e.g. to cache negative results for less time."""
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        while (future := self._inflight.get(key)) is not None:
+            try:
+                # Shield the shared fetch, so one caller being cancelled does not cancel it for the others.
+                return await asyncio.shield(future)
+            except _FetchAbandoned:
+                continue  # The first waiter to get here fetches for the others.
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            # Only we were cancelled: have the waiters retry, rather than cancelling them too.
+            future.set_exception(_FetchAbandoned())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved, in case nobody else was waiting.
+            raise
+        else:
+            self.set(key, value, ttl(value) if callable(ttl) else ttl)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        """Returns the current counters of this cache."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
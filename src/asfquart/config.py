@@ -4,14 +4,23 @@
 import yaml
 import functools
 import inspect
+import logging
 
 DEFAULT_CONFIG_FILENAME = "config.yaml"
+LOGGER = logging.getLogger(__name__)
 
 
-async def _read_config(callback, config_filename):
-    """Reads a YAML configuration and passes it to the callback"""
+def read(config_filename) -> dict:
+    """Reads a YAML configuration file, returning its contents as a dict (empty, if the file is).
+    Raises ValueError if the file holds anything but a mapping, such as a list."""
     with open(config_filename, encoding='utf-8') as r:
-        config_as_dict = yaml.safe_load(r)
+        config_as_dict = yaml.safe_load(r) or {}
+    if not isinstance(config_as_dict, dict):
+        raise ValueError(f"{config_filename} must hold a mapping of settings, not a {type(config_as_dict).__name__}")
+    return config_as_dict
+
+
+async def _call(callback, config_as_dict):
     # Some configuration routines may require os to block while the configuration is applied, so
     # we will accept both sync and async callbacks.
     # If the callback is async, await it...
@@ -22,6 +31,11 @@ async def _read_config(callback, config_filename):
         callback(config_as_dict)
 
 
+async def _read_config(callback, config_filename):
+    """Reads a YAML configuration and passes it to the callback"""
+    await _call(callback, read(config_filename))
+
+
 def static(func):
     """Standard wrapper for a configuration parser. Reads config.yaml and passes it to the callback as a dict"""
 
@@ -30,3 +44,28 @@ def static(func):
         await _read_config(func, config_filename)
 
     return config_wrapper
+
+
+def reloadable(func=None, *, app=None):
+    """Like static(), but the callback is also called with the new configuration (as a dict) each time the
+    config file of APP (default: the app constructed last, asfquart.APP) changes while it is running, see
+    QuartApp.reload_config(). Use as @reloadable, or @reloadable(app=APP)."""
+    if func is None:
+        return functools.partial(reloadable, app=app)
+    if app is None:
+        import asfquart  # Not at the top, as asfquart imports us
+        app = asfquart.APP
+    if app is None:
+        raise RuntimeError("Reloadable config callbacks need an app, construct() it first or pass app=")
+    app.reload_callbacks.append(func)
+    return static(func)
+
+
+async def notify(config_as_dict, callbacks):
+    """Passes a newly loaded configuration to each of the reloadable CALLBACKS. A failing callback is
+    logged, and does not keep the others from being called."""
+    for callback in list(callbacks):
+        try:
+            await _call(callback, config_as_dict)
+        except Exception:  # pylint: disable=broad-exception-caught
+            LOGGER.exception(f"Config reload callback {callback.__qualname__} failed")
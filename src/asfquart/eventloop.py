@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""ASFQuart - Event loop selection
+
+runx() runs apps on the stock asyncio event loop by default. uvloop (pip install asfquart[uvloop]) is a
+drop-in replacement built on libuv, with faster networking and scheduling. Choose the event loop with
+runx(event_loop=...), construct(event_loop=...), or in config.yaml:
+
+  EVENT_LOOP: auto      # uvloop if installed, asyncio otherwise
+  EVENT_LOOP: uvloop    # uvloop, falling back to asyncio (with a warning) if not installed
+  EVENT_LOOP: asyncio   # The default
+"""
+
+import asyncio
+import logging
+
+try:
+    import uvloop
+    UVLOOP_SUPPORTED = True
+except ImportError:
+    UVLOOP_SUPPORTED = False
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_EVENT_LOOP = "asyncio"
+EVENT_LOOPS = ("asyncio", "uvloop", "auto")
+
+
+def resolve(name: str = DEFAULT_EVENT_LOOP) -> str:
+    """Returns the event loop implementation ("asyncio" or "uvloop") that NAME stands for here."""
+    if name not in EVENT_LOOPS:
+        raise ValueError(f"Unknown event loop {name!r}, expected one of: {', '.join(EVENT_LOOPS)}")
+    if name == "asyncio":
+        return name
+    if UVLOOP_SUPPORTED:
+        return "uvloop"
+    if name == "uvloop":
+        LOGGER.warning("uvloop is not installed (pip install asfquart[uvloop]), using the asyncio event loop")
+    return "asyncio"
+
+
+def new_event_loop(name: str = DEFAULT_EVENT_LOOP) -> asyncio.AbstractEventLoop:
+    """Creates a new event loop of the implementation NAME stands for, see resolve()."""
+    if resolve(name) == "uvloop":
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 """Generic endpoints for ASFQuart"""
 
+import asyncio
 import secrets
 import urllib
 import urllib.parse
 import time
 
 import quart
-import aiohttp
+import itsdangerous
 
 import asfquart  # implies .session
 
@@ -16,11 +17,110 @@ import asfquart  # implies .session
 OAUTH_URL_INIT = "https://oauth.apache.org/auth-oidc?state=%s&redirect_uri=%s"
 OAUTH_URL_CALLBACK = "https://oauth.apache.org/token-oidc?code=%s"
 DEFAULT_OAUTH_URI = "/auth"
+DEFAULT_MAX_PENDING_STATES = 10000  # Max number of OAuth logins in progress at any time
+STATE_SWEEP_INTERVAL = 60  # Drop expired OAuth states every minute
+STATE_SIGNER_SALT = "asfquart.oauth.state"
 
-def setup_oauth(app, uri=DEFAULT_OAUTH_URI, workflow_timeout: int = 900):
+
+class PendingStates:
+    """Process-local store of OAuth logins in progress, mapping each state to its login redirect URI.
+
+    Abandoned logins expire after the workflow timeout, and at most max_pending_states can be pending;
+    beyond that, the oldest are dropped. Either way, the store cannot be grown without bound by hitting
+    the login URL. Expired states should be dropped periodically with purge().
+    """
+
+    process_local = True  # Logins cannot complete on another worker process, see asfquart.prefork
+
+    def __init__(self, workflow_timeout: int, max_pending_states: int = DEFAULT_MAX_PENDING_STATES):
+        self.workflow_timeout = workflow_timeout
+        self.states = asfquart.cache.AsyncCache(max_size=max_pending_states, ttl=workflow_timeout)
+
+    def __len__(self):
+        return len(self.states)
+
+    def issue(self, login_uri: str | None) -> str:
+        """Starts a login, returning its OAuth state."""
+        state = secrets.token_hex(16)
+        # Save the time we initialized this state and the optional login redirect URI
+        self.states.set(state, [time.time(), login_uri])
+        return state
+
+    def claim(self, state: str) -> tuple[bool, str | None]:
+        """Completes the login of STATE. Returns whether it was valid, and its login redirect URI."""
+        # grab the state data before using it
+        # This ensures it can only be used once
+        state_data = self.states.pop(state)  # safe pop
+        if state_data is None or state_data[0] < (time.time() - self.workflow_timeout):
+            return False, None
+        return True, state_data[1]
+
+    def purge(self):
+        self.states.purge()
+
+    def stats(self) -> dict:
+        return self.states.stats()
+
+
+class SignedStates(PendingStates):
+    """Stateless OAuth states, for deployments where the callback may land on another process or host.
+
+    The state is a timestamped token signed with the app secret key, carrying the login redirect URI and
+    a random nonce, so any process sharing the secret key can verify it. To keep states single-use, the
+    nonces of claimed states are remembered (per process) until the states would have expired anyway.
+
+    As anyone can get valid states from the login URL, this replay filter has no size limit: evicting
+    the nonces of unexpired states would make them replayable. Instead, nonces are grouped by the
+    workflow_timeout-long period their state was issued in, and purge() drops whole periods once all
+    their states have expired. max_pending_states does not apply.
+    """
+
+    process_local = False
+
+    def __init__(self, secret_key: str | bytes, workflow_timeout: int,
+                 max_pending_states: int = DEFAULT_MAX_PENDING_STATES):
+        self.workflow_timeout = workflow_timeout
+        self.signer = itsdangerous.URLSafeTimedSerializer(secret_key, salt=STATE_SIGNER_SALT)
+        self.claimed: dict[int, set[str]] = {}  # Issue period -> nonces of the states claimed
+
+    def __len__(self):
+        return sum(len(nonces) for nonces in self.claimed.values())
+
+    def _period(self, timestamp: float) -> int:
+        return int(timestamp // self.workflow_timeout)
+
+    def issue(self, login_uri: str | None) -> str:
+        return self.signer.dumps([secrets.token_hex(8), login_uri])
+
+    def claim(self, state: str) -> tuple[bool, str | None]:
+        try:
+            (nonce, login_uri), issued = self.signer.loads(state, max_age=self.workflow_timeout, return_timestamp=True)
+        except (itsdangerous.BadData, TypeError, ValueError):
+            return False, None
+        nonces = self.claimed.setdefault(self._period(issued.timestamp()), set())
+        if nonce in nonces:  # Replayed
+            return False, None
+        nonces.add(nonce)
+        return True, login_uri
+
+    def purge(self):
+        # States issued in a period expire before the end of the next one.
+        current = self._period(time.time())
+        for period in [period for period in self.claimed if period < current - 1]:
+            del self.claimed[period]
+
+    def stats(self) -> dict:
+        return {"size": len(self), "periods": len(self.claimed)}
+
+
+def setup_oauth(app, uri=DEFAULT_OAUTH_URI, workflow_timeout: int = 900,
+                max_pending_states: int = DEFAULT_MAX_PENDING_STATES, stateless: bool | None = None):
     """Sets up a generic ASF OAuth endpoint for the given app. The default URI is /auth, and the
     default workflow timeout is 900 seconds (15 min), within which the OAuth login must
-    be completed. The OAuth endpoint handles everything related to logging in and out via OAuth,
+    be completed. At most max_pending_states logins can be in progress; beyond that, the oldest
+    ones are dropped (this does not apply to stateless states). If stateless is set (default: the OAUTH_STATELESS config option), states are
+    signed tokens that any worker sharing the app secret can verify, see SignedStates.
+    The OAuth endpoint handles everything related to logging in and out via OAuth,
     and has the following actions:
 
     - /auth?login  - Initializes an OAuth login
@@ -32,7 +132,21 @@ def setup_oauth(app, uri=DEFAULT_OAUTH_URI, workflow_timeout: int = 900):
     "ProxyPreserveHost On" in your httpd config if proxying.
     """
 
-    pending_states = {}  # keeps track of pending states and their expiry
+    if stateless is None:
+        stateless = app.cfg.get("OAUTH_STATELESS", False)
+    # Keeps track of pending states and their expiry.
+    if stateless:
+        pending_states = SignedStates(app.secret_key, workflow_timeout, max_pending_states)
+    else:
+        pending_states = PendingStates(workflow_timeout, max_pending_states)
+    app.oauth_states = pending_states  # Exposed for its stats()
+
+    async def sweep_states():
+        while True:
+            await asyncio.sleep(min(STATE_SWEEP_INTERVAL, workflow_timeout))
+            pending_states.purge()
+
+    app.add_runner(sweep_states, name=f"OAuthStates:{app.app_id}")
 
     @app.route(uri, methods=["GET", "POST"])
     async def oauth_endpoint():
@@ -54,9 +168,7 @@ def setup_oauth(app, uri=DEFAULT_OAUTH_URI, workflow_timeout: int = 900):
                     response="Invalid redirect URI.\n",
                     content_type="text/plain; charset=utf-8"
                 )
-            state = secrets.token_hex(16)
-            # Save the time we initialized this state and the optional login redirect URI
-            pending_states[state] = [time.time(), login_uri]
+            state = pending_states.issue(login_uri)
             callback_host = quart.request.host_url.replace("http://", "https://")  # Enforce HTTPS
             callback_url = urllib.parse.urljoin(  # NOTE: the uri MUST start with a single forward slash!
                 callback_host,
@@ -90,27 +202,24 @@ def setup_oauth(app, uri=DEFAULT_OAUTH_URI, workflow_timeout: int = 900):
             code = quart.request.args.get("code")
             state = quart.request.args.get("state")
             if code and state:  # Callback from oauth, complete flow.
-                # grab the state data before using it
-                # This ensures it can only be used once
-                state_data = pending_states.pop(state, None)  # safe pop
-                if state_data is None or state_data[0] < (time.time() - workflow_timeout):                    
+                valid, redirect_uri = pending_states.claim(state)
+                if not valid:
                     return quart.Response(
                         status=403,
                         response=f"Invalid or expired OAuth state provided. OAuth workflows must be completed within {workflow_timeout} seconds.\n",
                         content_type="text/plain; charset=utf-8"
                     )
-                redirect_uri = state_data[1]
-                ct = aiohttp.client.ClientTimeout(sock_read=15)
-                async with aiohttp.client.ClientSession(timeout=ct) as session:
-                    rv = await session.get(OAUTH_URL_CALLBACK % code)
-                    if rv.status != 200:
-                        return quart.Response(
-                            status=403,
-                            response="OAuth authentication failed.\n",
-                            content_type="text/plain; charset=utf-8"
-                        )
-                    oauth_data = await rv.json()
-                    asfquart.session.write(oauth_data)
+                # Codes can only be exchanged once: a retry after the server did the exchange would fail the login.
+                rv = await app.http.get(OAUTH_URL_CALLBACK % code, retries=0)
+                if rv.status != 200:
+                    rv.release()
+                    return quart.Response(
+                        status=403,
+                        response="OAuth authentication failed.\n",
+                        content_type="text/plain; charset=utf-8"
+                    )
+                oauth_data = await rv.json()
+                asfquart.session.write(oauth_data)
                 if redirect_uri:  # if called with /auth=login=/foo, redirect to /foo
                     # If SameSite is set, we cannot redirect with a 30x response, as that may invalidate the set-cookie
                     # instead, we issue a 200 Okay with a Refresh header, instructing the browser to immediately go
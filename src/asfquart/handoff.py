@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""ASFQuart - Graceful reloads
+
+By default, reloading an app run by runx() (after a file change, or on SIGUSR2) re-executes the process:
+the listening socket is closed until the new interpreter is up again, and requests still in flight are
+cancelled. With graceful reloads, enabled in config.yaml:
+
+  GRACEFUL_RELOAD: true
+  DRAIN_TIMEOUT: 10      # Seconds allowed for in-flight requests to finish when we stop serving
+  HANDOFF_TIMEOUT: 60    # Seconds allowed for the new process to start serving
+
+a reload starts a new process with the same command line instead, which inherits the listening sockets.
+Once it is serving, the old process stops accepting connections, lets the requests in flight finish (for
+up to DRAIN_TIMEOUT seconds), logs how long that took and how many requests were dropped, then exits.
+Connections arriving in the meantime are queued on the shared socket, so none are refused. If the new
+process fails to start serving, the old one logs an error and carries on.
+
+As the process ID of the app changes with every reload, process supervisors must not consider the exit of
+the old process to be the end of the app (for systemd, use KillMode=none or Type=forking with a PIDFile).
+"""
+
+import asyncio
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DRAIN_TIMEOUT = 10
+DEFAULT_HANDOFF_TIMEOUT = 60
+
+# Environment variables passing the inherited listening sockets, and the pipe to report being ready on.
+LISTEN_FDS_ENV = "ASFQUART_LISTEN_FDS"
+READY_FD_ENV = "ASFQUART_READY_FD"
+
+
+class DrainStats:
+    """Progress of draining the requests in flight when the app stopped accepting connections."""
+
+    __slots__ = ("in_flight", "started", "deadline", "finished", "dropped")
+
+    def __init__(self, in_flight: int, timeout: float):
+        self.in_flight = in_flight  # Requests in flight when draining started
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout  # Requests still running by then are cancelled
+        self.finished = None
+        self.dropped = 0
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def __repr__(self):
+        return f"<DrainStats in_flight={self.in_flight} dropped={self.dropped} seconds={self.seconds:.3f}>"
+
+
+def inherit_sockets(config) -> list[int]:
+    """Binds the hypercorn CONFIG to the listening sockets inherited from the previous process. The first
+    process creates them from CONFIG instead. Either way, new processes started by start_successor() will
+    inherit them. Returns their file descriptors."""
+    inherited = os.environ.get(LISTEN_FDS_ENV)
+    if inherited:
+        fds = [int(fd) for fd in inherited.split(",")]
+    else:
+        sockets = config.create_sockets()
+        # Hypercorn opens its own socket objects on the descriptors, so ours must not close them.
+        fds = [sock.detach() for sock in (*sockets.secure_sockets, *sockets.insecure_sockets)]
+        os.environ[LISTEN_FDS_ENV] = ",".join(str(fd) for fd in fds)
+    config.bind = [f"fd://{fd}" for fd in fds]
+    config.insecure_bind = []
+    return fds
+
+
+def command_line() -> list[str]:
+    """The command line that started this process, as used by quart.utils.restart()."""
+    script_path = pathlib.Path(sys.argv[0]).resolve()
+    args = sys.argv[1:]
+    main_package = sys.modules["__main__"].__package__
+    if main_package is None:  # Executed by filename
+        if script_path.is_file() and os.access(script_path, os.X_OK):
+            return [str(script_path), *args]
+        return [sys.executable, str(script_path), *args]
+    # Executed as a module, eg. python -m run
+    import_name = main_package
+    if script_path.stem != "__main__":
+        import_name = f"{main_package}.{script_path.stem}"
+    return [sys.executable, "-m", import_name.lstrip("."), *args]
+
+
+async def start_successor(fds, timeout: float = DEFAULT_HANDOFF_TIMEOUT) -> bool:
+    """Starts a new process with our command line, passing it the listening sockets FDS, and waits for
+    it to report that it is serving (see notify_ready()). If it exits or does not report within TIMEOUT
+    seconds, it is terminated. Returns whether the new process is serving."""
+    loop = asyncio.get_running_loop()
+    ready_r, ready_w = os.pipe()
+    try:
+        proc = subprocess.Popen(  # pylint: disable=consider-using-with
+            command_line(),
+            env=dict(os.environ, **{LISTEN_FDS_ENV: ",".join(str(fd) for fd in fds), READY_FD_ENV: str(ready_w)}),
+            pass_fds=(*fds, ready_w),
+        )
+    except OSError as e:
+        LOGGER.error(f"HANDOFF: Could not start a new process: {e}")
+        os.close(ready_r)
+        return False
+    finally:
+        os.close(ready_w)  # Only the new process may write to it, so we get EOF if it dies.
+
+    reported = loop.create_future()
+    def _on_readable():
+        if not reported.done():
+            reported.set_result(os.read(ready_r, 1))
+    loop.add_reader(ready_r, _on_readable)
+    try:
+        ready = await asyncio.wait_for(reported, timeout) == b"1"
+    except asyncio.TimeoutError:
+        ready = False
+    finally:
+        loop.remove_reader(ready_r)
+        os.close(ready_r)
+
+    if ready:
+        LOGGER.info(f"HANDOFF: Process {proc.pid} is now serving")
+        return True
+    LOGGER.error(f"HANDOFF: Process {proc.pid} did not start serving, keeping the current process")
+    proc.terminate()
+    await asyncio.to_thread(proc.wait)
+    return False
+
+
+def notify_ready():
+    """Reports to the process that started us (if any) that we are now serving."""
+    ready_fd = os.environ.pop(READY_FD_ENV, None)  # Our own successors get a pipe of their own.
+    if ready_fd is None:
+        return
+    try:
+        os.write(int(ready_fd), b"1")
+    finally:
+        os.close(int(ready_fd))
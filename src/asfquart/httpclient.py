@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""ASFQuart - App-wide HTTP client
+
+USAGE:
+
+  async def some_endpoint():
+      rv = await asfquart.APP.http.request("GET", "https://example.org/api/foo")
+      data = await rv.json()  # Reading the body returns the connection to the pool
+
+Every app has one HTTP client, shared by asfquart (eg. the OAuth token exchange) and the application.
+Connections are kept alive and pooled, DNS lookups are cached, and requests failing on connection
+errors, timeouts or transient (502/503/504) responses are retried with jittered exponential backoff.
+Only idempotent requests are retried by default; pass retries=N to retry others, such as POST.
+The client is closed when the app stops serving. The following options can be set in config.yaml, and
+take effect when it is reloaded (see reconfigure()):
+
+  HTTP_TIMEOUT: 30          # Total time allowed for a request, in seconds
+  HTTP_CONNECT_TIMEOUT: 10  # Time allowed to connect (including waiting for a pooled connection)
+  HTTP_POOL_SIZE: 100       # Max number of open connections
+  HTTP_DNS_CACHE_TTL: 300   # Seconds to cache DNS lookups for
+  HTTP_RETRIES: 2           # Number of retries for failed requests
+  HTTP_RETRY_BACKOFF: 0.5   # Base delay between retries, in seconds
+"""
+
+import asyncio
+import logging
+import random
+
+import aiohttp
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 100
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 0.5
+RETRY_STATUSES = frozenset({502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+# Settings the aiohttp session is built with, so that changing them needs a new one
+SESSION_SETTINGS = ("HTTP_TIMEOUT", "HTTP_CONNECT_TIMEOUT", "HTTP_POOL_SIZE", "HTTP_DNS_CACHE_TTL")
+
+
+class HTTPClient:
+    """Pooled HTTP client, configured from CFG (read when the first request is made)."""
+
+    def __init__(self, cfg: dict | None = None):
+        self.cfg = cfg if cfg is not None else {}
+        self._session: aiohttp.ClientSession | None = None
+        self._retiring = set()  # Tasks closing sessions replaced by reconfigure()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The underlying aiohttp session, created on first use within the running event loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.cfg.get("HTTP_POOL_SIZE", DEFAULT_POOL_SIZE),
+                ttl_dns_cache=self.cfg.get("HTTP_DNS_CACHE_TTL", DEFAULT_DNS_CACHE_TTL),
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=self.cfg.get("HTTP_TIMEOUT", DEFAULT_TIMEOUT),
+                connect=self.cfg.get("HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def request(self, method: str, url: str, *, retries: int | None = None, **kw) -> aiohttp.ClientResponse:
+        """Performs a request, retrying transient failures, and returns the response. Any other keyword
+        arguments are passed on to aiohttp. The caller must read or release() the response."""
+        if retries is None:
+            retries = self.cfg.get("HTTP_RETRIES", DEFAULT_RETRIES) if method.upper() in IDEMPOTENT_METHODS else 0
+        backoff = self.cfg.get("HTTP_RETRY_BACKOFF", DEFAULT_RETRY_BACKOFF)
+        attempt = 0
+        while True:
+            try:
+                rv = await self.session.request(method, url, **kw)
+                if rv.status not in RETRY_STATUSES or attempt >= retries:
+                    return rv
+                rv.release()
+                reason = f"HTTP {rv.status}"
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= retries:
+                    raise
+                reason = repr(e)
+            # Jitter the backoff, so clients failing together do not retry together.
+            delay = backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            attempt += 1
+            LOGGER.debug(f"{method} {url} failed ({reason}), retry {attempt}/{retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kw) -> aiohttp.ClientResponse:
+        return await self.request("GET", url, **kw)
+
+    async def post(self, url: str, **kw) -> aiohttp.ClientResponse:
+        return await self.request("POST", url, **kw)
+
+    async def reconfigure(self, cfg: dict):
+        """Applies a new configuration. Retry settings apply to requests made from now on. If connection
+        settings (timeouts, pool size, DNS cache) changed, requests made from now on also go through a new
+        session; the current one is closed once requests in flight on it have had time to complete."""
+        old_cfg, self.cfg = self.cfg, cfg
+        if self._session is None or all(old_cfg.get(key) == cfg.get(key) for key in SESSION_SETTINGS):
+            return
+        old_session, self._session = self._session, None
+        grace = old_cfg.get("HTTP_TIMEOUT", DEFAULT_TIMEOUT) or DEFAULT_TIMEOUT
+        task = asyncio.get_running_loop().create_task(self._retire(old_session, grace))
+        self._retiring.add(task)  # Keep a reference until done
+        task.add_done_callback(self._retiring.discard)
+
+    @staticmethod
+    async def _retire(session: aiohttp.ClientSession, grace: float):
+        try:
+            await asyncio.sleep(grace)
+        finally:
+            await session.close()
+
+    async def close(self):
+        for task in list(self._retiring):
+            task.cancel()  # Closes its session right away
+        await asyncio.gather(*self._retiring, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def lifespan(self):
+        """Closes the client when the app stops serving, see Quart.while_serving()."""
+        yield
+        await self.close()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""ASFQuart - Fast JSON provider
+
+Quart encodes responses (such as dicts returned by endpoints) with the stdlib json module. This provider uses
+orjson instead, when installed (pip install asfquart[fastjson]), and the stdlib otherwise. Either way, it also
+encodes client sessions (and other mappings), sets (as sorted lists) and dates/times (as ISO 8601 strings).
+Enable it in config.yaml:
+
+  FAST_JSON: true
+"""
+
+import collections.abc
+import datetime
+import json
+
+import quart.json.provider
+
+try:
+    import orjson
+    ORJSON_SUPPORTED = True
+except ImportError:
+    ORJSON_SUPPORTED = False
+
+# Arguments to json.dumps() that orjson can honour. Any other argument means falling back to the stdlib.
+_ORJSON_DUMPS_ARGS = frozenset({"default", "sort_keys", "indent", "separators", "ensure_ascii"})
+
+
+def _default(o):
+    """Encodes the types that neither json nor orjson handle by default."""
+    as_dict = getattr(o, "as_dict", None)  # eg. asfquart.session.ClientSession
+    if callable(as_dict):
+        return as_dict()
+    if isinstance(o, collections.abc.Mapping):
+        return dict(o)
+    if isinstance(o, (set, frozenset)):
+        try:
+            return sorted(o)
+        except TypeError:  # Not all comparable
+            return list(o)
+    if isinstance(o, (datetime.date, datetime.time)):  # Also datetime.datetime, which is a date
+        return o.isoformat()
+    return quart.json.provider.DefaultJSONProvider.default(o)  # Decimals, UUIDs, dataclasses, Markup
+
+
+class FastJSONProvider(quart.json.provider.DefaultJSONProvider):
+    """JSON provider using orjson when available. Output only differs from the default provider in that
+    non-ASCII characters are not escaped, and dates are ISO 8601 rather than HTTP dates."""
+
+    default = staticmethod(_default)
+    ensure_ascii = False
+
+    def _options(self, indent=None) -> int:
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs) -> str:
+        if not ORJSON_SUPPORTED or not _ORJSON_DUMPS_ARGS.issuperset(kwargs):
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(
+            obj, default=kwargs.get("default", self.default), option=self._options(kwargs.get("indent"))
+        ).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if not ORJSON_SUPPORTED or kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if not ORJSON_SUPPORTED:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        # orjson produces bytes, which go into the response as they are.
+        data = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(data, mimetype=self.mimetype)
+
+
+def setup(app) -> FastJSONProvider:
+    """Makes APP use the fast JSON provider."""
+    app.json = FastJSONProvider(app)
+    return app.json
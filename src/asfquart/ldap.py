@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 """ASFQuart - LDAP Authentication methods and decorators"""
-from . import base
+from . import base, cache
 import re
 import time
+import asyncio
+import contextlib
+import concurrent.futures
+import logging
+import collections
+import hashlib
+import hmac
+import secrets
 
 DEFAULT_LDAP_URI = "ldaps://ldap-eu.apache.org:636"
 DEFAULT_LDAP_BASE = "uid=%s,ou=people,dc=apache,dc=org"
@@ -12,6 +20,17 @@ GROUP_RE = re.compile(r"^(?:cn=)?([^,]+)")
 DEFAULT_MEMBER_ATTR = "member"
 DEFAULT_OWNER_ATTR = "owner"
 DEFAULT_LDAP_CACHE_TTL = 3600  # Cache LDAP lookups for one hour
+DEFAULT_LDAP_CACHE_SIZE = 4096  # ...for at most this many users
+DEFAULT_LDAP_POOL_SIZE = 8  # Max number of concurrent LDAP connections per app
+DEFAULT_LDAP_HEALTH_INTERVAL = 60  # Check the service connection once a minute
+DEFAULT_CREDENTIAL_TTL = 0  # Verified credentials are not cached unless configured
+DEFAULT_CREDENTIAL_CACHE_SIZE = 1024  # Max number of cached credential checks
+DEFAULT_FAILURE_BACKOFF = 1  # Reject a failed uid/password pair for one second...
+DEFAULT_FAILURE_BACKOFF_MAX = 300  # ...doubling on each failure, up to five minutes
+DEFAULT_INDEX_REFRESH = 600  # Rescan all groups in the background every ten minutes
+INDEX_TTL_REFRESHES = 2  # The index stays fresh for at least this many refresh intervals, so a late one is survived
+
+LOGGER = logging.getLogger(__name__)
 
 # Test if LDAP is enabled for this quart app, and if so, enable LDAP Auth support
 # This assumes the quart app was installed with asfpy[aioldap] in the Pipfile.
@@ -19,49 +38,371 @@ try:
     import asfpy.aioldap
     import bonsai.errors
     LDAP_SUPPORTED = True
+    AuthenticationError = bonsai.errors.AuthenticationError
 except ModuleNotFoundError:
     LDAP_SUPPORTED = False
 
-LDAP_CACHE: dict[str, list] = {}  # Temporary one-hour cache to speed up lookups.
+    class AuthenticationError(Exception):
+        """Stand-in for bonsai.errors.AuthenticationError when bonsai is not installed."""
+
+# Temporary one-hour cache of user affiliations to speed up lookups.
+LDAP_CACHE = cache.AsyncCache(max_size=DEFAULT_LDAP_CACHE_SIZE, ttl=DEFAULT_LDAP_CACHE_TTL)
+
+
+def _bonsai_connect(uri: str, dn: str, password: str, executor: concurrent.futures.Executor):
+    """Opens a bound LDAP connection. Must run inside one of the EXECUTOR threads, see asfpy.aioldap."""
+    client = bonsai.LDAPClient(uri)
+    client.set_credentials("SIMPLE", dn, password)
+    client.set_cert_policy("allow")
+    return asfpy.aioldap.ASF_LDAPConnection(client, executor)
+
+
+class CredentialCache:
+    """Short-lived cache of LDAP bind outcomes, so repeat Basic-auth requests can skip the bind.
+
+    Passwords are never stored: entries are keyed by uid plus an HMAC of the password, using a
+    random key that only lives in this process. Successful binds are remembered for TTL seconds.
+    Failed binds are remembered as well, with an exponential backoff, so a client retrying with
+    the same bad password does not hammer LDAP. Both maps are bounded to MAX_ENTRIES, evicting
+    the least recently used entry. A TTL of zero disables the cache.
+    """
+
+    def __init__(
+        self,
+        ttl: int = DEFAULT_CREDENTIAL_TTL,
+        max_entries: int = DEFAULT_CREDENTIAL_CACHE_SIZE,
+        backoff: int = DEFAULT_FAILURE_BACKOFF,
+        max_backoff: int = DEFAULT_FAILURE_BACKOFF_MAX,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._hmac_key = secrets.token_bytes(32)
+        self._verified: collections.OrderedDict[tuple, float] = collections.OrderedDict()  # key -> expiry
+        self._failed: collections.OrderedDict[tuple, tuple] = collections.OrderedDict()  # key -> (failures, retry at)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _key(self, uid: str, password: str) -> tuple:
+        return uid, hmac.new(self._hmac_key, password.encode("utf-8"), hashlib.sha256).digest()
+
+    def _store(self, entries: collections.OrderedDict, key: tuple, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def check(self, uid: str, password: str) -> bool | None:
+        """Returns True if these credentials were recently verified, False if they were recently
+        rejected, and None if they need to be checked against LDAP."""
+        if not self.enabled:
+            return None
+        key = self._key(uid, password)
+        now = time.time()
+        expiry = self._verified.get(key)
+        if expiry is not None:
+            if expiry > now:
+                self._verified.move_to_end(key)
+                return True
+            del self._verified[key]
+        failure = self._failed.get(key)
+        if failure is not None and failure[1] > now:
+            return False
+        return None
+
+    def success(self, uid: str, password: str):
+        """Records a successful bind."""
+        if self.enabled:
+            key = self._key(uid, password)
+            self._failed.pop(key, None)
+            self._store(self._verified, key, time.time() + self.ttl)
+
+    def failure(self, uid: str, password: str):
+        """Records a failed bind, backing off further on each repeated failure."""
+        if self.enabled:
+            key = self._key(uid, password)
+            self._verified.pop(key, None)
+            failures = self._failed.get(key, (0, 0))[0] + 1
+            delay = min(self.backoff * 2 ** (failures - 1), self.max_backoff)
+            self._store(self._failed, key, (failures, time.time() + delay))
+
+    def clear(self):
+        self._verified.clear()
+        self._failed.clear()
+
+
+class MembershipIndex:
+    """App-wide inverted index of project groups, mapping each member DN to the projects it belongs to.
+
+    The index is built from a single scan of all project groups, and swapped in atomically, so
+    looking up the affiliations of any user is a dict lookup. It is considered stale after TTL
+    seconds, at which point the next lookup (or the background refresh, see LDAPPool) rescans.
+    """
+
+    def __init__(self, attrs=(DEFAULT_MEMBER_ATTR, DEFAULT_OWNER_ATTR), ttl: int = DEFAULT_LDAP_CACHE_TTL):
+        self.attrs = tuple(attrs)
+        self.ttl = ttl
+        self.updated = 0
+        self._index: dict[str, dict[str, list]] = {}
+
+    @property
+    def fresh(self) -> bool:
+        return self.updated > (time.time() - self.ttl)
+
+    def __len__(self):
+        return len(self._index)
+
+    def load(self, groups: list):
+        """Rebuilds the index from the result of a group search."""
+        index = {}
+        for project in groups:
+            if "dn" in project and any(xattr in project for xattr in self.attrs):
+                dn_match = GROUP_RE.match(str(project["dn"]))
+                if dn_match:
+                    project_name = dn_match.group(1)
+                    for xattr in self.attrs:
+                        for dn in project.get(xattr, []):
+                            affiliations = index.get(dn)
+                            if affiliations is None:
+                                affiliations = index[dn] = {attr: [] for attr in self.attrs}
+                            affiliations[xattr].append(project_name)
+        self._index = index
+        self.updated = time.time()
+
+    def lookup(self, dn: str) -> dict[str, list]:
+        """Returns the projects DN belongs to, for each membership attribute."""
+        affiliations = self._index.get(dn)
+        if affiliations is None:
+            return {attr: [] for attr in self.attrs}
+        return {attr: list(projects) for attr, projects in affiliations.items()}
+
+
+class LDAPPool:
+    """App-lifetime manager of LDAP connections, shared by all Basic-auth requests.
+
+    All connections share one bounded thread pool, and at most MAX_SIZE user binds are in flight at
+    any time. If a service account is configured, group searches go through a single persistent
+    connection bound as that account, which is health-checked in the background by run(). As asfpy
+    connections cannot run two operations at once, searches and health checks take turns on it.
+    Without one, searches are performed over the user's own bind, as before.
+
+    CONNECT is a blocking callable of (uri, dn, password, executor) returning a connection with
+    async search()/whoami() methods and a close() method. It defaults to asfpy.aioldap, and can be
+    replaced by a fake for testing.
+
+    CREDENTIALS is an optional CredentialCache of recent bind outcomes, disabled by default.
+
+    The pool also holds the MembershipIndex used for all user lookups. With a service account,
+    refresh_forever() keeps it up to date in the background, every INDEX_REFRESH seconds.
+    """
+
+    def __init__(
+        self,
+        uri: str = DEFAULT_LDAP_URI,
+        service_dn: str | None = None,
+        service_password: str | None = None,
+        max_size: int = DEFAULT_LDAP_POOL_SIZE,
+        health_interval: int = DEFAULT_LDAP_HEALTH_INTERVAL,
+        connect=None,
+        credentials: CredentialCache | None = None,
+        index_refresh: int = DEFAULT_INDEX_REFRESH,
+    ):
+        self.uri = uri
+        self.service_dn = service_dn
+        self.service_password = service_password
+        self.max_size = max_size
+        self.health_interval = health_interval
+        self.connect = connect or _bonsai_connect
+        self.credentials = credentials or CredentialCache()
+        self.index = MembershipIndex(ttl=max(DEFAULT_LDAP_CACHE_TTL, index_refresh * INDEX_TTL_REFRESHES))
+        self.index_refresh = index_refresh
+        self._index_lock = asyncio.Lock()
+        # One extra thread for the service connection, so user binds can never starve it.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_size + 1, thread_name_prefix="asfquart-ldap")
+        self.slots = asyncio.Semaphore(max_size)
+        self._service_conn = None
+        self._service_lock = asyncio.Lock()  # Held while (re)connecting the service connection
+        self._service_busy = asyncio.Lock()  # Held while an operation runs on the service connection
+
+    @classmethod
+    def from_config(cls, cfg: dict, **kw):
+        """Constructs a pool from the LDAP_* settings in the app configuration."""
+        return cls(
+            uri=cfg.get("LDAP_URI", DEFAULT_LDAP_URI),
+            service_dn=cfg.get("LDAP_SERVICE_DN"),
+            service_password=cfg.get("LDAP_SERVICE_PASSWORD"),
+            max_size=cfg.get("LDAP_POOL_SIZE", DEFAULT_LDAP_POOL_SIZE),
+            health_interval=cfg.get("LDAP_HEALTH_INTERVAL", DEFAULT_LDAP_HEALTH_INTERVAL),
+            credentials=CredentialCache(
+                ttl=cfg.get("LDAP_CREDENTIAL_TTL", DEFAULT_CREDENTIAL_TTL),
+                max_entries=cfg.get("LDAP_CREDENTIAL_CACHE_SIZE", DEFAULT_CREDENTIAL_CACHE_SIZE),
+                backoff=cfg.get("LDAP_FAILURE_BACKOFF", DEFAULT_FAILURE_BACKOFF),
+                max_backoff=cfg.get("LDAP_FAILURE_BACKOFF_MAX", DEFAULT_FAILURE_BACKOFF_MAX),
+            ),
+            index_refresh=cfg.get("LDAP_INDEX_REFRESH", DEFAULT_INDEX_REFRESH),
+            **kw,
+        )
+
+    @property
+    def has_service(self) -> bool:
+        return bool(self.service_dn)
+
+    async def _open(self, dn: str, password: str):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.connect, self.uri, dn, password, self.executor)
+
+    @contextlib.asynccontextmanager
+    async def bind(self, dn: str, password: str):
+        """Binds as DN, proving the password, and yields the connection. Raises on invalid credentials."""
+        async with self.slots:
+            conn = await self._open(dn, password)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    async def service(self):
+        """Returns the persistent service connection, (re)connecting it if needed."""
+        async with self._service_lock:
+            if self._service_conn is None:
+                self._service_conn = await self._open(self.service_dn, self.service_password)
+            return self._service_conn
+
+    def _drop_service(self, conn):
+        if conn is not None and conn is self._service_conn:
+            self._service_conn = None
+            with contextlib.suppress(Exception):
+                conn.close()
+
+    async def search(self, base: str, attrs: list, user_conn=None):
+        """Searches BASE, over the service connection if there is one, otherwise over USER_CONN."""
+        if not self.has_service:
+            return await user_conn.search(base, attrs)
+        async with self._service_busy:
+            conn = await self.service()
+            try:
+                return await conn.search(base, attrs)
+            except Exception:
+                # Assume the connection went stale, and retry once on a fresh one.
+                self._drop_service(conn)
+                conn = await self.service()
+                return await conn.search(base, attrs)
+
+    async def check_health(self) -> bool:
+        """Probes the service connection, replacing it if it no longer responds."""
+        if not self.has_service:
+            return True
+        conn = None
+        async with self._service_busy:
+            try:
+                conn = await self.service()
+                await conn.whoami()
+                return True
+            except Exception as e:
+                LOGGER.warning(f"LDAP service connection failed health check: {e}")
+                self._drop_service(conn)
+                return False
+
+    async def refresh_index(self, user_conn=None, force: bool = False):
+        """Rescans all project groups into the membership index, unless it is already fresh.
+        Concurrent callers wait for a single scan."""
+        async with self._index_lock:
+            if self.index.fresh and not force:
+                return
+            rv = await self.search(DEFAULT_LDAP_GROUP_BASE, list(self.index.attrs), user_conn=user_conn)
+            if not rv:
+                raise Exception("Empty result set returned by LDAP")  # pylint: disable=broad-exception-raised
+            self.index.load(rv)
+
+    async def refresh_forever(self):
+        """Long-running task keeping the membership index fresh, see QuartApp.add_runner()."""
+        while True:
+            try:
+                await self.refresh_index(force=True)
+            except Exception as e:
+                # Keep serving from the previous index, it will be retried on the next round.
+                LOGGER.warning(f"Could not refresh LDAP membership index: {e}")
+            await asyncio.sleep(self.index_refresh)
+
+    def close(self):
+        """Closes the service connection and releases the thread pool."""
+        self.credentials.clear()
+        self._drop_service(self._service_conn)
+        self.executor.shutdown(wait=False)
+
+    async def run(self):
+        """Long-running health check task, see QuartApp.add_runner(). Closes the pool on cancellation."""
+        try:
+            while True:
+                await self.check_health()
+                await asyncio.sleep(self.health_interval)
+        finally:
+            self.close()
+
+
+def setup_pool(app, **kw) -> LDAPPool:
+    """Sets up the app-wide LDAP pool from the app configuration, and ties its lifetime to the app."""
+    app.ldap_pool = LDAPPool.from_config(app.cfg, **kw)
+    app.add_runner(app.ldap_pool.run, name=f"LDAP:{app.app_id}")
+    # Group scans need credentials of their own to run in the background.
+    if app.ldap_pool.has_service:
+        app.add_runner(app.ldap_pool.refresh_forever, name=f"LDAPIndex:{app.app_id}")
+    return app.ldap_pool
 
 
 class LDAPClient:
-    def __init__(self, username: str, password: str):
+    def __init__(self, username: str, password: str, pool: LDAPPool | None = None):
         self.userid = username
         self.dn = DEFAULT_LDAP_BASE % username
-        self.client = asfpy.aioldap.LDAPClient(DEFAULT_LDAP_URI, self.dn, password)
+        self.password = password
+        # Without an app-wide pool, fall back to a private one for this lookup.
+        self.owns_pool = pool is None
+        self.pool = pool or LDAPPool(max_size=1)
+
+    @contextlib.asynccontextmanager
+    async def bind(self):
+        """Binds as this user, recording the outcome in the credential cache of the pool."""
+        try:
+            async with self.pool.bind(self.dn, self.password) as conn:
+                self.pool.credentials.success(self.userid, self.password)
+                yield conn
+        except AuthenticationError:
+            self.pool.credentials.failure(self.userid, self.password)
+            raise
 
     async def get_affiliations(self):
         """Scans for which projects this user is a part of. Returns a dict with memberships of each
         pmc/committer role (member/owner in LDAP)"""
-        all_projects = DEFAULT_LDAP_GROUP_BASE
-        attrs = [DEFAULT_MEMBER_ATTR, DEFAULT_OWNER_ATTR]
         # Check LDAP cache. If found, we only need to test LDAP auth
         try:
-            if self.userid in LDAP_CACHE and LDAP_CACHE[self.userid][0] > (time.time() - DEFAULT_LDAP_CACHE_TTL):
-                async with self.client.connect():
-                    pass
-            else:
-                ldap_groups = {attr: [] for attr in attrs}
-                async with self.client.connect() as conn:
-                    rv = await conn.search(all_projects, attrs)
-                    if not rv:
-                        raise Exception("Empty result set returned by LDAP")  # pylint: disable=broad-exception-raised
-                    for project in rv:
-                        if "dn" in project and any(xattr in project for xattr in attrs):
-                            dn_match = GROUP_RE.match(str(project["dn"]))
-                            if dn_match:
-                                project_name = dn_match.group(1)
-                                for xattr in attrs:
-                                    if self.dn in project.get(xattr, []):
-                                        ldap_groups[xattr].append(project_name)
-                    LDAP_CACHE[self.userid] = (time.time(), ldap_groups)
-            return LDAP_CACHE[self.userid][1]
-
-        except bonsai.errors.AuthenticationError as e:
+            verified = self.pool.credentials.check(self.userid, self.password)
+            if verified is False:
+                raise AuthenticationError("These credentials were recently rejected, please retry later")
+            cached = self.userid in LDAP_CACHE
+            needs_scan = not cached and not self.pool.index.fresh
+            # Without a service account, a group scan has to run over the user's own bind.
+            if not verified or (needs_scan and not self.pool.has_service):
+                async with self.bind() as conn:
+                    if needs_scan:
+                        await self.pool.refresh_index(user_conn=conn)
+            elif needs_scan:
+                await self.pool.refresh_index()
+
+            async def lookup():
+                return self.pool.index.lookup(self.dn)
+
+            return await LDAP_CACHE.get_or_fetch(self.userid, lookup)
+
+        except AuthenticationError as e:
             raise base.ASFQuartException(f"Invalid credentials provided: {e}", errorcode=403)
         except Exception as e:
             print(f"Base exception during LDAP lookup: {e}")
             raise base.ASFQuartException(
                 "Could not perform LDAP authorization check, please try again later.", errorcode=500
             )
+        finally:
+            if self.owns_pool:
+                self.pool.close()
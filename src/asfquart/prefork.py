@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""ASFQuart - Pre-forked worker processes
+
+A single process runs a single event loop, using a single core. To serve an app with several processes,
+pass runx(workers=N), or set in config.yaml:
+
+  WORKERS: 4
+
+The process calling runx() then becomes a supervisor: once the app is loaded, it forks the workers, which
+all accept connections on the same listening sockets. The supervisor does not serve requests itself; it:
+
+ - watches for file changes (one watcher, rather than one per worker). Changes to the config file and data
+   files are applied by every worker (see QuartApp.reload()), other changes restart them all.
+ - restarts all workers on SIGUSR2, re-executing itself (or handing over to a new supervisor, with
+   GRACEFUL_RELOAD, see asfquart.handoff). The listening sockets stay open throughout.
+ - has the workers reload their configuration and data files on SIGHUP.
+ - stops the workers on SIGTERM/SIGINT, letting each drain its requests in flight.
+ - starts a new worker whenever one exits unexpectedly.
+
+Send signals to the supervisor, not to the workers. Runners (see QuartApp.add_runner()) run in every worker,
+except singletons, which only run in worker 0. Each worker knows its number as app.worker_id.
+
+Workers share nothing but the listening sockets, and each request may land on any of them. runx() therefore
+refuses to start several workers for an app keeping state in process memory that the next request needs:
+
+ - OAuth logins in progress (the default), as the callback may land on another worker than the login. Set
+   OAUTH_STATELESS: true, see asfquart.generics.SignedStates.
+ - server-side sessions in memory (SESSION_STORE: memory), as other workers would not find them. Use
+   SESSION_STORE: sqlite:/path/sessions.db, or the default cookie sessions.
+
+See check_shared_state().
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import signal
+import time
+
+import hypercorn.asyncio
+import quart
+
+from . import eventloop, handoff
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 1
+KILL_GRACE = 5  # Seconds allowed past DRAIN_TIMEOUT for workers to exit, before they are killed
+RESPAWN_DELAY = 1  # Minimum seconds between two starts of a worker, so a crashing worker does not spin
+ORPHAN_CHECK_INTERVAL = 1  # Seconds between checks by workers that their supervisor is still around
+REAP_INTERVAL = 0.2  # Seconds between checks for exited workers, on event loops that keep SIGCHLD to themselves
+
+
+def check_shared_state(app):
+    """Raises RuntimeError if APP keeps state in process memory that its requests rely on, so that it cannot be
+    served by several workers."""
+    problems = []
+    if getattr(app.oauth_states, "process_local", False):
+        problems.append("OAuth logins in progress are kept in memory, set OAUTH_STATELESS: true")
+    if getattr(getattr(app.session_interface, "store", None), "process_local", False):
+        problems.append("sessions are kept in memory, set SESSION_STORE to a shared store (sqlite:/path/sessions.db)")
+    if problems:
+        raise RuntimeError(f"Cannot serve {app.app_id} with several workers, as each would have its own state: {'; '.join(problems)}")
+
+
+class Supervisor:
+    """Forks the worker processes serving APP, and manages them until told to stop."""
+
+    def __init__(self, app, workers: int, hyper_config, listen_fds, graceful=False, event_loop=eventloop.DEFAULT_EVENT_LOOP):
+        self.app = app
+        self.count = workers
+        self.hyper_config = hyper_config  # Bound to LISTEN_FDS, see asfquart.handoff.inherit_sockets()
+        self.listen_fds = listen_fds
+        self.graceful = graceful
+        self.event_loop = event_loop  # For ourselves and the workers, see asfquart.eventloop
+        self.pid = os.getpid()
+        self.workers = {}  # pid -> worker id
+        self.started = {}  # worker id -> time.monotonic() of its last start
+        self.serving = set()  # ids of workers that have reported serving
+        self.stopping = False
+        self.all_stopped = None
+        self.ready_r = self.ready_w = None  # Pipe that workers report serving on
+        self._tasks = set()
+
+    def run(self, extra_files=frozenset(), watch=None):
+        """Forks the workers, then supervises them until shut down or restarted."""
+        self.ready_r, self.ready_w = os.pipe()
+        # Fork before creating our event loop (or any threads), so the first workers start clean.
+        for worker_id in range(self.count):
+            self.spawn(worker_id)
+
+        loop = eventloop.new_event_loop(self.event_loop)
+        asyncio.set_event_loop(loop)
+        restart = False
+        try:
+            restart = loop.run_until_complete(self.supervise(extra_files, watch))
+        finally:
+            try:
+                quart.app._cancel_all_tasks(loop)  # pylint: disable=protected-access
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+        if restart:
+            # The listening sockets are inherited by the new supervisor, so connections queue up meanwhile.
+            quart.utils.restart()
+
+    async def supervise(self, extra_files=frozenset(), watch=None) -> bool:
+        """Runs until we are told to shut down (returns False) or restart (returns True)."""
+        loop = asyncio.get_running_loop()
+        self.all_stopped = asyncio.Event()
+        shutdown_event = asyncio.Event()
+        restart_event = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, shutdown_event.set)
+        loop.add_signal_handler(signal.SIGINT, shutdown_event.set)
+        loop.add_signal_handler(signal.SIGUSR2, restart_event.set)
+        loop.add_signal_handler(signal.SIGHUP, self._start, self.reload)
+        try:
+            loop.add_signal_handler(signal.SIGCHLD, self.reap)
+            reaper = None
+        except RuntimeError:  # uvloop uses SIGCHLD itself, so look for exited workers periodically instead
+            reaper = loop.create_task(self.reap_forever(), name=f"Reap:{self.app.app_id}")
+        loop.add_reader(self.ready_r, self._read_ready)
+        self.reap()  # Workers may have exited before we caught SIGCHLD
+
+        watcher = loop.create_task(self.watch_forever(extra_files, watch, restart_event), name=f"Watch:{self.app.app_id}")
+        try:
+            while True:
+                shutdown = loop.create_task(shutdown_event.wait())
+                restart = loop.create_task(restart_event.wait())
+                await asyncio.wait((shutdown, restart), return_when=asyncio.FIRST_COMPLETED)
+                shutdown.cancel()
+                restart.cancel()
+                if shutdown_event.is_set():
+                    LOGGER.info("SHUTDOWN: Stopping workers...")
+                    await self.stop_workers()
+                    return False
+                restart_event.clear()
+                LOGGER.info("RESTART: Restarting workers...")
+                if not self.graceful:
+                    await self.stop_workers()
+                    return True
+                timeout = self.app.cfg.get("HANDOFF_TIMEOUT", handoff.DEFAULT_HANDOFF_TIMEOUT)
+                if await handoff.start_successor(self.listen_fds, timeout):
+                    await self.stop_workers()
+                    return False
+                # The new supervisor failed, so carry on with the current workers.
+        finally:
+            watcher.cancel()
+            if reaper is not None:
+                reaper.cancel()
+            loop.remove_reader(self.ready_r)
+
+    async def watch_forever(self, extra_files, watch, restart_event):
+        """Watches for file changes for all workers, see QuartApp.watch()."""
+        while True:
+            try:
+                await self.app.watch(extra_files, watch, on_reload=self.reload)
+            except quart.utils.MustReloadError:
+                restart_event.set()
+
+    async def reload(self, paths=None):
+        """Reloads the configuration and data files here (for our own settings, and workers started later),
+        then all of them in every worker. See QuartApp.reload()."""
+        await self.app.reload(paths)
+        self.signal_workers(signal.SIGHUP)
+
+    def signal_workers(self, signum):
+        for pid in self.workers:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass  # Exited, and about to be reaped
+
+    async def stop_workers(self):
+        """Stops all workers, letting them drain their requests in flight."""
+        self.stopping = True
+        self.signal_workers(signal.SIGTERM)
+        timeout = self.app.cfg.get("DRAIN_TIMEOUT", handoff.DEFAULT_DRAIN_TIMEOUT) + KILL_GRACE
+        try:
+            await asyncio.wait_for(self.all_stopped.wait(), timeout)
+        except asyncio.TimeoutError:
+            LOGGER.error(f"SHUTDOWN: Killing {len(self.workers)} workers that did not stop within {timeout}s")
+            self.signal_workers(signal.SIGKILL)
+            await self.all_stopped.wait()
+
+    async def reap_forever(self):
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            self.reap()
+
+    def reap(self):
+        """Collects exited workers, and starts new ones in their place unless we are stopping."""
+        for pid, worker_id in list(self.workers.items()):
+            try:
+                exited, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                exited, status = pid, 0
+            if not exited:
+                continue
+            del self.workers[pid]
+            self.serving.discard(worker_id)
+            if self.stopping:
+                continue
+            LOGGER.error(f"WORKER {worker_id}: process {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting it")
+            delay = max(0.0, self.started[worker_id] + RESPAWN_DELAY - time.monotonic())
+            asyncio.get_running_loop().call_later(delay, self.spawn, worker_id)
+        if not self.workers and self.all_stopped is not None:
+            self.all_stopped.set()
+
+    def _read_ready(self):
+        for worker_id in os.read(self.ready_r, 1024).split():
+            self.serving.add(int(worker_id))
+            LOGGER.debug(f"WORKER {int(worker_id)}: serving")
+        if len(self.serving) == self.count:
+            # All workers are serving: tell the process that started us, if any (only the first time).
+            handoff.notify_ready()
+
+    def spawn(self, worker_id):
+        """Forks worker WORKER_ID."""
+        if self.stopping:
+            return
+        pid = os.fork()
+        if pid == 0:
+            self._worker(worker_id)  # Never returns
+        self.workers[pid] = worker_id
+        self.started[worker_id] = time.monotonic()
+        LOGGER.info(f"WORKER {worker_id}: started process {pid}")
+
+    def _worker(self, worker_id):
+        """Serves the app in a forked worker process, until the supervisor stops it."""
+        code = 1
+        try:
+            # Drop what we inherited from the supervisor: its signal handling, the pipe it reports on to the
+            # process that started it, and (when respawned) its event loop.
+            signal.set_wakeup_fd(-1)
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+                signal.signal(signum, signal.SIG_DFL)
+            for signum in (signal.SIGHUP, signal.SIGUSR2):
+                signal.signal(signum, signal.SIG_IGN)
+            ready_fd = os.environ.pop(handoff.READY_FD_ENV, None)
+            if ready_fd is not None:
+                os.close(int(ready_fd))
+            os.close(self.ready_r)
+
+            self.app.worker_id = worker_id
+            loop = eventloop.new_event_loop(self.event_loop)
+            loop.set_debug(self.app.debug)
+            asyncio.set_event_loop(loop)
+            trigger = functools.partial(self._worker_trigger, worker_id)
+            task = hypercorn.asyncio.serve(self.app, self.hyper_config, shutdown_trigger=trigger)
+            self.app.run_forever(loop, task)
+            code = 0
+        except BaseException:  # pylint: disable=broad-exception-caught
+            LOGGER.exception(f"WORKER {worker_id}: failed")
+        finally:
+            os._exit(code)  # Never run the supervisor's code (or atexit handlers) in a worker.
+
+    async def _worker_trigger(self, worker_id):
+        """Shutdown trigger of a worker: returns when the supervisor stops it (or goes away)."""
+        loop = asyncio.get_running_loop()
+        stop_event = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+        loop.add_signal_handler(signal.SIGINT, stop_event.set)
+        loop.add_signal_handler(signal.SIGHUP, self._start, self.app.reload)
+        os.write(self.ready_w, f"{worker_id}\n".encode("ascii"))  # Hypercorn calls us once serving
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), ORPHAN_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                if os.getppid() != self.pid:
+                    LOGGER.warning(f"WORKER {worker_id}: supervisor has gone away, stopping")
+                    break
+        self.app.start_draining()
+
+    def _start(self, func):
+        """Runs coroutine function FUNC in the background, from a signal handler."""
+        task = asyncio.get_running_loop().create_task(func())
+        self._tasks.add(task)  # Keep a reference until done
+        task.add_done_callback(self._tasks.discard)
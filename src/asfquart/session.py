@@ -2,65 +2,265 @@
 """ASFQuart - User session methods and decorators"""
 import typing
 
-from . import base, ldap
+from . import base, cache, ldap
 import time
 import binascii
+import hashlib
+import collections.abc
+import copy
+import functools
 
 import quart.sessions
 import asfquart
 import asyncio
 
+# Resolved sessions are memoized on the request object under this attribute, so that
+# the auth decorators, error handlers and the endpoint itself can all call read() for
+# the price of a single cookie decode, token lookup or LDAP bind.
+REQUEST_CACHE_ATTR = "_asfquart_sessions"
+
+DEFAULT_TOKEN_CACHE_TTL = 0  # Token handler results are not cached unless configured
+DEFAULT_TOKEN_CACHE_SIZE = 1024
+DEFAULT_IDLE_TIMEOUT = 86400 * 7  # Sessions expire after seven days without use
+DEFAULT_TOUCH_GRANULARITY = 300  # Only refresh the last access timestamp if it is older than five minutes
+
+
+class ClientSession(collections.abc.Mapping):
+    """An authenticated client session. Fields are available as attributes (session.uid) as well as keys
+    (session["uid"]). Sessions are immutable and compact: fields live in slots, and committees/projects
+    are frozensets, so membership tests (eg. "httpd" in session.projects) are O(1). A plain dict of the
+    session is only built when one is needed, eg. when an endpoint returns the session for rendering
+    (see QuartApp.make_response and base.JSONProvider), or through as_dict()."""
+
+    __slots__ = (
+        "uid", "dn", "fullname", "email", "isMember", "isChair", "isRoot",
+        "committees", "projects", "mfa", "isRole", "metadata", "_dict",
+    )
+    FIELDS = __slots__[:-1]
 
-class ClientSession(dict):
     def __init__(self, raw_data: dict):
-        """Initializes a client session from a raw dict. ClientSession is a subclassed dict, so that
-        we can send it to quart in a format it can render."""
-        super().__init__()
-        self.uid = raw_data.get("uid")
-        self.dn = raw_data.get("dn")
-        self.fullname = raw_data.get("fullname")
-        self.email = raw_data.get("email", f"{self.uid}@apache.org")
-        self.isMember = raw_data.get("isMember", False)
-        self.isChair = raw_data.get("isChair", False)
-        self.isRoot = raw_data.get("isRoot", False)
-        self.committees = raw_data.get("pmcs", [])
-        self.projects = raw_data.get("projects", [])
-        self.mfa = raw_data.get("mfa", False)
-        self.isRole = raw_data.get("roleaccount", False)
-        self.metadata = raw_data.get("metadata", {})  # This can contain whatever specific metadata the app needs
-        # Update the external dict representation with internal values
-        self.update(self.__dict__.items())
-
-
-async def read(expiry_time=86400*7, app=None) -> typing.Optional[ClientSession]:
+        """Initializes a client session from a raw (cookie, token handler or LDAP) session dict."""
+        uid = raw_data.get("uid")
+        init = functools.partial(object.__setattr__, self)
+        init("uid", uid)
+        init("dn", raw_data.get("dn"))
+        init("fullname", raw_data.get("fullname"))
+        init("email", raw_data.get("email", f"{uid}@apache.org"))
+        init("isMember", raw_data.get("isMember", False))
+        init("isChair", raw_data.get("isChair", False))
+        init("isRoot", raw_data.get("isRoot", False))
+        init("committees", frozenset(raw_data.get("pmcs") or ()))
+        init("projects", frozenset(raw_data.get("projects") or ()))
+        init("mfa", raw_data.get("mfa", False))
+        init("isRole", raw_data.get("roleaccount", False))
+        init("metadata", raw_data.get("metadata", {}))  # This can contain whatever specific metadata the app needs
+        init("_dict", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ClientSession is immutable, cannot set {name!r}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"ClientSession is immutable, cannot delete {name!r}")
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __repr__(self):
+        return f"ClientSession({self.as_dict()!r})"
+
+    def as_dict(self) -> dict:
+        """Returns the session as a plain (JSON-serializable) dict, built on first use."""
+        if self._dict is None:
+            view = {field: getattr(self, field) for field in self.FIELDS}
+            view["committees"] = sorted(self.committees)
+            view["projects"] = sorted(self.projects)
+            object.__setattr__(self, "_dict", view)
+        return self._dict
+
+    def copy(self) -> dict:
+        """Returns a mutable copy of the session as a plain dict, eg. to modify it and write() it back."""
+        return copy.deepcopy(self.as_dict())
+
+
+async def call_token_handler(app, token: str) -> typing.Optional[dict]:
+    """Calls the app's token handler, be it sync or async, and returns its session dict (if any)."""
+    handler = app.token_handler
+    if not callable(handler):
+        raise TypeError("app.token_handler is not a callable function.")
+    # Async token handler?
+    if asyncio.iscoroutinefunction(handler):
+        return await handler(token)
+    # Sync handler? It may block (file reads, DB queries, ...), so keep it off the event loop.
+    return await app.run_sync(handler, token)
+
+
+class TokenCache:
+    """Cache of token handler results, so bearer-token clients do not pay the handler cost on every request.
+
+    Tokens are only ever stored as SHA-256 digests. Sessions are cached for TTL seconds, and unknown
+    tokens for NEGATIVE_TTL seconds (defaulting to TTL). Concurrent lookups of the same token share a
+    single call to the token handler, even when caching is disabled (TTL of zero, the default).
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TOKEN_CACHE_TTL,
+        negative_ttl: float | None = None,
+        max_size: int = DEFAULT_TOKEN_CACHE_SIZE,
+    ):
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.results = cache.AsyncCache(max_size=max_size, ttl=ttl)
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        """Constructs a token cache from the TOKEN_CACHE_* settings in the app configuration."""
+        return cls(
+            ttl=cfg.get("TOKEN_CACHE_TTL", DEFAULT_TOKEN_CACHE_TTL),
+            negative_ttl=cfg.get("TOKEN_CACHE_NEGATIVE_TTL"),
+            max_size=cfg.get("TOKEN_CACHE_SIZE", DEFAULT_TOKEN_CACHE_SIZE),
+        )
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _ttl(self, session_dict):
+        return self.results.ttl if session_dict else self.negative_ttl
+
+    async def lookup(self, token: str, app) -> typing.Optional[dict]:
+        """Returns the session dict for TOKEN, calling the token handler of APP if it is not cached."""
+        return await self.results.get_or_fetch(
+            self.digest(token), lambda: call_token_handler(app, token), ttl=self._ttl
+        )
+
+    def revoke(self, token: str):
+        """Drops any cached result for TOKEN, e.g. after the token has been revoked. Only the cache of this
+        process is affected: other worker processes keep their cached result for up to TTL seconds, unless
+        the app is reloaded everywhere (SIGHUP to the supervisor, see QuartApp.reload())."""
+        self.results.pop(self.digest(token))
+
+    def clear(self):
+        self.results.clear()
+
+
+class SessionPolicy:
+    """Sliding expiry policy of cookie sessions.
+
+    A session expires once it has not been used for IDLE_TIMEOUT seconds, or, if MAX_AGE is set, once it
+    is more than MAX_AGE seconds old. Using a session refreshes its last access timestamp, but only if that
+    is more than TOUCH_GRANULARITY seconds old: a refresh changes the session, which then has to be
+    serialized, signed and sent back to the client, and doing so on every request buys nothing when
+    sessions only expire after days. Expiry can thus be up to TOUCH_GRANULARITY seconds early.
+    """
+
+    __slots__ = ("idle_timeout", "max_age", "touch_granularity")
+
+    def __init__(
+        self,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        max_age: float = 0,
+        touch_granularity: float = DEFAULT_TOUCH_GRANULARITY,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.touch_granularity = touch_granularity
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        """Constructs a session policy from the MAX_SESSION_AGE and SESSION_TOUCH_GRANULARITY settings."""
+        return cls(
+            max_age=cfg.get("MAX_SESSION_AGE", 0),
+            touch_granularity=cfg.get("SESSION_TOUCH_GRANULARITY", DEFAULT_TOUCH_GRANULARITY),
+        )
+
+    def expired(self, session_dict: dict, now: float, idle_timeout: float | None = None) -> bool:
+        """Returns whether SESSION_DICT has expired. IDLE_TIMEOUT overrides that of the policy."""
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+        if session_dict.get("uts", 0) < now - idle_timeout:
+            return True
+        return self.max_age > 0 and session_dict.get("cts", 0) < now - self.max_age
+
+    def touch(self, session_dict: dict, now: float) -> bool:
+        """Refreshes the last access timestamp of SESSION_DICT if it is due, returning whether it was."""
+        if session_dict.get("uts", 0) > now - self.touch_granularity:
+            return False
+        session_dict["uts"] = now
+        return True
+
+
+def _request_cache() -> typing.Optional[dict]:
+    """Returns the session cache of the current request, or None if we are not inside a request context."""
+    if not quart.has_request_context():
+        return None
+    request_cache = getattr(quart.request, REQUEST_CACHE_ATTR, None)
+    if request_cache is None:
+        request_cache = {}
+        setattr(quart.request, REQUEST_CACHE_ATTR, request_cache)
+    return request_cache
+
+
+def invalidate():
+    """Drops any session memoized for the current request, forcing the next read() to resolve it anew."""
+    request_cache = _request_cache()
+    if request_cache:
+        request_cache.clear()
+
+
+async def read(expiry_time=None, app=None) -> typing.Optional[ClientSession]:
     """Fetches a cookie-based session if found (and valid), and updates the last access timestamp
-    for the session."""
+    for the session, as per the session policy of the app. EXPIRY_TIME overrides the idle timeout
+    of the policy (default: 7 days). The outcome (session, None, or exception) is memoized for the remainder of
+    the request, so repeated calls are free."""
 
     if app is None:
         app = asfquart.APP
 
+    request_cache = _request_cache()
+    if request_cache is None:  # Outside a request (e.g. in tests), there is nothing to memoize against.
+        return await _resolve(expiry_time, app)
+    key = (app.app_id, expiry_time)
+    if key not in request_cache:
+        try:
+            request_cache[key] = await _resolve(expiry_time, app)
+        except base.ASFQuartException as e:
+            request_cache[key] = e
+    result = request_cache[key]
+    if isinstance(result, base.ASFQuartException):
+        raise result
+    return result
+
+
+async def _resolve(expiry_time, app) -> typing.Optional[ClientSession]:
+    """Resolves the client session from the session cookie or the Authorization header."""
+
     # We store the session cookie using the app.app_id identifier, to distinguish between
     # two asfquart apps running on the same hostname.
     cookie_id = app.app_id
     if cookie_id in quart.session:
         now = time.time()
-        max_session_age = app.cfg.get("MAX_SESSION_AGE", 0)
-        cookie_expiry_deadline = now - expiry_time
-        cookie_session_age_limit = now - max_session_age
+        policy = app.session_policy if app.session_policy is not None else SessionPolicy.from_config(app.cfg)
         session_dict = quart.session[cookie_id]
         if isinstance(session_dict, dict):
-            session_create_timestamp = session_dict.get("cts", 0)
-            session_update_timestamp = session_dict.get("uts", 0)
-            # If a session cookie has expired (not updated/used for seven days), we delete it instead of returning it
-            if session_update_timestamp < cookie_expiry_deadline:
-                del quart.session[cookie_id]
-            # If max session lifetime is set and the cookie has exceeded it, we delete it
-            elif max_session_age > 0 and session_create_timestamp < cookie_session_age_limit:
+            # If a session cookie has expired (not used for too long, or older than the max session age),
+            # we delete it instead of returning it
+            if policy.expired(session_dict, now, expiry_time):
                 del quart.session[cookie_id]
             # If it's still valid, use it
             else:
-                # Update the timestamp, since the session has been requested (and thus used)
-                session_dict["uts"] = now
+                # Update the timestamp, since the session has been requested (and thus used). Changes
+                # within session_dict go unnoticed by quart, so mark the session as modified by setting it,
+                # unless the session interface picks them up itself (see asfquart.sessionstore).
+                if policy.touch(session_dict, now) and not getattr(quart.session, "coalesces_touches", False):
+                    quart.session[cookie_id] = session_dict
                 return ClientSession(session_dict)
     # Check for session providers in Auth header. These sessions are created ad-hoc, and do not linger in the
     # quart session DB. Since quart.request is not defined inside testing frameworks, the bool(request) test
@@ -69,15 +269,11 @@ async def read(expiry_time=86400*7, app=None) -> typing.Optional[ClientSession]:
         match quart.request.authorization.type:
             case "bearer":  # Role accounts, PATs - TBD
                 if app.token_handler:
-                    if not callable(app.token_handler):
-                        raise TypeError("app.token_handler is not a callable function.")
-                    session_dict = None  # Blank, in case we don't have a working callback.
-                    # Async token handler?
-                    if asyncio.iscoroutinefunction(app.token_handler):
-                        session_dict = await app.token_handler(quart.request.authorization.token)
-                    # Sync handler?
-                    elif callable(app.token_handler):
-                        session_dict = app.token_handler(quart.request.authorization.token)
+                    token = quart.request.authorization.token
+                    if app.token_cache is not None:
+                        session_dict = await app.token_cache.lookup(token, app)
+                    else:
+                        session_dict = await call_token_handler(app, token)
                     # If token handler returns a dict, we have a session and should set it up
                     if session_dict:
                         return ClientSession(session_dict)
@@ -90,7 +286,7 @@ async def read(expiry_time=86400*7, app=None) -> typing.Optional[ClientSession]:
                     try:
                         auth_user = quart.request.authorization.parameters["username"]
                         auth_pwd = quart.request.authorization.parameters["password"]
-                        ldap_client = ldap.LDAPClient(auth_user, auth_pwd)
+                        ldap_client = ldap.LDAPClient(auth_user, auth_pwd, pool=app.ldap_pool)
                         ldap_affiliations = await ldap_client.get_affiliations()
                         # Convert to the usual session dict. TODO: add a single standardized parser/class for sessions
                         session_dict = {
@@ -118,6 +314,7 @@ def write(session_data: dict, app=None):
     dict_copy["cts"] = time.time()   # Set created at timestamp for session length checks later
     dict_copy["uts"] = time.time()   # Set last access timestamp for expiry checks later
     quart.session[cookie_id] = dict_copy
+    invalidate()
 
 
 def clear(app=None):
@@ -127,3 +324,4 @@ def clear(app=None):
         app = asfquart.APP
 
     quart.session.pop(app.app_id, None)  # Safely pop the session if it's there.
+    invalidate()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""ASFQuart - Server-side session storage
+
+By default, Quart stores the whole session in a signed cookie, which every request then carries and
+has verified. With a server-side store, the cookie only carries an opaque session id, and the session
+data stays on the server. Enable it in config.yaml:
+
+  SESSION_STORE: memory                   # Process-local, sessions are lost on restart
+  SESSION_STORE: sqlite:/path/sessions.db # Local SQLite database, shared by all workers on the host
+  SESSION_STORE_TTL: 604800               # Drop sessions unused for this many seconds (default: 7 days)
+  SESSION_TOUCH_INTERVAL: 60              # Write last-access timestamps back every N seconds
+
+Sessions are only written back when modified. Last-access timestamps changed without the session being
+marked as modified are collected, and written back in batches rather than on every request.
+"""
+
+import abc
+import asyncio
+import concurrent.futures
+import copy
+import json
+import logging
+import secrets
+import sqlite3
+import time
+
+import quart.sessions
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SESSION_TTL = 86400 * 7  # Same as the default expiry_time of asfquart.session.read()
+DEFAULT_TOUCH_INTERVAL = 60
+SESSION_ID_BYTES = 32
+
+
+class SessionStore(abc.ABC):
+    """Base class of server-side session backends. Session data must be JSON-serializable."""
+
+    process_local = False  # Whether sessions are only seen by the process that stored them
+
+    @abc.abstractmethod
+    async def load(self, sid: str) -> dict | None:
+        """Returns the data of session SID, or None if there is no such (unexpired) session."""
+
+    @abc.abstractmethod
+    async def save(self, sid: str, data: dict, expires: float):
+        """Stores DATA as session SID, until the EXPIRES timestamp."""
+
+    @abc.abstractmethod
+    async def delete(self, sid: str):
+        """Removes session SID."""
+
+    async def touch(self, sid: str, timestamps: dict, expires: float):
+        """Updates the last-access ("uts") timestamp of each app session in TIMESTAMPS, and extends the
+        expiry of session SID to EXPIRES. Timestamps never move backwards."""
+        data = await self.load(sid)
+        if data is None:
+            return
+        for app_id, uts in timestamps.items():
+            app_session = data.get(app_id)
+            if isinstance(app_session, dict):
+                app_session["uts"] = max(app_session.get("uts", 0), uts)
+        await self.save(sid, data, expires)
+
+    async def purge(self):
+        """Drops all expired sessions."""
+
+    async def close(self):
+        """Releases any resources held by the store."""
+
+
+class MemoryStore(SessionStore):
+    """Process-local session store. Sessions do not survive a restart, and are not shared between workers."""
+
+    process_local = True
+
+    def __init__(self):
+        self.sessions: dict[str, tuple[float, dict]] = {}  # sid -> (expires, data)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    async def load(self, sid):
+        entry = self.sessions.get(sid)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self.sessions[sid]
+            return None
+        # Hand out a copy, so changes only persist once saved, as with any other store.
+        return copy.deepcopy(entry[1])
+
+    async def save(self, sid, data, expires):
+        self.sessions[sid] = (expires, copy.deepcopy(data))
+
+    async def delete(self, sid):
+        self.sessions.pop(sid, None)
+
+    async def purge(self):
+        now = time.time()
+        for sid in [sid for sid, (expires, _data) in self.sessions.items() if expires <= now]:
+            del self.sessions[sid]
+
+
+class SQLiteStore(SessionStore):
+    """Session store in a local SQLite database, which can be shared by all workers on a host.
+    All database access happens on a single thread of its own, off the event loop."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="asfquart-sessions")
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+        return self._db
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _load(self, sid):
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, sid, data, expires):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)", (sid, data, expires)
+        )
+
+    def _delete(self, sid):
+        self._connect().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def _purge(self):
+        self._connect().execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+
+    async def load(self, sid):
+        return await self._run(self._load, sid)
+
+    async def save(self, sid, data, expires):
+        await self._run(self._save, sid, json.dumps(data), expires)
+
+    async def delete(self, sid):
+        await self._run(self._delete, sid)
+
+    async def purge(self):
+        await self._run(self._purge)
+
+    async def close(self):
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._db = None
+        self.executor.shutdown(wait=False)
+
+
+def _timestamps(session) -> dict:
+    """Returns the last-access ("uts") timestamp of each app session in SESSION."""
+    return {
+        app_id: app_session["uts"]
+        for app_id, app_session in session.items()
+        if isinstance(app_session, dict) and "uts" in app_session
+    }
+
+
+class ServerSideSession(quart.sessions.SecureCookieSession):
+    """A Quart session whose data is kept in a SessionStore, under the opaque id SID. Last-access timestamps
+    may be changed in place, without marking the session as modified (see asfquart.session.read())."""
+
+    coalesces_touches = True
+
+    def __init__(self, initial=None, sid: str | None = None):
+        super().__init__(initial)
+        self.sid = sid
+        self.timestamps = _timestamps(self) if initial else {}  # The last-access timestamps as loaded
+
+
+class ServerSideSessionInterface(quart.sessions.SessionInterface):
+    """Quart session interface keeping sessions in STORE, with only the session id in the cookie.
+
+    Sessions are written back to the store when modified, under a new id (see save_session()). Otherwise,
+    only the last-access timestamps of the app sessions in it may have changed (in place), and such updates
+    are collected and written back every TOUCH_INTERVAL seconds by flush_forever(), so busy clients cost one
+    write per interval rather than one per request. The cookie itself is only sent when the id changes.
+    """
+
+    session_class = ServerSideSession
+
+    def __init__(self, store: SessionStore, ttl: int = DEFAULT_SESSION_TTL, touch_interval: int = DEFAULT_TOUCH_INTERVAL):
+        self.store = store
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.pending_touches: dict[str, dict] = {}  # sid -> {app_id: uts}
+
+    async def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = await self.store.load(sid)
+            if data is not None:
+                return self.session_class(data, sid=sid)
+        return self.session_class()
+
+    async def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        cookie_args = {
+            "domain": self.get_cookie_domain(app),
+            "path": self.get_cookie_path(app),
+            "secure": self.get_cookie_secure(app),
+            "samesite": self.get_cookie_samesite(app),
+            "httponly": self.get_cookie_httponly(app),
+        }
+        if session.accessed and response is not None:
+            response.vary.add("Cookie")
+
+        # If the session is modified to be empty, remove it.
+        if not session:
+            if session.modified and session.sid:
+                self.pending_touches.pop(session.sid, None)
+                await self.store.delete(session.sid)
+                if response is not None:
+                    response.delete_cookie(name, **cookie_args)
+            return
+
+        if session.modified or session.sid is None:
+            # Modified sessions (eg. on login, see asfquart.session.write()) get a new id, and the old one is
+            # dropped. Otherwise, an attacker could plant a session id of theirs in a victim's browser, and
+            # have it logged in as the victim (session fixation). A websocket cannot set a cookie though, so
+            # its existing session keeps its id.
+            old_sid = session.sid
+            if old_sid is None or response is not None:
+                session.sid = secrets.token_urlsafe(SESSION_ID_BYTES)
+            self.pending_touches.pop(old_sid, None)
+            await self.store.save(session.sid, dict(session), time.time() + self.ttl)
+            if session.sid != old_sid:
+                if old_sid is not None:
+                    await self.store.delete(old_sid)
+                if response is None:
+                    LOGGER.error("New session created during websocket handling, it will be lost as a cookie cannot be set.")
+                    return
+                response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session), **cookie_args)
+            return
+
+        # Not modified: at most, the last-access timestamps of its app sessions changed. Queue them up.
+        timestamps = _timestamps(session)
+        if timestamps != session.timestamps:
+            self.pending_touches[session.sid] = timestamps
+
+    async def flush(self):
+        """Writes all pending last-access timestamps back to the store."""
+        pending, self.pending_touches = self.pending_touches, {}
+        expires = time.time() + self.ttl
+        for sid, timestamps in pending.items():
+            await self.store.touch(sid, timestamps, expires)
+
+    async def flush_forever(self):
+        """Long-running task writing back timestamps and purging expired sessions, see QuartApp.add_runner().
+        Pending timestamps are flushed, and the store closed, on cancellation."""
+        try:
+            while True:
+                await asyncio.sleep(self.touch_interval)
+                try:
+                    await self.flush()
+                    await self.store.purge()
+                except Exception as e:
+                    LOGGER.error(f"Could not update session store: {e}")
+        finally:
+            await self.flush()
+            await self.store.close()
+
+
+def store_from_config(spec: str) -> SessionStore:
+    """Returns the session store for a SESSION_STORE setting: "memory" or "sqlite:/path/to/db"."""
+    if spec == "memory":
+        return MemoryStore()
+    if spec.startswith("sqlite:"):
+        return SQLiteStore(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown session store {spec!r}, must be 'memory' or 'sqlite:/path/to/db'")
+
+
+def setup(app, store: SessionStore | None = None) -> ServerSideSessionInterface:
+    """Makes APP keep its sessions in STORE (default: as set by SESSION_STORE in the app configuration)."""
+    if store is None:
+        store = store_from_config(app.cfg.SESSION_STORE)
+    interface = ServerSideSessionInterface(
+        store,
+        ttl=app.cfg.get("SESSION_STORE_TTL", DEFAULT_SESSION_TTL),
+        touch_interval=app.cfg.get("SESSION_TOUCH_INTERVAL", DEFAULT_TOUCH_INTERVAL),
+    )
+    app.session_interface = interface
+    app.add_runner(interface.flush_forever, name=f"Sessions:{app.app_id}")
+    return interface
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""ASFQuart - Role account and personal access token (PAT) registry
+
+USAGE:
+
+  roleaccounts.yaml:
+    testrole:                     # UID of role account
+      token: abcdefg1234567890    # The PAT that is used
+      name: Test Role Account     # Full name (description) of the role
+      email: root@apache.org      # Optional, defaults to uid@apache.org
+      scope:                      # Optional scopes, available as session.metadata["scope"]
+        - mailinglists
+
+  main.py:
+    import asfquart.tokens
+    registry = asfquart.tokens.TokenRegistry("roleaccounts.yaml")
+    registry.install(APP)  # Sets APP.token_handler, and reloads the file whenever it changes
+"""
+
+import copy
+import hashlib
+import logging
+import os
+import pathlib
+
+import yaml
+
+LOGGER = logging.getLogger(__name__)
+
+
+def digest(token: str) -> bytes:
+    """Returns the digest that tokens are indexed by. The tokens themselves are not kept in memory, and
+    as lookups compare digests rather than the tokens, their timing reveals nothing about valid tokens."""
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class TokenRegistry:
+    """Index of role accounts, loaded from a YAML file, keyed by the digest of their token.
+
+    Looking up a token is a single dict lookup, regardless of the number of accounts. The file is
+    only read at load time; a reload builds a new index and swaps it in at once, so lookups never
+    see a partially loaded file. Its handle() method is a token handler, see docs/sessions.md.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = pathlib.Path(path).absolute()
+        self._accounts: dict[bytes, dict] = {}
+        self.load()
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def load(self) -> bool:
+        """(Re)reads the role accounts file, returning whether it was loaded. If it is missing (eg. while
+        being replaced), cannot be read, or is malformed, the current accounts are kept. To remove all role
+        accounts, empty the file rather than deleting it."""
+        if not self.path.is_file():
+            if self._accounts:
+                LOGGER.warning(f"Could not find role account config file {self.path}, keeping the current role accounts")
+            else:
+                LOGGER.warning(f"Could not find role account config file {self.path}, no role accounts set up")
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                yml = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            LOGGER.error(f"Could not load role accounts from {self.path}, keeping the current ones: {e}")
+            return False
+        if not isinstance(yml, dict):
+            LOGGER.error(f"Role accounts file {self.path} is not a mapping of role accounts, keeping the current ones")
+            return False
+        accounts = {}
+        for rolename, roledata in yml.items():
+            if not isinstance(roledata, dict):
+                LOGGER.error(f"Role account {rolename} in {self.path} is not a mapping, keeping the current role accounts")
+                return False
+            token = roledata.get("token")
+            if not token:
+                LOGGER.warning(f"Role account {rolename} has no token, skipping")
+                continue
+            session = {
+                "uid": rolename,
+                "email": roledata.get("email", f"{rolename}@apache.org"),
+                "fullname": roledata.get("name", rolename),
+                "roleaccount": True,
+                "metadata": {
+                    "scope": roledata.get("scope", []),  # Mark the scope of this roleaccount (or PAT) internally
+                },
+            }
+            accounts[digest(str(token))] = session
+        self._accounts = accounts
+        LOGGER.info(f"Loaded {len(accounts)} role accounts from {self.path}")
+        return True
+
+    def lookup(self, token: str) -> dict | None:
+        """Returns a session dict for the role account owning TOKEN, if any."""
+        session = self._accounts.get(digest(token))
+        if session is None:
+            return None
+        # Hand out a copy, so the caller cannot alter the registry.
+        return copy.deepcopy(session)
+
+    async def handle(self, token: str) -> dict | None:
+        """Token handler for app.token_handler. Lookups never block, so this need not run in a thread."""
+        return self.lookup(token)
+
+    def install(self, app):
+        """Makes this registry the token handler of APP, and reloads it whenever the file changes while APP
+        is serving, or APP is told to reload (eg. on SIGHUP). See QuartApp.watch_file()."""
+        app.token_handler = self.handle
+
+        def reload():
+            # Sessions cached for the old accounts must not outlive a reload.
+            if self.load() and app.token_cache is not None:
+                app.token_cache.clear()
+
+        app.watch_file(self.path, reload)
@@ -6,48 +6,249 @@ import io
 import functools
 import asyncio
 import logging
+import tempfile
+import typing
 
 import quart
+import werkzeug.exceptions
 import werkzeug.routing
 
+from . import base
+
 LOGGER = logging.getLogger(__name__)
 
 DEFAULT_MAX_CONTENT_LENGTH = 102400
+DEFAULT_FORM_SPOOL_SIZE = 65536  # Uploaded files larger than this are spooled to disk
+
+
+def _spooled_stream_factory(total_content_length, content_type, filename, content_length=None):
+    """Stream factory for uploaded files: kept in memory up to FORM_SPOOL_SIZE bytes, then on disk."""
+    max_size = quart.current_app.config.get("FORM_SPOOL_SIZE", DEFAULT_FORM_SPOOL_SIZE)
+    return tempfile.SpooledTemporaryFile(max_size=max_size, mode="rb+")
+
+
+class Request(quart.Request):
+    """Request class of asfquart apps, which spools uploaded files to disk beyond FORM_SPOOL_SIZE bytes."""
+
+    def make_form_data_parser(self):
+        parser = super().make_form_data_parser()
+        parser.stream_factory = _spooled_stream_factory
+        return parser
+
 
+async def _receive():
+    """Reads the form, files and JSON data of the current request, bounded by MAX_CONTENT_LENGTH. They are
+    read through the request, which caches them for later use (eg. await quart.request.form), and reads the
+    body as a stream, raising RequestEntityTooLarge as soon as it exceeds the limit, or RequestTimeout if it
+    takes longer than BODY_TIMEOUT seconds to arrive."""
+    request = quart.request
+    # If the client tells us up front that the content is too large for us to handle, do not read any of it.
+    if request.content_length is not None and request.content_length > _max_content_length():
+        raise werkzeug.exceptions.RequestEntityTooLarge()
+    if request.is_json:
+        return None, None, await request.get_json()
+    return await request.form, await request.files, None
 
-async def formdata():
-    """Catch-all form data converter. Converts form data of any form (json, urlencoded, mime, etc) to a dict"""
+
+def _max_content_length() -> int:
+    return quart.current_app.config.get("MAX_CONTENT_LENGTH") or DEFAULT_MAX_CONTENT_LENGTH
+
+
+def _too_large() -> quart.Response:
+    max_size = _max_content_length()
+    if quart.request.content_length is not None:
+        message = f"Request content length ({quart.request.content_length} bytes) is larger than what is permitted for form data ({max_size} bytes)!"
+    else:
+        message = f"Request content is larger than what is permitted for form data ({max_size} bytes)!"
+    return quart.Response(status=413, response=message, content_type="text/plain; charset=utf-8")
+
+
+async def formdata(files: bool = False):
+    """Catch-all form data converter. Converts form data of any form (json, urlencoded, mime, etc) to a dict.
+    If FILES is set, uploaded files are included as well, as FileStorage objects spooled to disk beyond
+    FORM_SPOOL_SIZE bytes. The body is read as a stream, and if it grows larger than MAX_CONTENT_LENGTH,
+    reading stops, and a 413 response is returned instead."""
     form_data = dict()
     form_data.update(quart.request.args.to_dict())  # query string args
-    xform = await quart.request.form                # POST form data
-    # Pre-parse check for form data size
-    if quart.request.content_type and any(
-            x in quart.request.content_type
-            for x in (
-                    "multipart/form-data",
-                    "application/x-www-form-urlencoded",
-                    "application/x-url-encoded",
-            )
-    ):
-        # If the content is too large for us to handle, we need to silently ignore every chunk, so we can return with a
-        # cleared buffer, lest bad things happen.
-        max_size = quart.current_app.config.get("MAX_CONTENT_LENGTH", DEFAULT_MAX_CONTENT_LENGTH)
-        if quart.request.content_length > max_size:
-            async for _data in quart.request.body:
-                pass
-            return quart.Response(
-                status=413,
-                response=f"Request content length ({quart.request.content_length} bytes) is larger than what is permitted for form data ({max_size} bytes)!",
-                content_type="text/plain; charset=utf-8"
-            )
-    if xform:
+    try:
+        xform, xfiles, xjson = await _receive()
+    except werkzeug.exceptions.RequestEntityTooLarge:
+        return _too_large()
+    if xform:  # POST form data
         form_data.update(xform.to_dict())
-    if quart.request.is_json:  # JSON data from a PUT?
-        xjson = await quart.request.json
+    if files and xfiles:
+        form_data.update(xfiles.to_dict())
+    if xjson:  # JSON data from a PUT?
         form_data.update(xjson)
     return form_data
 
 
+#
+# Schema-driven request data decoding, see expects().
+#
+
+_MISSING = object()
+_BOOLEANS = {
+    "true": True, "yes": True, "on": True, "1": True,
+    "false": False, "no": False, "off": False, "0": False, "": False,
+}
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return _BOOLEANS[str(value).lower()]  # KeyError for anything else
+
+
+def _to_int(value) -> int:
+    # Do not silently turn True into 1 or 2.5 into 2
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    return int(value)
+
+
+def _to_float(value) -> float:
+    if isinstance(value, bool):
+        raise ValueError(value)
+    return float(value)
+
+
+def _to_str(value) -> str:
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ValueError(value)
+    return str(value)
+
+
+def _to_dict(value) -> dict:
+    if not isinstance(value, dict):
+        raise ValueError(value)
+    return value
+
+
+_COERCERS = {bool: _to_bool, int: _to_int, float: _to_float, str: _to_str, dict: _to_dict}
+
+
+def _coercer(kind):
+    """Returns the function converting a value to KIND. Any other callable (eg. uuid.UUID) converts values
+    itself, and rejects them by raising ValueError, TypeError or KeyError."""
+    if kind in _COERCERS:
+        return _COERCERS[kind]
+    if callable(kind):
+        return kind
+    raise TypeError(f"Cannot convert request data to {kind!r}")
+
+
+def _list_coercer(item):
+    def coerce(value) -> list:
+        if not isinstance(value, list):
+            raise ValueError(value)
+        return [item(element) for element in value] if item else value
+    return coerce
+
+
+def compile_schema(schema: dict):
+    """Compiles SCHEMA, a dict of field names and their types, into a validator. Types can be str, int,
+    float, bool, dict, list or list[type], or any callable converting a value. A field is required, unless
+    its type is given as a (type, default) tuple. The validator takes the query string arguments, the form
+    data (MultiDicts, or None) and the JSON data (or None) of a request, and returns the converted fields.
+    Values in JSON take precedence over form data, which takes precedence over the query string. If any
+    field is missing or invalid, the validator raises an ASFQuartException (400) listing them all."""
+    fields = []
+    for name, kind in schema.items():
+        default = _MISSING
+        if isinstance(kind, tuple):
+            kind, default = kind
+        if kind is list or typing.get_origin(kind) is list:
+            item_args = typing.get_args(kind)
+            fields.append((name, True, _list_coercer(_coercer(item_args[0]) if item_args else None), default, kind))
+        else:
+            fields.append((name, False, _coercer(kind), default, kind))
+    fields = tuple(fields)
+
+    def validate(args, form, json) -> dict:
+        values = {}
+        errors = []
+        for name, is_list, coerce, default, kind in fields:
+            if json is not None and name in json:
+                value = json[name]
+            elif is_list:
+                value = (form.getlist(name) if form else None) or args.getlist(name) or _MISSING
+            else:
+                value = form.get(name, _MISSING) if form else _MISSING
+                if value is _MISSING:
+                    value = args.get(name, _MISSING)
+            if value is _MISSING:
+                if default is _MISSING:
+                    errors.append(f"Missing required field '{name}'")
+                else:
+                    values[name] = default
+                continue
+            try:
+                values[name] = coerce(value)
+            except (ValueError, TypeError, KeyError):
+                errors.append(f"Invalid value for field '{name}', expected {getattr(kind, '__name__', kind)}")
+        if errors:
+            raise base.ASFQuartException("\n".join(errors), errorcode=400)
+        return values
+
+    return validate
+
+
+def expects(schema: dict):
+    """Decorator that decodes and validates the query string, form and JSON data of a request according
+    to SCHEMA (see compile_schema), and passes the resulting fields to the endpoint as keyword arguments.
+    The schema is compiled once, when the endpoint is decorated. Invalid requests get a 400 response
+    listing the problems, and bodies larger than MAX_CONTENT_LENGTH a 413 response. Fields must not share
+    their names with the URL parameters of the endpoint, which are passed as keyword arguments as well;
+    the app refuses to start serving if they do, see check_expects().
+
+    Example:
+        @APP.route("/search", methods=["GET", "POST"])
+        @asfquart.utils.expects({"query": str, "page": (int, 1), "projects": (list[str], ())})
+        async def search(query: str, page: int, projects: list):
+            ...
+    """
+    validate = compile_schema(schema)
+    field_names = frozenset(schema)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def expects_wrapper(*args, **kw):
+            clashes = field_names.intersection(kw)
+            if clashes:
+                # Caught by check_expects() for routes known when the app starts serving, but not for others.
+                raise TypeError(
+                    f"URL parameter(s) {', '.join(sorted(clashes))} of endpoint {func.__qualname__} clash with "
+                    f"field(s) of its @expects schema, rename one or the other"
+                )
+            try:
+                xform, _xfiles, xjson = await _receive()
+            except werkzeug.exceptions.RequestEntityTooLarge:
+                return _too_large()
+            if xjson is not None and not isinstance(xjson, dict):
+                raise base.ASFQuartException("JSON data must be an object", errorcode=400)
+            return await func(*args, **kw, **validate(quart.request.args, xform, xjson))
+
+        expects_wrapper.expects_fields = field_names  # See check_expects()
+        return expects_wrapper
+
+    return decorator
+
+
+def check_expects(app):
+    """Raises TypeError if the URL parameters of any route of APP clash with the fields of the @expects
+    schema of its endpoint. The app runs this when it starts serving, so that such routes fail at startup
+    rather than on every request."""
+    problems = []
+    for rule in app.url_map.iter_rules():
+        fields = getattr(app.view_functions.get(rule.endpoint), "expects_fields", frozenset())
+        clashes = fields.intersection(rule.arguments)
+        if clashes:
+            problems.append(f"URL parameter(s) {', '.join(sorted(clashes))} of route {rule.rule} ({rule.endpoint})")
+    if problems:
+        raise TypeError(f"{'; '.join(problems)} clash with field(s) of its @expects schema, rename one or the other")
+
+
 class FilenameConverter(werkzeug.routing.BaseConverter):
     """Simple converter that splits a filename into a basename and an extension. Only deals with filenames, not
     full paths. Thus, <filename> will match foo.txt, but not /foo/bar.baz"""
@@ -117,3 +117,60 @@ async def test_role_auth():
     # Test for both member and chair, when we are both. should work.
     quart.session = {app.app_id: {"uts": time.time(), "foo": "bar", "isMember": True, "isChair": True}}
     await test_member_and_chair_auth()
+
+
+@pytest.mark.auth
+async def test_compiled_requirements():
+    """Compiled predicates report the same errors as evaluating every requirement"""
+    no_roles = asfquart.session.ClientSession({"uid": "foo"})
+    member = asfquart.session.ClientSession({"uid": "foo", "isMember": True})
+    assert asfquart.auth.compile_requirements() is None
+
+    predicate = asfquart.auth.compile_requirements(all_of=[R.member, R.chair])
+    assert predicate(no_roles) == f"{R.E_NOT_MEMBER}\n{R.E_NOT_CHAIR}"
+    assert predicate(member) == R.E_NOT_CHAIR
+
+    predicate = asfquart.auth.compile_requirements(all_of=R.committer, any_of=[R.chair, R.root])
+    assert predicate(no_roles) == f"{R.E_NOT_CHAIR}\n{R.E_NOT_ROOT}"
+    assert predicate(asfquart.session.ClientSession({"uid": "foo", "isRoot": True})) is None
+
+    with pytest.raises(TypeError):
+        asfquart.auth.compile_requirements(any_of=[print])
+
+
+@pytest.mark.auth
+async def test_project_auth():
+    """Project-scoped requirements"""
+
+    app = asfquart.construct("foobar", token_file=None)
+
+    @asfquart.auth.require(R.pmc_of("httpd"))
+    async def requires_httpd_pmc():
+        pass
+
+    @asfquart.auth.require(any_of={R.committer_of("tomcat"), R.pmc_of_any({"ant", "maven"})})
+    async def requires_tomcat_or_build_pmc():
+        pass
+
+    @asfquart.auth.require(all_of={R.member, R.committer_of_any(["httpd", "tomcat"])})
+    async def requires_member_committer():
+        pass
+
+    quart.session = {app.app_id: {"uts": time.time(), "uid": "foo", "pmcs": ["httpd"], "projects": ["httpd"]}}
+    await requires_httpd_pmc()
+    with pytest.raises(asfquart.auth.AuthenticationFailed, match="tomcat"):
+        await requires_tomcat_or_build_pmc()
+    with pytest.raises(asfquart.auth.AuthenticationFailed, match=_string_to_re(R.E_NOT_MEMBER)):
+        await requires_member_committer()
+
+    quart.session = {app.app_id: {"uts": time.time(), "uid": "foo", "pmcs": ["maven"], "isMember": True, "projects": ["tomcat"]}}
+    with pytest.raises(asfquart.auth.AuthenticationFailed, match=_string_to_re(R.E_NOT_PMC_OF % "httpd")):
+        await requires_httpd_pmc()
+    await requires_tomcat_or_build_pmc()
+    await requires_member_committer()
+
+    # A single project name must not be taken for a set of one-letter projects
+    with pytest.raises(TypeError):
+        R.pmc_of_any("httpd")
+    with pytest.raises(TypeError):
+        R.committer_of_any("httpd")
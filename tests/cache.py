@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Tests for cache.py"""
+
+import asyncio
+
+import pytest
+
+import asfquart.cache
+
+
+@pytest.mark.cache
+async def test_cache_lru_eviction():
+    cache = asfquart.cache.AsyncCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now the most recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 0, "evictions": 1, "expirations": 0}
+
+
+@pytest.mark.cache
+async def test_cache_expiry():
+    cache = asfquart.cache.AsyncCache(ttl=60)
+    cache.set("short", 1, ttl=0.001)
+    cache.set("forever", 2, ttl=None)
+    cache.set("default", 3)
+    cache.set("never", 4, ttl=0)
+    await asyncio.sleep(0.01)
+    assert cache.get("short") is None
+    assert cache.get("forever") == 2
+    assert cache.get("default") == 3
+    assert "never" not in cache
+    cache.set("short", 1, ttl=0.001)
+    await asyncio.sleep(0.01)
+    assert cache.purge() == 1
+    assert len(cache) == 2
+    assert cache.stats()["expirations"] == 2
+
+
+@pytest.mark.cache
+async def test_cache_single_flight():
+    cache = asfquart.cache.AsyncCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(*(cache.get_or_fetch("key", fetch) for _ in range(10)))
+    assert results == ["value"] * 10
+    assert len(calls) == 1, "Concurrent misses should share a single fetch"
+    assert await cache.get_or_fetch("key", fetch) == "value"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+    # Failures propagate to all waiters, and are not cached
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("nope")
+
+    results = await asyncio.gather(*(cache.get_or_fetch("bad", fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert "bad" not in cache
+
+
+@pytest.mark.cache
+async def test_cache_single_flight_owner_cancelled():
+    cache = asfquart.cache.AsyncCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    owner = asyncio.create_task(cache.get_or_fetch("key", fetch))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_fetch("key", fetch)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    owner.cancel()  # E.g. its client disconnected
+    # The other callers were not cancelled: one of them fetches again, for all of them.
+    assert await asyncio.gather(*waiters) == ["value"] * 3
+    assert owner.cancelled()
+    assert len(calls) == 2
+    assert cache.get("key") == "value"
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import asyncio
 import pathlib
 
 import pytest
@@ -22,3 +23,66 @@ async def test_config_static():
     # the decorator @asfquart.config.static wraps the function to an async method
     # suppress inspections as they fail to recognize that
     await config_callback(TEST_CONFIG_FILENAME)  # noqa
+
+
+@pytest.mark.config
+async def test_config_reload(tmp_path, monkeypatch):
+    """Tests in-place reloading of the app configuration, and the reloadable callbacks"""
+    import asfquart.auth  # Needed by construct(), which sets up login redirects
+
+    cfg_file = tmp_path / "config.yaml"
+    cfg_file.write_text("foo: bar\nMAX_SESSION_AGE: 3600\nHTTP_TIMEOUT: 0.05\n")
+    app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None)
+    other_app = asfquart.construct("other", app_dir=str(tmp_path), token_file=None)
+    old_cfg = app.cfg
+    app.cfg.set_by_app = 42
+    app.cfg.foo = "overridden"
+    seen = []
+
+    @asfquart.config.reloadable(app=app)
+    def sync_callback(yml: dict):
+        seen.append(("sync", yml["foo"]))
+
+    @asfquart.config.reloadable(app=app)
+    async def async_callback(yml: dict):
+        seen.append(("async", yml["foo"]))
+
+    @asfquart.config.reloadable  # Registers with the app constructed last
+    def other_callback(yml: dict):
+        seen.append(("other", yml["foo"]))
+
+    await sync_callback(cfg_file)
+    assert seen == [("sync", "bar")]
+
+    http_session = app.http.session
+    cfg_file.write_text("foo: baz\nMAX_SESSION_AGE: 60\nHTTP_TIMEOUT: 10\n")
+    assert await app.reload_config()
+    assert app.cfg is not old_cfg and app.cfg.foo == "baz" and old_cfg.foo == "overridden"
+    # Settings set by the app itself survive, unless the file has them
+    assert app.cfg.set_by_app == 42
+    assert app.http.cfg is app.cfg
+    assert app.session_policy.max_age == 60
+    # Callbacks only see reloads of the app they were registered with
+    assert seen[1:] == [("sync", "baz"), ("async", "baz")]
+    # The HTTP client picks up the new timeout with a new session. The old one is closed once requests
+    # in flight on it have timed out.
+    assert app.http.session is not http_session and app.http.session.timeout.total == 10
+    assert not http_session.closed
+    await asyncio.sleep(0.1)
+    assert http_session.closed
+    await app.http.close()
+
+    # A broken file, or one that does not hold settings, keeps the current configuration
+    for broken in ("foo: [unterminated\n", "- foo\n- bar\n", "just a string\n"):
+        cfg_file.write_text(broken)
+        assert not await app.reload_config()
+        assert app.cfg.foo == "baz" and len(seen) == 3
+
+    # Settings removed from the file are dropped
+    cfg_file.write_text("foo: qux\n")
+    assert await app.reload_config()
+    assert "MAX_SESSION_AGE" not in app.cfg and app.cfg.set_by_app == 42
+    assert seen[3:] == [("sync", "qux"), ("async", "qux")]
+
+    assert await other_app.reload_config()
+    assert seen[5:] == [("other", "qux")]
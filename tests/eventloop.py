@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Tests for event loop selection, see asfquart.eventloop"""
+
+import asyncio
+import contextlib
+import os
+import signal
+
+import hypercorn.utils
+import pytest
+
+import asfquart
+import asfquart.auth  # Needed by construct(), which sets up login redirects
+import asfquart.eventloop
+
+
+@pytest.mark.eventloop
+def test_resolve(monkeypatch):
+    assert asfquart.eventloop.resolve("asyncio") == "asyncio"
+    with pytest.raises(ValueError):
+        asfquart.eventloop.resolve("trio")
+
+    # Without uvloop, everything falls back to asyncio
+    monkeypatch.setattr(asfquart.eventloop, "UVLOOP_SUPPORTED", False)
+    assert asfquart.eventloop.resolve("auto") == "asyncio"
+    assert asfquart.eventloop.resolve("uvloop") == "asyncio"
+    loop = asfquart.eventloop.new_event_loop("uvloop")
+    assert type(loop) is type(asyncio.new_event_loop())  # pylint: disable=unidiomatic-typecheck
+    loop.close()
+
+    monkeypatch.setattr(asfquart.eventloop, "UVLOOP_SUPPORTED", True)
+    assert asfquart.eventloop.resolve("auto") == "uvloop"
+    assert asfquart.eventloop.resolve("asyncio") == "asyncio"
+
+
+@pytest.mark.eventloop
+def test_construct(tmp_path):
+    assert asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None).event_loop == "asyncio"
+    assert asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None, event_loop="auto").event_loop == "auto"
+    (tmp_path / "config.yaml").write_text("EVENT_LOOP: uvloop\n")
+    assert asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None).event_loop == "uvloop"
+
+
+@pytest.mark.eventloop
+@pytest.mark.parametrize("name", ["asyncio", "uvloop"])  # Not "event_loop", a pytest-asyncio fixture
+def test_signal_handling(tmp_path, name):
+    """The signal handlers of runx() work on every event loop"""
+    if name == "uvloop" and not asfquart.eventloop.UVLOOP_SUPPORTED:
+        pytest.skip("uvloop is not installed")
+    app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None)
+    loop = asfquart.eventloop.new_event_loop(name)
+    try:
+        trigger = app.factory_trigger(loop, watch="none")
+        loop.call_later(0.1, os.kill, os.getpid(), signal.SIGTERM)
+        # Hypercorn shuts down once the trigger returns, or raises ShutdownError.
+        with contextlib.suppress(hypercorn.utils.ShutdownError):
+            loop.run_until_complete(asyncio.wait_for(trigger(), 5))
+        assert app.drain_stats is not None
+    finally:
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR2):
+            loop.remove_signal_handler(signum)
+        loop.close()
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 """Tests for generics.py — redirect URI validation (CWE-601, CWE-79)"""
 
+import asyncio
 import itertools
+import time
+import urllib.parse
 
 import pytest
 
 import asfquart
+import asfquart.generics
 
 
 # Counter for unique app names to avoid duplicate route registration
@@ -156,3 +160,83 @@ async def test_no_session_returns_404():
         client = app.test_client()
         resp = await client.get("/auth")
         assert resp.status_code == 404
+
+
+@pytest.mark.generics
+async def test_pending_states_bounded():
+    """Abandoned logins must not grow the state store without bound."""
+    app = asfquart.construct(f"test_generics_{next(_counter)}", token_file=None, oauth=False)
+    asfquart.generics.setup_oauth(app, max_pending_states=3)
+    async with app.test_app():
+        client = app.test_client()
+        locations = []
+        for _ in range(5):
+            resp = await client.get("/auth?login")
+            locations.append(resp.headers["Location"])
+        assert len(app.oauth_states) == 3
+        assert app.oauth_states.stats()["evictions"] == 2
+        # The oldest login was evicted, and can no longer complete
+        state = urllib.parse.parse_qs(urllib.parse.urlsplit(locations[0]).query)["state"][0]
+        resp = await client.get(f"/auth?code=foo&state={state}")
+        assert resp.status_code == 403
+
+
+@pytest.mark.generics
+async def test_pending_states_expire():
+    app = asfquart.construct(f"test_generics_{next(_counter)}", token_file=None, oauth=False)
+    asfquart.generics.setup_oauth(app, workflow_timeout=0.01)
+    async with app.test_app():
+        client = app.test_client()
+        await client.get("/auth?login")
+        assert len(app.oauth_states) == 1
+        await asyncio.sleep(0.1)
+        assert len(app.oauth_states) == 0, "Expired states should be swept in the background"
+
+
+@pytest.mark.generics
+async def test_signed_states():
+    """Stateless states can be claimed by any worker sharing the secret, but only once."""
+    worker_a = asfquart.generics.SignedStates("sekrit", workflow_timeout=900)
+    worker_b = asfquart.generics.SignedStates("sekrit", workflow_timeout=900)
+    state = worker_a.issue("/dashboard")
+    assert len(worker_a) == 0, "Issuing a stateless state should not store anything"
+    assert worker_b.claim(state) == (True, "/dashboard")
+    assert worker_b.claim(state) == (False, None), "States must not be replayable"
+    # Tampered, or signed with another key
+    assert worker_a.claim(state[:-2] + "xx") == (False, None)
+    assert asfquart.generics.SignedStates("other", workflow_timeout=900).claim(worker_a.issue(None)) == (False, None)
+
+
+@pytest.mark.generics
+async def test_signed_states_replay_filter(monkeypatch):
+    """Claiming lots of states never makes unexpired ones replayable, and expired nonces are dropped."""
+    states = asfquart.generics.SignedStates("sekrit", workflow_timeout=900, max_pending_states=2)
+    state = states.issue("/dashboard")
+    assert states.claim(state) == (True, "/dashboard")
+    for _ in range(10):
+        assert states.claim(states.issue(None)) == (True, None)
+    states.purge()
+    assert states.claim(state) == (False, None), "States must not be replayable while valid"
+    assert len(states) == 11
+
+    # Once their states have expired, nonces are dropped.
+    now = time.time()
+    monkeypatch.setattr(asfquart.generics.time, "time", lambda: now + 1800)
+    states.purge()
+    assert len(states) == 0
+
+
+@pytest.mark.generics
+async def test_login_stateless():
+    app = asfquart.construct(f"test_generics_{next(_counter)}", token_file=None, oauth=False)
+    app.cfg.OAUTH_STATELESS = True
+    asfquart.generics.setup_oauth(app)
+    assert isinstance(app.oauth_states, asfquart.generics.SignedStates)
+    async with app.test_app():
+        client = app.test_client()
+        resp = await client.get("/auth?login=/dashboard")
+        assert resp.status_code == 302
+        state = urllib.parse.parse_qs(urllib.parse.urlsplit(resp.headers["Location"]).query)["state"][0]
+        assert app.oauth_states.claim(state) == (True, "/dashboard")
+        resp = await client.get(f"/auth?code=foo&state={state}")
+        assert resp.status_code == 403
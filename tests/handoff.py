@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Tests for graceful reloads, see asfquart.handoff"""
+
+import asyncio
+import os
+import socket
+import sys
+import time
+
+import hypercorn.config
+import pytest
+import quart
+
+import asfquart
+import asfquart.auth  # Needed by construct(), which sets up login redirects
+import asfquart.handoff
+
+
+@pytest.mark.handoff
+def test_inherit_sockets(monkeypatch):
+    monkeypatch.setenv(asfquart.handoff.LISTEN_FDS_ENV, "")  # Not inherited, and restored afterwards
+    config = hypercorn.config.Config()
+    config.bind = ["127.0.0.1:0"]
+
+    # The first process creates the listening socket, and leaves it for hypercorn to open.
+    fds = asfquart.handoff.inherit_sockets(config)
+    assert len(fds) == 1 and config.bind == [f"fd://{fds[0]}"]
+    assert os.environ[asfquart.handoff.LISTEN_FDS_ENV] == str(fds[0])
+    sock = socket.socket(fileno=fds[0])
+    try:
+        assert sock.getsockname()[0] == "127.0.0.1"
+        # Its successors use the same one.
+        config.bind = ["127.0.0.1:0"]
+        assert asfquart.handoff.inherit_sockets(config) == fds and config.bind == [f"fd://{fds[0]}"]
+    finally:
+        sock.close()
+
+
+@pytest.mark.handoff
+def test_notify_ready(monkeypatch):
+    ready_r, ready_w = os.pipe()
+    monkeypatch.setenv(asfquart.handoff.READY_FD_ENV, str(ready_w))
+    asfquart.handoff.notify_ready()
+    assert os.read(ready_r, 1) == b"1"
+    assert os.read(ready_r, 1) == b""  # Closed
+    assert asfquart.handoff.READY_FD_ENV not in os.environ
+    os.close(ready_r)
+    asfquart.handoff.notify_ready()  # No-op without a pipe
+
+
+@pytest.mark.handoff
+async def test_start_successor(monkeypatch):
+    def successor(code):
+        monkeypatch.setattr(asfquart.handoff, "command_line", lambda: [sys.executable, "-c", code])
+
+    successor("import os; os.write(int(os.environ['ASFQUART_READY_FD']), b'1')")
+    assert await asfquart.handoff.start_successor([])
+
+    # A successor failing to start is reported right away, a hanging one after the timeout.
+    successor("import sys; sys.exit(1)")
+    assert not await asfquart.handoff.start_successor([], timeout=10)
+    successor("import time; time.sleep(60)")
+    start = time.monotonic()
+    assert not await asfquart.handoff.start_successor([], timeout=0.5)
+    assert time.monotonic() - start < 5
+
+
+@pytest.mark.handoff
+async def test_drain_stats(monkeypatch, tmp_path):
+    app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None, oauth=False)
+    app.cfg.DRAIN_TIMEOUT = 0.1
+    started = asyncio.Event()
+
+    @app.route("/in_flight")
+    async def in_flight():
+        return str(app.requests_in_flight)
+
+    client = app.test_client()
+    assert await (await client.get("/in_flight")).get_data() == b"1"
+    assert app.requests_in_flight == 0
+
+    # Requests still running past the drain deadline are counted as dropped when cancelled.
+    async def handle_slowly(_self, _request):
+        started.set()
+        await asyncio.sleep(10)
+    monkeypatch.setattr(quart.Quart, "handle_request", handle_slowly)
+    request = asyncio.create_task(app.handle_request(None))
+    await started.wait()
+    app.start_draining()
+    assert app.drain_stats.in_flight == 1
+    await asyncio.sleep(0.2)
+    request.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await request
+    assert app.drain_stats.dropped == 1 and app.requests_in_flight == 0
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Tests for httpclient.py, against a local aiohttp server"""
+
+import aiohttp
+import aiohttp.web
+import pytest
+
+import asfquart
+import asfquart.httpclient
+
+
+@pytest.fixture
+async def server():
+    """Local HTTP server, failing the first request to /flaky with a 503."""
+    state = {"flaky": 0, "peers": set()}
+
+    async def ok(request):
+        state["peers"].add(request.transport.get_extra_info("peername"))
+        return aiohttp.web.json_response({"ok": True})
+
+    async def flaky(request):
+        state["flaky"] += 1
+        if state["flaky"] == 1:
+            return aiohttp.web.Response(status=503)
+        return aiohttp.web.json_response({"ok": True})
+
+    web_app = aiohttp.web.Application()
+    web_app.router.add_get("/ok", ok)
+    web_app.router.add_route("*", "/flaky", flaky)
+    runner = aiohttp.web.AppRunner(web_app)
+    await runner.setup()
+    site = aiohttp.web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+    yield f"http://127.0.0.1:{port}", state
+    await runner.cleanup()
+
+
+@pytest.mark.httpclient
+async def test_keepalive_and_retry(server):
+    base_url, state = server
+    client = asfquart.httpclient.HTTPClient({"HTTP_RETRY_BACKOFF": 0.01})
+    for _ in range(5):
+        rv = await client.get(f"{base_url}/ok")
+        assert await rv.json() == {"ok": True}
+    assert len(state["peers"]) == 1, "Requests should reuse a single pooled connection"
+
+    # Transient failures of idempotent requests are retried...
+    rv = await client.get(f"{base_url}/flaky")
+    assert rv.status == 200 and state["flaky"] == 2
+    rv.release()
+    # ...but other requests are not, unless asked to
+    state["flaky"] = 0
+    rv = await client.post(f"{base_url}/flaky")
+    assert rv.status == 503 and state["flaky"] == 1
+    rv.release()
+    await client.close()
+
+    # Connection errors give up after the configured retries
+    client = asfquart.httpclient.HTTPClient({"HTTP_RETRIES": 1, "HTTP_RETRY_BACKOFF": 0.01})
+    with pytest.raises(aiohttp.ClientConnectionError):
+        await client.get("http://127.0.0.1:1/")
+    await client.close()
+
+
+@pytest.mark.httpclient
+async def test_app_http_client_lifecycle(server):
+    base_url, _state = server
+    app = asfquart.construct("http_client_app", token_file=None, oauth=False)
+    async with app.test_app():
+        rv = await app.http.get(f"{base_url}/ok")
+        assert await rv.json() == {"ok": True}
+        session = app.http.session
+    assert session.closed, "The HTTP client should be closed when the app stops serving"
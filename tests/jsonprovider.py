@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Tests for jsonprovider.py"""
+
+import datetime
+import json
+import uuid
+
+import pytest
+
+import asfquart
+import asfquart.auth  # Needed by construct(), which sets up login redirects
+import asfquart.jsonprovider
+import asfquart.session
+
+PAYLOAD = {
+    "session": asfquart.session.ClientSession({"uid": "foo", "pmcs": ["tomcat", "httpd"], "projects": ["httpd"]}),
+    "tags": {"b", "a"},
+    "when": datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+    "day": datetime.date(2024, 1, 2),
+    "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "name": "Ørjan",
+}
+EXPECTED = {
+    "session": PAYLOAD["session"].as_dict(),
+    "tags": ["a", "b"],
+    "when": "2024-01-02T03:04:05+00:00",
+    "day": "2024-01-02",
+    "id": "12345678-1234-5678-1234-567812345678",
+    "name": "Ørjan",
+}
+
+
+@pytest.mark.jsonprovider
+@pytest.mark.parametrize("orjson", [True, False])
+async def test_json_provider(monkeypatch, orjson):
+    if orjson and not asfquart.jsonprovider.ORJSON_SUPPORTED:
+        pytest.skip("orjson is not installed")
+    monkeypatch.setattr(asfquart.jsonprovider, "ORJSON_SUPPORTED", orjson)
+    app = asfquart.construct("foobar", token_file=None)
+    provider = asfquart.jsonprovider.setup(app)
+
+    assert json.loads(provider.dumps(PAYLOAD)) == EXPECTED
+    assert provider.loads(provider.dumps(PAYLOAD)) == EXPECTED
+
+    @app.route("/")
+    async def endpoint():
+        return PAYLOAD
+
+    rv = await app.test_client().get("/")
+    assert rv.mimetype == "application/json"
+    assert await rv.get_json() == EXPECTED
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Tests for ldap.py, using a fake in place of a real LDAP server"""
+
+import asyncio
+
+import pytest
+
+import asfquart
+import asfquart.ldap
+
+SERVICE_DN = "cn=svc,ou=users,ou=services,dc=apache,dc=org"
+USERS = {
+    asfquart.ldap.DEFAULT_LDAP_BASE % "alice": "alicepw",
+    asfquart.ldap.DEFAULT_LDAP_BASE % "bob": "bobpw",
+    SERVICE_DN: "svcpw",
+}
+GROUPS = [
+    {
+        "dn": "cn=httpd,ou=project,ou=groups,dc=apache,dc=org",
+        "owner": [asfquart.ldap.DEFAULT_LDAP_BASE % "alice"],
+        "member": [asfquart.ldap.DEFAULT_LDAP_BASE % "alice", asfquart.ldap.DEFAULT_LDAP_BASE % "bob"],
+    },
+    {
+        "dn": "cn=tomcat,ou=project,ou=groups,dc=apache,dc=org",
+        "member": [asfquart.ldap.DEFAULT_LDAP_BASE % "bob"],
+    },
+]
+
+
+class FakeConnection:
+    def __init__(self, server, dn):
+        self.server = server
+        self.dn = dn
+        self.closed = False
+
+    async def search(self, base, attrs):
+        assert not self.closed
+        self.server.searches.append(self.dn)
+        return GROUPS
+
+    async def whoami(self):
+        if self.server.broken or self.closed:
+            raise ConnectionError("LDAP server went away")
+        return f"dn:{self.dn}"
+
+    def close(self):
+        self.closed = True
+
+
+class FakeServer:
+    """Stand-in for an LDAP server, usable as the CONNECT argument of LDAPPool."""
+
+    def __init__(self):
+        self.binds = []
+        self.searches = []
+        self.broken = False
+        self.connection_class = FakeConnection
+
+    def __call__(self, uri, dn, password, executor):
+        self.binds.append(dn)
+        if USERS.get(dn) != password:
+            raise asfquart.ldap.AuthenticationError("Invalid credentials")
+        return self.connection_class(self, dn)
+
+
+@pytest.fixture(autouse=True)
+def clear_ldap_cache():
+    asfquart.ldap.LDAP_CACHE.clear()
+
+
+@pytest.mark.ldap
+async def test_pool_user_bind():
+    server = FakeServer()
+    pool = asfquart.ldap.LDAPPool(max_size=2, connect=server)
+    affiliations = await asfquart.ldap.LDAPClient("alice", "alicepw", pool=pool).get_affiliations()
+    assert affiliations == {"member": ["httpd"], "owner": ["httpd"]}
+    # Without a service account, the search runs over the user's own bind
+    assert server.searches == [asfquart.ldap.DEFAULT_LDAP_BASE % "alice"]
+
+    with pytest.raises(asfquart.base.ASFQuartException) as e:
+        await asfquart.ldap.LDAPClient("bob", "wrong", pool=pool).get_affiliations()
+    assert e.value.errorcode == 403
+    pool.close()
+
+
+@pytest.mark.ldap
+async def test_pool_service_connection():
+    server = FakeServer()
+    pool = asfquart.ldap.LDAPPool(service_dn=SERVICE_DN, service_password="svcpw", connect=server)
+    assert await asfquart.ldap.LDAPClient("alice", "alicepw", pool=pool).get_affiliations()
+    assert (await asfquart.ldap.LDAPClient("bob", "bobpw", pool=pool).get_affiliations())["member"] == ["httpd", "tomcat"]
+    # One group scan over the persistent service connection serves both users, user binds only verify the password
+    assert server.searches == [SERVICE_DN]
+    assert server.binds.count(SERVICE_DN) == 1
+
+    # A failed health check replaces the service connection
+    assert await pool.check_health()
+    server.broken = True
+    assert not await pool.check_health()
+    server.broken = False
+    assert await pool.check_health()
+    assert server.binds.count(SERVICE_DN) == 2
+    pool.close()
+
+
+class SingleUseConnection(FakeConnection):
+    """Like asfpy connections, which run each operation on a private event loop: fails if used concurrently."""
+
+    def __init__(self, server, dn):
+        super().__init__(server, dn)
+        self.busy = False
+
+    async def _use(self, result):
+        if self.busy:
+            raise RuntimeError("This event loop is already running")
+        self.busy = True
+        try:
+            await asyncio.sleep(0.01)
+            return result
+        finally:
+            self.busy = False
+
+    async def search(self, base, attrs):
+        self.server.searches.append(self.dn)
+        return await self._use(GROUPS)
+
+    async def whoami(self):
+        return await self._use(f"dn:{self.dn}")
+
+
+@pytest.mark.ldap
+async def test_pool_service_connection_concurrency():
+    server = FakeServer()
+    server.connection_class = SingleUseConnection
+    pool = asfquart.ldap.LDAPPool(service_dn=SERVICE_DN, service_password="svcpw", connect=server)
+    # Searches and health checks overlapping on the service connection take turns, rather than failing
+    # and reconnecting.
+    results = await asyncio.gather(
+        *(pool.search(asfquart.ldap.DEFAULT_LDAP_GROUP_BASE, ["member"]) for _ in range(5)),
+        *(pool.check_health() for _ in range(5)),
+    )
+    assert results[:5] == [GROUPS] * 5
+    assert all(results[5:])
+    assert server.binds.count(SERVICE_DN) == 1
+    pool.close()
+
+
+@pytest.mark.ldap
+async def test_pool_lifecycle():
+    server = FakeServer()
+    app = asfquart.construct("ldap_pool_app", token_file=None, oauth=False)
+    pool = asfquart.ldap.setup_pool(app, connect=server)
+    assert app.ldap_pool is pool
+    async with app.test_app():
+        assert not pool.executor._shutdown  # pylint: disable=protected-access
+    assert pool.executor._shutdown, "Pool should be closed when the app stops serving"  # pylint: disable=protected-access
+
+
+@pytest.mark.ldap
+async def test_credential_cache():
+    server = FakeServer()
+    cache = asfquart.ldap.CredentialCache(ttl=60, max_entries=2, backoff=60)
+    pool = asfquart.ldap.LDAPPool(service_dn=SERVICE_DN, service_password="svcpw", connect=server, credentials=cache)
+
+    # Repeat requests skip the bind once the credentials have been verified
+    for _ in range(3):
+        await asfquart.ldap.LDAPClient("alice", "alicepw", pool=pool).get_affiliations()
+    assert server.binds.count(asfquart.ldap.DEFAULT_LDAP_BASE % "alice") == 1
+    # ...and the password is never part of the cache key
+    assert all("alicepw" not in repr(key) for key in cache._verified)  # pylint: disable=protected-access
+
+    # Failed binds are remembered, so retries do not reach LDAP while backing off
+    for _ in range(3):
+        with pytest.raises(asfquart.base.ASFQuartException) as e:
+            await asfquart.ldap.LDAPClient("bob", "wrong", pool=pool).get_affiliations()
+        assert e.value.errorcode == 403
+    assert server.binds.count(asfquart.ldap.DEFAULT_LDAP_BASE % "bob") == 1
+    # A bad password does not lock out the right one
+    assert await asfquart.ldap.LDAPClient("bob", "bobpw", pool=pool).get_affiliations()
+
+    # Least recently used entries are evicted beyond max_entries
+    assert cache.check("alice", "alicepw") is True
+    assert cache.check("bob", "bobpw") is True
+    cache.success("carol", "carolpw")
+    assert cache.check("alice", "alicepw") is None
+    pool.close()
+
+
+@pytest.mark.ldap
+async def test_credential_cache_disabled_by_default():
+    cache = asfquart.ldap.CredentialCache()
+    cache.success("alice", "alicepw")
+    assert cache.check("alice", "alicepw") is None
+
+
+@pytest.mark.ldap
+async def test_membership_index():
+    server = FakeServer()
+    pool = asfquart.ldap.LDAPPool(max_size=2, connect=server)
+    await asfquart.ldap.LDAPClient("alice", "alicepw", pool=pool).get_affiliations()
+    assert len(pool.index) == 2
+    # Cold users are served from the index built by the first scan
+    assert await asfquart.ldap.LDAPClient("bob", "bobpw", pool=pool).get_affiliations() == {
+        "member": ["httpd", "tomcat"],
+        "owner": [],
+    }
+    assert len(server.searches) == 1
+    assert pool.index.lookup("uid=nobody,ou=people,dc=apache,dc=org") == {"member": [], "owner": []}
+
+    # Once stale, the next lookup rescans
+    pool.index.updated = 0
+    asfquart.ldap.LDAP_CACHE.clear()
+    await asfquart.ldap.LDAPClient("bob", "bobpw", pool=pool).get_affiliations()
+    assert len(server.searches) == 2
+    pool.close()
+
+
+@pytest.mark.ldap
+async def test_membership_index_ttl():
+    # The index must not go stale between two background refreshes
+    for refresh, ttl in ((600, asfquart.ldap.DEFAULT_LDAP_CACHE_TTL), (7200, 14400)):
+        pool = asfquart.ldap.LDAPPool(index_refresh=refresh)
+        assert pool.index.ttl == ttl
+        pool.close()
+
+
+@pytest.mark.ldap
+async def test_membership_index_background_refresh():
+    server = FakeServer()
+    app = asfquart.construct("ldap_index_app", token_file=None, oauth=False)
+    app.cfg.LDAP_SERVICE_DN = SERVICE_DN
+    app.cfg.LDAP_SERVICE_PASSWORD = "svcpw"
+    pool = asfquart.ldap.setup_pool(app, connect=server)
+    async with app.test_app():
+        for _ in range(10):
+            if pool.index.fresh:
+                break
+            await asyncio.sleep(0.05)
+        assert pool.index.fresh, "Index should be built in the background at startup"
+        assert (await asfquart.ldap.LDAPClient("alice", "alicepw", pool=pool).get_affiliations())["owner"] == ["httpd"]
+    assert server.searches == [SERVICE_DN]
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Tests for serving an app with pre-forked workers, see asfquart.prefork"""
+
+import asyncio
+import os
+import pathlib
+import signal
+import socket
+import subprocess
+import sys
+
+import aiohttp
+import pytest
+
+import asfquart
+import asfquart.auth  # Needed by construct(), which sets up login redirects
+
+APP = """
+import os, sys
+import asfquart, asfquart.auth
+app = asfquart.construct("prefork_test", oauth=False, token_file=None)
+app.cfg.WATCH = "none"
+
+@app.route("/")
+async def index():
+    return f"{app.worker_id} {os.getpid()} {app.cfg.foo}"
+
+app.runx(host="127.0.0.1", port=int(sys.argv[1]), debug=False, workers=2)
+"""
+
+
+@pytest.mark.prefork
+async def test_singleton_runner(tmp_path):
+    started = []
+
+    async def runner(name):
+        started.append(name)
+        await asyncio.Event().wait()
+
+    for worker_id in (1, 0):
+        app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None, oauth=False)
+        app.add_runner(lambda: runner("everywhere"))
+        app.add_runner(lambda: runner("once"), singleton=True)
+        app.worker_id = worker_id
+        async with app.test_app():
+            await asyncio.sleep(0)
+    # Worker 1 only ran the per-worker runner, worker 0 ran both.
+    assert started == ["everywhere", "everywhere", "once"]
+
+
+@pytest.mark.prefork
+def test_shared_state(tmp_path):
+    # Pending OAuth logins are kept in memory by default, so the callback could not land on another worker.
+    app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None)
+    with pytest.raises(RuntimeError, match="OAUTH_STATELESS"):
+        app.runx(port=8080, workers=2)
+
+    (tmp_path / "config.yaml").write_text("OAUTH_STATELESS: true\nSESSION_STORE: memory\n")
+    app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None)
+    with pytest.raises(RuntimeError, match="SESSION_STORE"):
+        asfquart.prefork.check_shared_state(app)
+
+    # Stateless OAuth, and sessions in a store all workers share
+    (tmp_path / "config.yaml").write_text(f"OAUTH_STATELESS: true\nSESSION_STORE: sqlite:{tmp_path / 'sessions.db'}\n")
+    app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None)
+    asfquart.prefork.check_shared_state(app)
+
+    # No OAuth, and cookie sessions
+    (tmp_path / "config.yaml").write_text("")
+    app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None, oauth=False)
+    asfquart.prefork.check_shared_state(app)
+
+
+@pytest.mark.prefork
+async def test_workers(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    (tmp_path / "app.py").write_text(APP)
+    (tmp_path / "config.yaml").write_text("foo: one\n")
+    env = dict(os.environ, PYTHONPATH=str(pathlib.Path(asfquart.__file__).parent.parent))
+    proc = subprocess.Popen(
+        [sys.executable, "app.py", str(port)], cwd=tmp_path, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    async def responses(session, count=20):
+        async def get():
+            async with session.get(f"http://127.0.0.1:{port}/") as rv:
+                return await rv.text()
+        return set(await asyncio.gather(*(get() for _ in range(count))))
+
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(force_close=True)) as session:
+            for _ in range(100):  # Wait for the workers to start
+                try:
+                    await responses(session, 1)
+                    break
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.1)
+
+            # Both workers serve, from the same port
+            seen = set()
+            for _ in range(10):
+                seen |= await responses(session)
+                if len(seen) == 2:
+                    break
+            assert {line.split()[0] for line in seen} == {"0", "1"}
+            assert {line.split()[2] for line in seen} == {"one"}
+
+            # SIGHUP to the supervisor makes all workers reload the config
+            (tmp_path / "config.yaml").write_text("foo: two\n")
+            proc.send_signal(signal.SIGHUP)
+            await asyncio.sleep(0.5)
+            assert {line.split()[2] for line in await responses(session)} == {"two"}
+
+        # SIGTERM stops the supervisor and its workers
+        proc.send_signal(signal.SIGTERM)
+        assert await asyncio.to_thread(proc.wait, 20) == 0
+        for line in seen:
+            with pytest.raises(ProcessLookupError):
+                os.kill(int(line.split()[1]), 0)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import asyncio
+import threading
 import time
 
 import pytest
@@ -14,3 +16,173 @@ async def test_sessions():
     my_session = await asfquart.session.read()
     assert my_session, "Was expecting a session, but got nothing in return"
     assert my_session.uid == "bar", f"session value 'uid' should be 'bar', but was '{my_session.uid}'"
+
+
+@pytest.mark.session
+async def test_session_memoized_per_request():
+    app = asfquart.construct("foobar", token_file=None)
+    calls = []
+
+    def token_handler(token):
+        calls.append(token)
+        return {"uid": "role", "roleaccount": True} if token == "good" else None
+
+    app.token_handler = token_handler
+    quart.session = {}
+
+    async with app.test_request_context("/", headers={"Authorization": "Bearer good"}):
+        first = await asfquart.session.read()
+        second = await asfquart.session.read()
+        assert first is second, "Repeated reads within a request should return the memoized session"
+        assert calls == ["good"], "Token handler should only be consulted once per request"
+        # Writing or clearing the session must invalidate the memoized value
+        asfquart.session.clear()
+        await asfquart.session.read()
+        assert calls == ["good", "good"]
+
+    async with app.test_request_context("/", headers={"Authorization": "Bearer bad"}):
+        assert await asfquart.session.read() is None
+        assert await asfquart.session.read() is None
+        assert calls == ["good", "good", "bad"], "Failed lookups should be memoized as well"
+
+
+@pytest.mark.session
+async def test_token_cache():
+    app = asfquart.construct("foobar", token_file=None)
+    app.token_cache = asfquart.session.TokenCache(ttl=60, negative_ttl=60)
+    calls = []
+
+    async def token_handler(token):
+        calls.append(token)
+        await asyncio.sleep(0.01)
+        return {"uid": "role", "roleaccount": True} if token == "good" else None
+
+    app.token_handler = token_handler
+    quart.session = {}
+
+    async def read_with_token(token):
+        async with app.test_request_context("/", headers={"Authorization": f"Bearer {token}"}):
+            return await asfquart.session.read()
+
+    # Concurrent requests with the same token share one handler call
+    sessions = await asyncio.gather(*(read_with_token("good") for _ in range(5)))
+    assert all(s.uid == "role" for s in sessions)
+    assert calls == ["good"]
+    # Later requests are served from the cache, including for unknown tokens
+    assert (await read_with_token("good")).uid == "role"
+    assert await read_with_token("bad") is None
+    assert await read_with_token("bad") is None
+    assert calls == ["good", "bad"]
+    # Tokens are not kept in the clear
+    assert "good" not in app.token_cache.results._entries  # pylint: disable=protected-access
+    # Revoked tokens go back to the handler
+    app.token_cache.revoke("good")
+    await read_with_token("good")
+    assert calls == ["good", "bad", "good"]
+    # Reloading the app (as every worker does on SIGHUP) drops all cached results
+    await app.reload()
+    await read_with_token("good")
+    await read_with_token("bad")
+    assert calls == ["good", "bad", "good", "good", "bad"]
+
+
+@pytest.mark.session
+async def test_sync_token_handler_off_loop():
+    app = asfquart.construct("foobar", token_file=None)
+    threads = []
+
+    def token_handler(token):
+        threads.append(threading.get_ident())
+        assert quart.request.authorization.token == token, "Request context should be available to the handler"
+        return {"uid": "role", "roleaccount": True}
+
+    app.token_handler = token_handler
+    quart.session = {}
+
+    async with app.test_app():
+        async with app.test_request_context("/", headers={"Authorization": "Bearer sync"}):
+            assert (await asfquart.session.read()).uid == "role"
+        assert threads and threads[0] != threading.get_ident(), "Sync handlers should not run on the event loop"
+        executor = app.sync_executor
+        assert executor is not None
+    assert app.sync_executor is None and executor._shutdown, "Thread pool should be shut down with the app"  # pylint: disable=protected-access
+
+
+@pytest.mark.session
+async def test_client_session_compat():
+    app = asfquart.construct("foobar", token_file=None)
+    raw = {"uid": "bar", "pmcs": ["httpd", "tomcat"], "projects": ["httpd"], "isMember": True}
+    client_session = asfquart.session.ClientSession(raw)
+    # Attribute and key access
+    assert client_session.uid == client_session["uid"] == "bar"
+    assert client_session["isMember"] is True and client_session.get("isChair") is False
+    assert "httpd" in client_session.committees and "tomcat" not in client_session.projects
+    with pytest.raises(KeyError):
+        client_session["nope"]  # pylint: disable=pointless-statement
+    # Immutable
+    with pytest.raises(AttributeError):
+        client_session.isRoot = True
+    with pytest.raises(TypeError):
+        client_session["isRoot"] = True  # pylint: disable=unsupported-assignment-operation
+    # Mutable copies can be written back
+    session_copy = client_session.copy()
+    session_copy["foobar"] = 42
+    assert isinstance(session_copy, dict) and session_copy["committees"] == ["httpd", "tomcat"]
+
+    # Returned from an endpoint, it renders as JSON
+    @app.route("/session")
+    async def session_endpoint():
+        return client_session
+
+    @app.route("/session_tuple")
+    async def session_tuple_endpoint():
+        return client_session, 201
+
+    @app.route("/session_nested")
+    async def session_nested_endpoint():
+        return {"session": client_session}
+
+    @app.route("/session_jsonify")
+    async def session_jsonify_endpoint():
+        return quart.jsonify(client_session)
+
+    async with app.test_app():
+        client = app.test_client()
+        resp = await client.get("/session")
+        assert (await resp.get_json()) == client_session.as_dict()
+        resp = await client.get("/session_tuple")
+        assert resp.status_code == 201 and (await resp.get_json())["uid"] == "bar"
+        resp = await client.get("/session_nested")
+        assert (await resp.get_json()) == {"session": client_session.as_dict()}
+        resp = await client.get("/session_jsonify")
+        assert (await resp.get_json()) == client_session.as_dict()
+
+    # Fields stored as null are empty
+    assert asfquart.session.ClientSession({"uid": "bar", "pmcs": None, "projects": None}).committees == frozenset()
+
+
+@pytest.mark.session
+async def test_session_policy_throttles_touches():
+    app = asfquart.construct("foobar", token_file=None)
+    app.session_policy = asfquart.session.SessionPolicy(max_age=3600, touch_granularity=300)
+    now = time.time()
+
+    # A recently refreshed session is used as is, and not marked as modified (so no new cookie is sent)
+    quart.session = quart.sessions.SecureCookieSession({app.app_id: {"uid": "foo", "cts": now, "uts": now - 10}})
+    assert (await asfquart.session.read()).uid == "foo"
+    assert quart.session[app.app_id]["uts"] == now - 10
+    assert not quart.session.modified
+
+    # Once the last access timestamp is older than the granularity, it is refreshed
+    quart.session = quart.sessions.SecureCookieSession({app.app_id: {"uid": "foo", "cts": now, "uts": now - 600}})
+    assert (await asfquart.session.read()).uid == "foo"
+    assert quart.session[app.app_id]["uts"] >= now
+    assert quart.session.modified
+
+    # Idle timeout and max session age still apply
+    quart.session = {app.app_id: {"uid": "foo", "cts": now, "uts": now - 600}}
+    assert await asfquart.session.read(expiry_time=300) is None
+    assert app.app_id not in quart.session
+    quart.session = {app.app_id: {"uid": "foo", "cts": now - 7200, "uts": now}}
+    assert await asfquart.session.read() is None
+    quart.session = {}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Tests for sessioncookie.py"""
+
+import datetime
+import time
+
+import pytest
+import quart
+import quart.globals
+import quart.sessions
+
+import asfquart
+import asfquart.sessioncookie
+
+SESSION = {
+    "foobar": {
+        "uid": "foo",
+        "pmcs": ["httpd", "tomcat"],
+        "projects": ["httpd", "tomcat", "maven"],
+        "isMember": True,
+        "isRoot": False,
+        "mfa": None,
+        "cts": 1700000000.25,
+        "uts": 1700000100.5,
+        "metadata": {"count": -42, "big": 2**70, "name": "Zoë"},
+    },
+}
+
+
+@pytest.mark.sessioncookie
+def test_compact_roundtrip():
+    serializer = asfquart.sessioncookie.CompactSerializer()
+    data = serializer.dumps(SESSION)
+    assert data[0] == asfquart.sessioncookie.FORMAT_VERSION
+    assert data[1] & asfquart.sessioncookie.FLAG_COMPRESSED
+    assert serializer.loads(data) == SESSION
+    uncompressed = asfquart.sessioncookie.CompactSerializer(compress=False).dumps(SESSION)
+    assert uncompressed[1] == 0
+    assert serializer.loads(uncompressed) == SESSION
+    assert len(data) < len(uncompressed) < len(quart.sessions.session_json_serializer.dumps(SESSION))
+
+    # Existing JSON cookies are still understood
+    assert serializer.loads(quart.sessions.session_json_serializer.dumps(SESSION).encode("utf-8")) == SESSION
+
+    # Values plain JSON cannot hold exactly make for a tagged JSON cookie instead
+    for tagged in (
+        {"when": datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)},
+        {"raw": b"\x00\xff"},
+        {"pair": ("a", 1)},
+        {"nested": [{"pair": ("a", 1)}]},
+    ):
+        assert serializer.dumps(tagged).startswith(b"{")
+        assert serializer.loads(serializer.dumps(tagged)) == tagged
+
+
+@pytest.mark.sessioncookie
+async def test_compact_session_cookies(monkeypatch):
+    # Other tests replace quart.session with a plain dict; we need the real, request-bound one.
+    monkeypatch.setattr(quart, "session", quart.globals.session)
+    app = asfquart.construct("foobar", token_file=None)
+
+    @app.route("/whoami")
+    async def whoami():
+        client_session = await asfquart.session.read()
+        return client_session.uid if client_session else "nobody"
+
+    @app.route("/login")
+    async def login():
+        asfquart.session.write({"uid": "bar", "pmcs": ["httpd"], "projects": ["httpd"]})
+        return "ok"
+
+    # A cookie set by the default session interface...
+    json_cookie = quart.sessions.SecureCookieSessionInterface().get_signing_serializer(app).dumps(
+        {"foobar": {"uid": "foo", "cts": time.time(), "uts": time.time()}}
+    )
+    # ...remains valid once we switch to compact cookies, with or without compression
+    for compress in (True, False):
+        interface = asfquart.sessioncookie.setup(app, compress=compress)
+        client = app.test_client()
+        client.set_cookie("localhost", app.config["SESSION_COOKIE_NAME"], json_cookie)
+        rv = await client.get("/whoami", scheme="https")
+        assert await rv.get_data(as_text=True) == "foo"
+
+        # New sessions get a compact cookie, which is read back as usual
+        rv = await client.get("/login", scheme="https")
+        cookie = rv.headers["Set-Cookie"].split(";")[0].split("=", 1)[1]
+        assert interface.get_signing_serializer(app).loads(cookie)["foobar"]["uid"] == "bar"
+        rv = await client.get("/whoami", scheme="https")
+        assert await rv.get_data(as_text=True) == "bar"
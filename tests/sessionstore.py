@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Tests for sessionstore.py"""
+
+import time
+
+import pytest
+import quart
+import quart.globals
+
+import asfquart
+import asfquart.sessionstore
+
+
+def make_app(store):
+    app = asfquart.construct("foobar", token_file=None)
+    interface = asfquart.sessionstore.setup(app, store)
+
+    @app.route("/login")
+    async def login():
+        asfquart.session.write({"uid": "foo", "email": "foo@apache.org", "pmcs": ["bar"]})
+        return "ok"
+
+    @app.route("/whoami")
+    async def whoami():
+        client_session = await asfquart.session.read()
+        return client_session.uid if client_session else "nobody"
+
+    @app.route("/logout")
+    async def logout():
+        asfquart.session.clear()
+        return "bye"
+
+    return app, interface
+
+
+@pytest.mark.sessionstore
+async def test_server_side_sessions(monkeypatch):
+    # Other tests replace quart.session with a plain dict; we need the real, request-bound one.
+    monkeypatch.setattr(quart, "session", quart.globals.session)
+    store = asfquart.sessionstore.MemoryStore()
+    app, interface = make_app(store)
+    client = app.test_client()
+
+    rv = await client.get("/login", scheme="https")
+    cookie = rv.headers["Set-Cookie"]
+    sid = cookie.split(";")[0].split("=", 1)[1]
+    assert len(sid) < 64, "The cookie should only carry the session id"
+    assert store.sessions[sid][1][app.app_id]["uid"] == "foo"
+
+    # Reading a fresh session neither saves it nor resends the cookie.
+    saved = store.sessions[sid]
+    rv = await client.get("/whoami", scheme="https")
+    assert await rv.get_data(as_text=True) == "foo"
+    assert "Set-Cookie" not in rv.headers
+    assert store.sessions[sid] is saved
+    assert not interface.pending_touches
+
+    # A session due for a last-access update is not saved either: the new timestamp is queued up instead.
+    store.sessions[sid][1][app.app_id]["uts"] = time.time() - 3600
+    saved = store.sessions[sid]
+    rv = await client.get("/whoami", scheme="https")
+    assert await rv.get_data(as_text=True) == "foo"
+    assert store.sessions[sid] is saved
+    assert interface.pending_touches[sid][app.app_id] > time.time() - 60
+    await interface.flush()
+    assert (await store.load(sid))[app.app_id]["uts"] > time.time() - 60
+
+    # Logging in again (as any write() does) moves the session to a new id, dropping the old one, so that
+    # a session id planted by someone else is never logged in (session fixation).
+    old_sid = sid
+    interface.pending_touches[old_sid] = {app.app_id: time.time()}
+    rv = await client.get("/login", scheme="https")
+    sid = rv.headers["Set-Cookie"].split(";")[0].split("=", 1)[1]
+    assert sid != old_sid
+    assert old_sid not in store.sessions and old_sid not in interface.pending_touches
+    assert store.sessions[sid][1][app.app_id]["uid"] == "foo"
+    rv = await client.get("/whoami", scheme="https")
+    assert await rv.get_data(as_text=True) == "foo"
+
+    # A victim logging in with a session id planted in their browser does not log that session id in.
+    await store.save("planted", {"other_app": {"uid": "attacker"}}, time.time() + 60)
+    victim = app.test_client()
+    victim.set_cookie("localhost", app.config["SESSION_COOKIE_NAME"], "planted")
+    rv = await victim.get("/login", scheme="https")
+    assert "planted" not in rv.headers["Set-Cookie"]
+    assert "planted" not in store.sessions
+
+    # Clearing the last app session removes it from the store, and the cookie.
+    rv = await client.get("/logout", scheme="https")
+    assert sid not in store.sessions
+    assert sid not in interface.pending_touches
+    rv = await client.get("/whoami", scheme="https")
+    assert await rv.get_data(as_text=True) == "nobody"
+
+
+@pytest.mark.sessionstore
+async def test_touches_are_flushed():
+    store = asfquart.sessionstore.MemoryStore()
+    interface = asfquart.sessionstore.ServerSideSessionInterface(store, ttl=60)
+    await store.save("sid", {"app": {"uid": "foo", "uts": 100}}, time.time() + 60)
+    interface.pending_touches["sid"] = {"app": 200}
+    interface.pending_touches["gone"] = {"app": 200}  # Session removed in the meantime
+    await interface.flush()
+    assert not interface.pending_touches
+    assert (await store.load("sid"))["app"] == {"uid": "foo", "uts": 200}
+    assert await store.load("gone") is None
+
+    # An older timestamp never overwrites a newer one
+    await store.touch("sid", {"app": 150}, time.time() + 60)
+    assert (await store.load("sid"))["app"]["uts"] == 200
+
+
+@pytest.mark.sessionstore
+async def test_store_is_abstract():
+    class IncompleteStore(asfquart.sessionstore.SessionStore):
+        async def load(self, sid):
+            return None
+
+    with pytest.raises(TypeError):
+        IncompleteStore()  # pylint: disable=abstract-class-instantiated
+
+
+@pytest.mark.sessionstore
+async def test_sqlite_store(tmp_path):
+    store = asfquart.sessionstore.store_from_config(f"sqlite:{tmp_path / 'sessions.db'}")
+    assert isinstance(store, asfquart.sessionstore.SQLiteStore)
+    try:
+        await store.save("live", {"app": {"uid": "foo"}}, time.time() + 60)
+        await store.save("dead", {"app": {"uid": "bar"}}, time.time() - 1)
+        assert await store.load("live") == {"app": {"uid": "foo"}}
+        assert await store.load("dead") is None
+        await store.purge()
+        await store.delete("live")
+        assert await store.load("live") is None
+    finally:
+        await store.close()
+
+    with pytest.raises(ValueError):
+        asfquart.sessionstore.store_from_config("redis")
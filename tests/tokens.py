@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Tests for tokens.py"""
+
+import asyncio
+import os
+
+import pytest
+import quart
+
+import asfquart
+import asfquart.tokens
+
+ACCOUNTS = """
+testrole:
+  token: abcdefg1234567890
+  name: Test Role Account
+  scope:
+    - mailinglists
+otherrole:
+  token: hijklmn0987654321
+  email: other@example.org
+"""
+
+
+@pytest.mark.tokens
+async def test_registry_lookup(tmp_path):
+    path = tmp_path / "roleaccounts.yaml"
+    path.write_text(ACCOUNTS)
+    registry = asfquart.tokens.TokenRegistry(path)
+    assert len(registry) == 2
+    session = registry.lookup("abcdefg1234567890")
+    assert session == {
+        "uid": "testrole",
+        "email": "testrole@apache.org",
+        "fullname": "Test Role Account",
+        "roleaccount": True,
+        "metadata": {"scope": ["mailinglists"]},
+    }
+    assert registry.lookup("hijklmn0987654321")["email"] == "other@example.org"
+    assert registry.lookup("abcdefg") is None
+    # Sessions handed out are copies
+    session["metadata"]["scope"].append("everything")
+    assert registry.lookup("abcdefg1234567890")["metadata"]["scope"] == ["mailinglists"]
+
+    # Broken files keep the accounts we have
+    for broken in ("testrole: [", "- testrole\n- otherrole\n", "testrole: abcdefg1234567890\n"):
+        path.write_text(broken)
+        assert not registry.load()
+        assert len(registry) == 2
+    # ...and so does a missing one, eg. while it is being replaced
+    path.unlink()
+    assert not registry.load()
+    assert registry.lookup("abcdefg1234567890")["uid"] == "testrole"
+
+
+@pytest.mark.tokens
+async def test_registry_as_token_handler(tmp_path):
+    path = tmp_path / "roleaccounts.yaml"
+    path.write_text(ACCOUNTS)
+    app = asfquart.construct("tokens_app", token_file=None)
+    asfquart.tokens.TokenRegistry(path).install(app)
+    quart.session = {}
+    async with app.test_request_context("/", headers={"Authorization": "Bearer abcdefg1234567890"}):
+        client_session = await asfquart.session.read()
+        assert client_session.uid == "testrole" and client_session.isRole is True
+
+
+@pytest.mark.tokens
+async def test_registry_hot_reload(tmp_path):
+    path = tmp_path / "roleaccounts.yaml"
+    path.write_text(ACCOUNTS)
+    app = asfquart.construct("tokens_reload_app", token_file=None)
+    registry = asfquart.tokens.TokenRegistry(path)
+    registry.install(app)
+    app.cfg.WATCH_DEBOUNCE = 50
+    # The file is watched by the app's watcher, even when nothing else is (in production).
+    paths, _watch_filter = app.watch_targets("none")
+    assert paths == {str(tmp_path)}
+    watcher = asyncio.create_task(app.watch(scope="none"))
+    try:
+        await asyncio.sleep(0.5)  # Let the watcher start
+        # Replace the file atomically, as a deployment tool would
+        tmp_file = tmp_path / "roleaccounts.yaml.new"
+        tmp_file.write_text("newrole:\n  token: newtoken\n")
+        os.replace(tmp_file, path)
+        for _ in range(50):
+            if registry.lookup("newtoken"):
+                break
+            await asyncio.sleep(0.1)
+        assert registry.lookup("newtoken")["uid"] == "newrole"
+        assert registry.lookup("abcdefg1234567890") is None
+        assert not watcher.done(), "Data file changes are applied without a restart"
+    finally:
+        watcher.cancel()
+
+    # Reloading the app (eg. on SIGHUP) reloads the file too
+    path.write_text(ACCOUNTS)
+    await app.reload()
+    assert registry.lookup("abcdefg1234567890")["uid"] == "testrole"
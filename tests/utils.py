@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Tests for utils.py"""
+
+import io
+
+import pytest
+import quart
+import quart.datastructures
+import quart.testing.app
+
+import asfquart
+import asfquart.auth  # Needed by construct(), which sets up login redirects
+import asfquart.utils
+
+
+def make_app():
+    app = asfquart.construct("foobar", token_file=None)
+    app.config["MAX_CONTENT_LENGTH"] = 1024
+    app.config["FORM_SPOOL_SIZE"] = 16
+
+    @app.route("/form", methods=["GET", "POST", "PUT"])
+    async def form():
+        data = await asfquart.utils.formdata(files=True)
+        if isinstance(data, quart.Response):
+            return data
+        return {key: value.read().decode() if hasattr(value, "read") else value for key, value in data.items()}
+
+    return app
+
+
+@pytest.mark.utils
+async def test_formdata():
+    client = make_app().test_client()
+
+    rv = await client.post("/form?foo=bar", form={"baz": "qux"})
+    assert await rv.get_json() == {"foo": "bar", "baz": "qux"}
+
+    rv = await client.put("/form", json={"baz": "qux"})
+    assert await rv.get_json() == {"baz": "qux"}
+
+    upload = quart.datastructures.FileStorage(stream=io.BytesIO(b"x" * 100), filename="foo.txt")
+    rv = await client.post("/form", files={"upload": upload})
+    assert await rv.get_json() == {"upload": "x" * 100}
+
+    rv = await client.put("/form", data="{not json", headers={"Content-Type": "application/json"})
+    assert rv.status_code == 400
+
+
+@pytest.mark.utils
+async def test_formdata_keeps_request_data():
+    app = make_app()
+
+    @app.route("/both", methods=["POST", "PUT"])
+    async def both():
+        data = await asfquart.utils.formdata(files=True)
+        # The body has been read, but Quart still has the data it contained
+        files = await quart.request.files
+        return {
+            "formdata": sorted(data),
+            "form": (await quart.request.form).to_dict(),
+            "files": {key: value.read().decode() for key, value in files.items()},
+            "json": await quart.request.get_json(),
+        }
+
+    client = app.test_client()
+    upload = quart.datastructures.FileStorage(stream=io.BytesIO(b"x" * 100), filename="foo.txt")
+    rv = await client.post("/both", form={"baz": "qux"}, files={"upload": upload})
+    assert await rv.get_json() == {"formdata": ["baz", "upload"], "form": {"baz": "qux"}, "files": {"upload": "x" * 100}, "json": None}
+    rv = await client.put("/both", json={"baz": "qux"})
+    assert await rv.get_json() == {"formdata": ["baz"], "form": {}, "files": {}, "json": {"baz": "qux"}}
+
+
+@pytest.mark.utils
+async def test_formdata_size_limits():
+    app = make_app()
+    client = app.test_client()
+
+    # Declared too large: rejected without reading the body
+    rv = await client.post("/form", form={"baz": "x" * 2048})
+    assert rv.status_code == 413
+    rv = await client.put("/form", json={"baz": "x" * 2048})
+    assert rv.status_code == 413
+
+    # Chunked (no Content-Length): rejected once too much has been read
+    for content_type in ("application/x-www-form-urlencoded", "application/json"):
+        async with client.request("/form", method="POST", headers={"Content-Type": content_type}) as connection:
+            await connection.send(b"baz=" + b"x" * 600)
+            await connection.send(b"x" * 600)
+            await connection.send_complete()
+            await connection.receive()
+        assert connection.status_code == 413
+
+
+@pytest.mark.utils
+async def test_expects():
+    app = make_app()
+
+    @app.route("/search", methods=["GET", "POST"])
+    @asfquart.utils.expects({"query": str, "page": (int, 1), "exact": (bool, False), "projects": (list[str], [])})
+    async def search(query, page, exact, projects):
+        return {"query": query, "page": page, "exact": exact, "projects": projects}
+
+    client = app.test_client()
+    rv = await client.get("/search?query=foo&projects=httpd&projects=tomcat")
+    assert await rv.get_json() == {"query": "foo", "page": 1, "exact": False, "projects": ["httpd", "tomcat"]}
+
+    rv = await client.post("/search?page=3", form={"query": "foo", "exact": "yes"})
+    assert await rv.get_json() == {"query": "foo", "page": 3, "exact": True, "projects": []}
+
+    rv = await client.post("/search", json={"query": "foo", "page": 2, "exact": True, "projects": ["maven"]})
+    assert await rv.get_json() == {"query": "foo", "page": 2, "exact": True, "projects": ["maven"]}
+
+    # All problems are reported at once
+    rv = await client.post("/search", json={"page": 2.5, "exact": "maybe", "projects": "maven"})
+    assert rv.status_code == 400
+    assert (await rv.get_data(as_text=True)).splitlines() == [
+        "Missing required field 'query'",
+        "Invalid value for field 'page', expected int",
+        "Invalid value for field 'exact', expected bool",
+        "Invalid value for field 'projects', expected list",
+    ]
+    rv = await client.post("/search", json=["foo"])
+    assert rv.status_code == 400
+    rv = await client.post("/search", form={"query": "x" * 2048})
+    assert rv.status_code == 413
+
+    with pytest.raises(TypeError):
+        asfquart.utils.compile_schema({"query": "not a type"})
+
+    # URL parameters clashing with schema fields are reported as such
+    @asfquart.utils.expects({"project": str})
+    async def project_page(project):
+        return project
+
+    async with app.test_request_context("/project/httpd?project=tomcat"):
+        with pytest.raises(TypeError, match="URL parameter\\(s\\) project of endpoint .*project_page clash"):
+            await project_page(project="httpd")
+
+    # ... and routes declared that way keep the app from starting
+    asfquart.utils.check_expects(app)
+    app.route("/project/<project>")(project_page)
+    with pytest.raises(TypeError, match="URL parameter\\(s\\) project of route /project/<project> \\(project_page\\) clash"):
+        asfquart.utils.check_expects(app)
+    with pytest.raises(quart.testing.app.LifespanError, match="clash"):
+        async with app.test_app():
+            pass
+    with pytest.raises(TypeError, match="clash"):
+        app.runx(port=8080)
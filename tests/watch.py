@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Tests for the file watcher of QuartApp"""
+
+import asyncio
+
+import pytest
+import quart.utils
+import watchfiles
+
+import asfquart
+import asfquart.auth  # Needed by construct(), which sets up login redirects
+
+
+@pytest.mark.watch
+async def test_watch_targets(tmp_path):
+    app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None)
+    added = watchfiles.Change.added
+
+    paths, watch_filter = app.watch_targets("app")
+    assert paths == {str(tmp_path)}
+    assert watch_filter(added, str(tmp_path / "main.py"))
+    assert watch_filter(added, str(tmp_path / "pages" / "index.py"))
+    assert not watch_filter(added, str(tmp_path / "__pycache__" / "main.cpython-311.pyc"))
+    assert not watch_filter(added, str(tmp_path / ".venv" / "lib" / "foo.py"))
+    assert not watch_filter(added, str(tmp_path / "README.md"))
+    assert not watch_filter(added, "/usr/lib/python3/os.py")
+
+    extra = tmp_path.parent / "shared.yaml"
+    paths, watch_filter = app.watch_targets(["*.py", "templates/*.ezt"], extra_files={str(extra)})
+    assert paths == {str(tmp_path), str(extra)}
+    assert watch_filter(added, str(tmp_path / "templates" / "index.ezt"))
+    assert watch_filter(added, str(extra))
+    assert not watch_filter(added, str(tmp_path / "static" / "index.ezt"))
+
+    # Only directories holding files in scope are watched, not the whole tree
+    for subdir, filename in (("pages", "index.py"), ("data", "dump.json"), ("node_modules/foo", "setup.py")):
+        (tmp_path / subdir).mkdir(parents=True)
+        (tmp_path / subdir / filename).write_text("")
+    paths, watch_filter = app.watch_targets("app")
+    assert paths == {str(tmp_path), str(tmp_path / "pages")}
+
+    paths, watch_filter = app.watch_targets("modules")
+    assert asfquart.base.__file__ in paths and watch_filter is None
+
+    # Data files are watched through their directory, in every scope
+    data_dir = tmp_path.parent / "secrets"
+    app.watch_file(data_dir / "roleaccounts.yaml", lambda: None)
+    for scope in ("app", "modules", "none"):
+        paths, watch_filter = app.watch_targets(scope)
+        assert str(data_dir) in paths
+        assert watch_filter(added, str(data_dir / "roleaccounts.yaml"))
+        assert not watch_filter(added, str(data_dir / "other.yaml"))
+
+
+@pytest.mark.watch
+async def test_watch_reloads_on_changes(tmp_path):
+    app = asfquart.construct("foobar", app_dir=str(tmp_path), token_file=None)
+    app.cfg.WATCH_DEBOUNCE = 50
+
+    watcher = asyncio.create_task(app.watch())
+    await asyncio.sleep(0.5)  # Let the watcher start
+    (tmp_path / "notes.txt").write_text("not watched")
+    await asyncio.sleep(0.5)
+    assert not watcher.done()
+    (tmp_path / "main.py").write_text("# watched")
+    with pytest.raises(quart.utils.MustReloadError):
+        await asyncio.wait_for(watcher, timeout=5)
+
+    # A change to the config file is applied without a restart
+    (tmp_path / "config.yaml").write_text("foo: bar\n")
+    app.cfg.WATCH_DEBOUNCE = 50
+    watcher = asyncio.create_task(app.watch())
+    await asyncio.sleep(0.5)
+    (tmp_path / "config.yaml").write_text("foo: baz\nWATCH_DEBOUNCE: 50\n")
+    for _ in range(50):
+        await asyncio.sleep(0.1)
+        if app.cfg.get("foo") == "baz":
+            break
+    assert app.cfg.foo == "baz"
+    assert not watcher.done()
+    watcher.cancel()
+
+    # In production, nothing is watched
+    watcher = asyncio.create_task(app.watch(scope="none"))
+    await asyncio.sleep(0.1)
+    assert not watcher.done()
+    watcher.cancel()